@@ -2,20 +2,38 @@
 Chat API endpoints for AI assistant interaction.
 """
 from fastapi import APIRouter, HTTPException, Depends
-from redis import Redis
+from fastapi.responses import StreamingResponse
+from redis.asyncio import Redis
 from app.models.request_models import (
     ChatRequest, ChatResponse,
+    BatchChatItem, BatchChatRequest,
     ResetRequest, ResetResponse,
     SessionHistoryResponse
 )
+from app.services.admission_service import (
+    AdmissionRejected, PRIORITY_BACKGROUND, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE
+)
+from app.services.chat_pipeline import ChatPipeline, StageTimeout
+from app.services.knowledge_service import KnowledgeBase
 from app.services.memory_service import MemoryService
-from app.services.ollama_service import OllamaService
+from app.services.ollama_service import GenerationResult, OllamaService
+from app.services.response_cache_service import ResponseCache
+from app.services.semantic_cache_service import SemanticCache
 from app.services.scrape_service import ScrapeService
 from app.services.search_service import SearchService
-from app.utils.prompt_builder import build_prompt
+from app.services.summary_service import SummaryService
+from app.services.write_behind_service import WriteBehindQueue
+from app.core import metrics
+from app.core.config import settings
 from app.core.redis_client import get_redis
 from app.utils.logger import logger
+from typing import AsyncIterator, Optional
+import asyncio
+import contextlib
+import json
 import re
+import time
+import uuid
 
 router = APIRouter(prefix="/api/llm", tags=["Chat"])
 
@@ -23,6 +41,54 @@ router = APIRouter(prefix="/api/llm", tags=["Chat"])
 ollama_service = OllamaService()
 scrape_service = ScrapeService()
 search_service = SearchService()
+write_behind = WriteBehindQueue(
+    enabled=settings.MEMORY_WRITE_BEHIND,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    retries=settings.WRITE_BEHIND_RETRIES
+)
+knowledge_base = KnowledgeBase()
+chat_pipeline = ChatPipeline(search_service, scrape_service, write_behind, knowledge_base)
+response_cache = ResponseCache(ollama_service)
+semantic_cache = SemanticCache(ollama_service)
+summary_service = SummaryService(ollama_service)
+
+
+def _context_to_store(context: Optional[list[int]]) -> Optional[list[int]]:
+    """Context tokens to persist with the turn, if reuse is enabled."""
+    return context if settings.OLLAMA_CONTEXT_REUSE else None
+
+
+async def _store_turn(
+    memory: MemoryService,
+    session_id: str,
+    user_message: str,
+    assistant_reply: str,
+    context: Optional[list[int]]
+) -> None:
+    """Save a finished turn and summarize the session if it has grown long."""
+    stored = await memory.append_turn(session_id, user_message, assistant_reply, context=_context_to_store(context))
+    summary_service.schedule(memory, session_id, stored)
+
+
+def _too_busy(e: AdmissionRejected) -> HTTPException:
+    """429 telling the client when to retry."""
+    return HTTPException(
+        status_code=429,
+        detail=f"AI service busy: {str(e)}",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def _replay(result: GenerationResult) -> AsyncIterator[dict]:
+    """A cached reply in the shape of an Ollama stream: one token chunk, then the final chunk."""
+    yield {"response": result.text, "done": False}
+    yield {"response": "", "done": True, "context": result.context}
+
+
+def _sse_event(data: dict, event: str | None = None) -> str:
+    """Format a Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -41,49 +107,30 @@ async def chat(request: ChatRequest, redis_client: Redis = Depends(get_redis)):
         # Initialize memory service
         memory = MemoryService(redis_client)
         
-        # Check if session existed before
-        session_existed = memory.session_exists(request.session_id)
+        turn = await chat_pipeline.prepare(request, memory)
         
-        # Get conversation history
-        history = memory.get_history(request.session_id)
+        # Answer a paraphrase of an earlier first-turn question from the semantic cache
+        semantic = await semantic_cache.lookup(request.message) if turn.standalone else None
         
-        # Auto-detect if web search is needed
-        search_keywords = [
-            'search', 'find', 'look up', 'lookup', 'google',
-            'what is', 'who is', 'where is', 'when is', 'how is',
-            'current', 'latest', 'recent', 'news', 'today', 'now',
-            'price', 'weather', 'stock', 'trending', 'happening'
-        ]
-        needs_search = any(keyword in request.message.lower() for keyword in search_keywords)
-        
-        # Optional web search
-        search_results = None
-        if needs_search and not request.use_scrape:
-            logger.info(f"🌐 Auto web search triggered for: {request.message}")
-            results = search_service.search(request.message, num_results=5)
-            if results:
-                search_results = search_service.format_results_for_prompt(results)
-                logger.info(f"📊 Formatted search results for AI context")
-            else:
-                logger.warning(f"⚠️ No search results found for: {request.message}")
-        
-        # Optional web scraping
-        scraped_text = None
-        if request.use_scrape and request.scrape_url:
-            logger.info(f"Scraping requested for URL: {request.scrape_url}")
-            scraped_text = scrape_service.scrape_website(request.scrape_url)
-        
-        # Build prompt with search results or scraped content
-        additional_context = search_results or scraped_text
-        prompt = build_prompt(
-            history=history,
-            user_message=request.message,
-            scraped_text=additional_context
-        )
-        
-        # Call Ollama
+        # Call Ollama, or answer from the response cache when the prompt allows it
         try:
-            assistant_reply = ollama_service.call_ollama(prompt)
+            if semantic and semantic.answer:
+                result = GenerationResult(text=semantic.answer)
+            elif turn.cacheable:
+                result = await response_cache.generate(
+                    turn.prompt,
+                    priority=PRIORITY_DEFAULT,
+                    session_id=request.session_id
+                )
+            else:
+                result = await ollama_service.generate(
+                    turn.prompt,
+                    context=turn.context,
+                    priority=PRIORITY_DEFAULT,
+                    session_id=request.session_id
+                )
+        except AdmissionRejected as e:
+            raise _too_busy(e)
         except Exception as e:
             logger.error(f"Ollama service error: {e}")
             raise HTTPException(
@@ -91,20 +138,29 @@ async def chat(request: ChatRequest, redis_client: Redis = Depends(get_redis)):
                 detail=f"AI service unavailable: {str(e)}"
             )
         
-        # Store messages in memory
-        memory.append_message(request.session_id, "user", request.message)
-        memory.append_message(request.session_id, "assistant", assistant_reply)
+        # Remember a generated answer so paraphrases of the question can reuse it
+        if semantic and not semantic.answer and result.eval_count:
+            await semantic_cache.add(semantic, request.message, result.text)
         
-        # Determine if session expired
-        session_expired = not session_existed and len(history) == 0
+        # Store messages in memory, in the background when write-behind is enabled
+        await write_behind.persist(
+            request.session_id,
+            lambda: _store_turn(memory, request.session_id, request.message, result.text, result.context)
+        )
         
         return ChatResponse(
-            reply=assistant_reply,
-            session_expired=session_expired
+            reply=result.text,
+            session_expired=turn.session_expired
         )
-        
+    
     except HTTPException:
         raise
+    except StageTimeout as e:
+        logger.error(f"Chat pipeline stage timed out: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Session store unavailable"
+        )
     except Exception as e:
         logger.error(f"Unexpected error in chat endpoint: {e}")
         raise HTTPException(
@@ -113,6 +169,295 @@ async def chat(request: ChatRequest, redis_client: Redis = Depends(get_redis)):
         )
 
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, redis_client: Redis = Depends(get_redis)):
+    """
+    Streaming chat endpoint that relays model tokens as Server-Sent Events.
+    
+    Emits one `data: {"token": ...}` frame per generated chunk, then a final
+    `event: done` frame carrying `reply` and `session_expired`, or an
+    `event: error` frame if generation fails mid-stream. The turn is saved
+    to session memory only after the stream completes.
+    
+    Args:
+        request: Chat request containing session_id, message, and optional scraping parameters
+        redis_client: Redis client dependency
+    
+    Returns:
+        text/event-stream response
+    """
+    try:
+        memory = MemoryService(redis_client)
+        turn = await chat_pipeline.prepare(request, memory)
+    except StageTimeout as e:
+        logger.error(f"Chat pipeline stage timed out: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Session store unavailable"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error in chat stream endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error occurred"
+        )
+    
+    semantic = await semantic_cache.lookup(request.message) if turn.standalone else None
+    if semantic and semantic.answer:
+        stream = _replay(GenerationResult(text=semantic.answer))
+    elif turn.cacheable:
+        # Answers from the cache, or shares one generation among identical prompts
+        stream = response_cache.stream(
+            turn.prompt,
+            priority=PRIORITY_INTERACTIVE,
+            session_id=request.session_id
+        )
+    else:
+        stream = ollama_service.stream_ollama(
+            turn.prompt,
+            context=turn.context,
+            priority=PRIORITY_INTERACTIVE,
+            session_id=request.session_id
+        )
+    # Wait for the first chunk so admission and connection failures still surface as 429/503
+    try:
+        first_chunk = await anext(stream)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+    except Exception as e:
+        logger.error(f"Ollama service error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"AI service unavailable: {str(e)}"
+        )
+    
+    async def event_source():
+        parts = []
+        new_context = None
+        chunk = first_chunk
+        try:
+            while True:
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    yield _sse_event({"token": token})
+                if chunk.get("done"):
+                    new_context = chunk.get("context")
+                    break
+                chunk = await anext(stream)
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            logger.error(f"Ollama stream failed: {e}")
+            yield _sse_event({"detail": f"AI service unavailable: {str(e)}"}, event="error")
+            return
+        finally:
+            await stream.aclose()
+        
+        assistant_reply = "".join(parts).strip()
+        if not assistant_reply:
+            logger.warning("Ollama returned empty response")
+            assistant_reply = "I apologize, but I couldn't generate a response. Please try again."
+            new_context = None
+        
+        # Store messages in memory once the full reply is known
+        try:
+            await write_behind.persist(
+                request.session_id,
+                lambda: _store_turn(memory, request.session_id, request.message, assistant_reply, new_context)
+            )
+        except Exception as e:
+            logger.error(f"Failed to store streamed turn for session {request.session_id}: {e}")
+        
+        yield _sse_event(
+            {"reply": assistant_reply, "session_expired": turn.session_expired},
+            event="done"
+        )
+        
+        # Only a reply generated for this request carries an eval count; cache hits and shared replies don't
+        if semantic and parts and chunk.get("done") and chunk.get("eval_count"):
+            await semantic_cache.add(semantic, request.message, assistant_reply)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _answer_batch_item(
+    item: BatchChatItem,
+    index: int,
+    batch_id: str,
+    memory: MemoryService,
+    session_locks: dict[str, asyncio.Lock]
+) -> dict:
+    """
+    Answer one batch item at background priority and describe the outcome.
+    
+    Stateless items (no session_id) skip Redis entirely. Items sharing a
+    session are answered one at a time, in submission order.
+    """
+    started = time.perf_counter()
+    result_line = {"index": index, "id": item.id}
+    request = ChatRequest(
+        session_id=item.session_id or f"batch:{batch_id}:{index}",
+        message=item.message,
+        use_scrape=item.use_scrape,
+        scrape_url=item.scrape_url,
+        deep_search=item.deep_search
+    )
+    stateful = item.session_id is not None
+    try:
+        async with session_locks[item.session_id] if stateful else contextlib.nullcontext():
+            turn = await chat_pipeline.prepare(request, memory if stateful else None)
+            for attempt in range(settings.BATCH_ADMISSION_RETRIES + 1):
+                try:
+                    if turn.cacheable:
+                        result = await response_cache.generate(
+                            turn.prompt,
+                            priority=PRIORITY_BACKGROUND,
+                            session_id=item.session_id
+                        )
+                    else:
+                        result = await ollama_service.generate(
+                            turn.prompt,
+                            context=turn.context,
+                            priority=PRIORITY_BACKGROUND,
+                            session_id=item.session_id
+                        )
+                    break
+                except AdmissionRejected as e:
+                    if attempt == settings.BATCH_ADMISSION_RETRIES:
+                        raise
+                    await asyncio.sleep(e.retry_after)
+            
+            if stateful:
+                await write_behind.persist(
+                    item.session_id,
+                    lambda: _store_turn(memory, item.session_id, item.message, result.text, result.context)
+                )
+                result_line["session_expired"] = turn.session_expired
+        result_line["reply"] = result.text
+        outcome = "ok"
+    except AdmissionRejected as e:
+        result_line["error"] = f"AI service busy: {str(e)}"
+        outcome = "rejected"
+    except StageTimeout:
+        result_line["error"] = "Session store unavailable"
+        outcome = "error"
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise
+        # Cancelled from below, e.g. a shared generation this item joined
+        logger.error(f"Batch {batch_id} item {index} was cancelled")
+        result_line["error"] = "AI service unavailable: generation was cancelled"
+        outcome = "error"
+    except Exception as e:
+        logger.error(f"Batch {batch_id} item {index} failed: {e}")
+        result_line["error"] = f"AI service unavailable: {str(e)}"
+        outcome = "error"
+    
+    seconds = time.perf_counter() - started
+    result_line["seconds"] = round(seconds, 3)
+    metrics.BATCH_ITEMS.labels(result=outcome).inc()
+    metrics.BATCH_ITEM_SECONDS.observe(seconds)
+    return result_line
+
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, redis_client: Redis = Depends(get_redis)):
+    """
+    Answer many independent prompts, streaming results as NDJSON as they complete.
+    
+    Items run `concurrency` at a time (at most BATCH_MAX_CONCURRENCY) at
+    background priority, so interactive chats are admitted first. Each
+    result line carries the item's `index` and `id` plus either `reply` or
+    `error`; a final `{"done": true, ...}` line summarizes the batch.
+    Results arrive in completion order, not submission order.
+    
+    Args:
+        request: Items to answer and the requested concurrency
+        redis_client: Redis client dependency
+    
+    Returns:
+        Streaming NDJSON response
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.BATCH_MAX_ITEMS} items"
+        )
+    concurrency = min(request.concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    batch_id = uuid.uuid4().hex[:12]
+    memory = MemoryService(redis_client)
+    session_locks: dict[str, asyncio.Lock] = {}
+    for item in request.items:
+        if item.session_id is not None:
+            session_locks.setdefault(item.session_id, asyncio.Lock())
+    logger.info(f"Batch {batch_id}: {len(request.items)} items, concurrency {concurrency}")
+    
+    async def results():
+        pending = iter(enumerate(request.items))
+        finished: asyncio.Queue = asyncio.Queue()
+        # Item each worker is answering, so a worker that dies can still report it
+        running: dict[asyncio.Task, tuple[int, BatchChatItem, float]] = {}
+        
+        async def worker():
+            # Workers share one iterator, so items start in submission order
+            for index, item in pending:
+                running[asyncio.current_task()] = (index, item, time.perf_counter())
+                await finished.put(await _answer_batch_item(item, index, batch_id, memory, session_locks))
+            running.pop(asyncio.current_task(), None)
+        
+        workers = {asyncio.create_task(worker()) for _ in range(min(concurrency, len(request.items)))}
+        next_line = asyncio.create_task(finished.get())
+        started = time.perf_counter()
+        failed = 0
+        try:
+            for _ in request.items:
+                while not next_line.done():
+                    done, _ = await asyncio.wait({next_line, *workers}, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done - {next_line}:
+                        workers.discard(task)
+                        held = running.pop(task, None)
+                        if held is None:
+                            continue
+                        # The worker died mid-item: report the item and replace the worker
+                        index, item, item_started = held
+                        error = "cancelled" if task.cancelled() else repr(task.exception())
+                        logger.error(f"Batch {batch_id} worker died on item {index}: {error}")
+                        metrics.BATCH_ITEMS.labels(result="error").inc()
+                        finished.put_nowait({
+                            "index": index,
+                            "id": item.id,
+                            "error": "AI service unavailable: batch worker failed",
+                            "seconds": round(time.perf_counter() - item_started, 3)
+                        })
+                        workers.add(asyncio.create_task(worker()))
+                line = next_line.result()
+                next_line = asyncio.create_task(finished.get())
+                failed += "error" in line
+                yield json.dumps(line) + "\n"
+        finally:
+            # Client went away or the batch is done; stop any items still queued or running
+            next_line.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(next_line, *workers, return_exceptions=True)
+        
+        seconds = time.perf_counter() - started
+        logger.info(f"Batch {batch_id} finished in {seconds:.1f}s, {failed} of {len(request.items)} items failed")
+        yield json.dumps({
+            "done": True,
+            "items": len(request.items),
+            "failed": failed,
+            "seconds": round(seconds, 3)
+        }) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @router.post("/reset", response_model=ResetResponse)
 async def reset_session(request: ResetRequest, redis_client: Redis = Depends(get_redis)):
     """
@@ -127,7 +472,9 @@ async def reset_session(request: ResetRequest, redis_client: Redis = Depends(get
     """
     try:
         memory = MemoryService(redis_client)
-        memory.reset_session(request.session_id)
+        # A queued write would otherwise recreate the session after it is reset
+        await write_behind.wait_for(request.session_id)
+        await memory.reset_session(request.session_id)
         
         return ResetResponse(
             message="Session reset successfully",
@@ -155,7 +502,8 @@ async def get_session_history(session_id: str, redis_client: Redis = Depends(get
     """
     try:
         memory = MemoryService(redis_client)
-        history = memory.get_history(session_id)
+        await write_behind.wait_for(session_id)
+        history = await memory.get_history(session_id)
         
         return SessionHistoryResponse(
             session_id=session_id,
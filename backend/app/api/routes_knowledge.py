@@ -0,0 +1,103 @@
+"""
+Knowledge base API endpoints for document ingestion and retrieval.
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from typing import Optional
+import asyncio
+import secrets
+from app.api.routes_chat import knowledge_base
+from app.core.config import settings
+from app.models.request_models import (
+    DocumentRequest, DocumentResponse, DocumentListResponse,
+    KnowledgeSearchResponse
+)
+from app.utils.logger import logger
+
+router = APIRouter(prefix="/api/knowledge", tags=["Knowledge Base"])
+
+
+def require_api_key(x_api_key: Optional[str] = Header(default=None)) -> None:
+    """Check the X-API-Key header when KNOWLEDGE_BASE_API_KEY is set."""
+    expected = settings.KNOWLEDGE_BASE_API_KEY
+    if expected and not (x_api_key and secrets.compare_digest(x_api_key, expected)):
+        raise HTTPException(status_code=401, detail="Invalid or missing API key")
+
+
+@router.post("/documents", response_model=DocumentResponse, dependencies=[Depends(require_api_key)])
+async def add_document(request: DocumentRequest):
+    """
+    Chunk a document and add it to the knowledge base.
+    
+    A document with the same `source` as an existing one replaces it.
+    
+    Args:
+        request: Document title, text and optional source
+    
+    Returns:
+        The indexed document
+    """
+    if len(request.text) > settings.KNOWLEDGE_BASE_MAX_DOCUMENT_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Document exceeds {settings.KNOWLEDGE_BASE_MAX_DOCUMENT_CHARS} characters"
+        )
+    try:
+        document = await knowledge_base.add_document(request.title, request.text, request.source)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error indexing document {request.title!r}: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to index document"
+        )
+    return DocumentResponse(**document)
+
+
+@router.get("/documents", response_model=DocumentListResponse)
+async def list_documents():
+    """
+    List the documents in the knowledge base.
+    
+    Returns:
+        Documents, newest first, and the total chunk count
+    """
+    documents = knowledge_base.documents()
+    return DocumentListResponse(
+        documents=[DocumentResponse(**document) for document in documents],
+        chunk_count=knowledge_base.index.chunk_count
+    )
+
+
+@router.delete("/documents/{document_id}", status_code=204, dependencies=[Depends(require_api_key)])
+async def delete_document(document_id: str):
+    """
+    Remove a document and its passages from the knowledge base.
+    
+    Args:
+        document_id: Document identifier
+    """
+    if not await knowledge_base.delete_document(document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return Response(status_code=204)
+
+
+@router.get("/search", response_model=KnowledgeSearchResponse)
+async def search_knowledge(q: str = Query(..., min_length=1, description="Search query")):
+    """
+    Show the passages a chat message would retrieve, for debugging.
+    
+    Args:
+        q: Search query
+    
+    Returns:
+        Matching passages, best first
+    """
+    passages = await asyncio.to_thread(knowledge_base.search, q)
+    return KnowledgeSearchResponse(
+        query=q,
+        passages=[
+            {"title": title, "text": text, "score": round(score, 3)}
+            for title, text, score in passages
+        ]
+    )
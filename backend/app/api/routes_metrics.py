@@ -0,0 +1,18 @@
+"""
+Prometheus metrics endpoint.
+"""
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Expose application metrics in the Prometheus text format.
+    
+    Returns:
+        Metrics exposition for scraping
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
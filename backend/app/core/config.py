@@ -2,7 +2,7 @@
 Configuration management using environment variables.
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 
 
 class Settings(BaseSettings):
@@ -16,23 +16,126 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5  # seconds to wait for a free pooled connection
+    REDIS_CONNECT_TIMEOUT: int = 5
+    REDIS_SOCKET_TIMEOUT: int = 5
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
     
     # Ollama
     OLLAMA_BASE_URL: str = "http://ollama:11434"
+    OLLAMA_BASE_URLS: list[str] = []  # several Ollama hosts to balance over; overrides OLLAMA_BASE_URL
     OLLAMA_MODEL: str = "llama3.1:8b"
     OLLAMA_TIMEOUT: int = 120
+    OLLAMA_CONNECT_TIMEOUT: int = 5
+    OLLAMA_MAX_CONNECTIONS: int = 64
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = 32
+    OLLAMA_KEEPALIVE_EXPIRY: int = 60
+    OLLAMA_CONTEXT_REUSE: bool = True  # send the previous turn's KV context instead of re-serializing history
+    OLLAMA_CONTEXT_MAX_TOKENS: int = 6144  # rebuild from history once the context grows past this
+    OLLAMA_NUM_CTX: int = 4096  # context window requested from Ollama
+    OLLAMA_NUM_CTX_BY_MODEL: dict[str, int] = {}  # per-model overrides of OLLAMA_NUM_CTX
+    OLLAMA_RESPONSE_TOKENS: int = 512  # part of the window kept free for the reply
+    OLLAMA_MAX_CONCURRENT: int = 4  # generations per host at once; match OLLAMA_NUM_PARALLEL
+    OLLAMA_QUEUE_SIZE: int = 32  # generations allowed to wait for a slot
+    OLLAMA_QUEUE_TIMEOUT: float = 30.0  # seconds a generation may wait before it is rejected with 429
+    OLLAMA_SESSION_AFFINITY: bool = True  # keep a session on the same host while it is not overloaded
+    OLLAMA_AFFINITY_MAX_SKEW: int = 2  # extra outstanding requests tolerated on a session's host
+    OLLAMA_HEALTH_CHECK_INTERVAL: float = 10.0  # seconds between /api/tags probes; 0 disables
+    OLLAMA_HEALTH_CHECK_TIMEOUT: float = 2.0
+    OLLAMA_EJECT_AFTER_FAILURES: int = 3  # consecutive failures before a host leaves rotation
+    
+    # Response cache
+    RESPONSE_CACHE_ENABLED: bool = False  # reuse replies to identical prompts (no reused KV context, no web search)
+    RESPONSE_CACHE_TTL: int = 3600
+    RESPONSE_CACHE_LOCAL_SIZE: int = 256
+    SEMANTIC_CACHE_ENABLED: bool = False  # answer paraphrases of earlier first-turn questions from an embedding index
+    SEMANTIC_CACHE_EMBED_MODEL: str = "nomic-embed-text"
+    SEMANTIC_CACHE_EMBED_TIMEOUT: float = 2.0  # seconds; a slower embedding counts as a miss
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # minimum cosine similarity for a hit
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 10000  # least recently used entries are evicted beyond this
+    SEMANTIC_CACHE_TTL: int = 86400
+    SEMANTIC_CACHE_DIR: str = "data/semantic_cache"  # memory-mapped vectors and entry log
+    
+    # Prompt budget
+    PROMPT_CONTEXT_SHARE: float = 0.5  # share of the free prompt budget search/scrape context may claim before history
     
     # Session
     SESSION_TTL_SECONDS: int = 600  # 10 minutes
-    MAX_HISTORY_MESSAGES: int = 20
+    MAX_HISTORY_MESSAGES: int = 20  # hard cap on stored messages; keep above SUMMARY_TRIGGER_MESSAGES
+    MEMORY_WRITE_BEHIND: bool = False  # store turns after the reply is sent instead of before
+    WRITE_BEHIND_MAX_PENDING: int = 1000  # beyond this many queued writes, store inline
+    WRITE_BEHIND_RETRIES: int = 2
+    WRITE_BEHIND_FLUSH_TIMEOUT: float = 10.0  # seconds shutdown waits for queued writes
+    WRITE_BEHIND_WAIT_TIMEOUT: float = 5.0  # seconds a turn waits for its session's queued writes, outside the history timeout
+    SUMMARY_ENABLED: bool = True  # fold older messages into a running summary in the background
+    SUMMARY_TRIGGER_MESSAGES: int = 16  # summarize once a session holds more messages than this
+    SUMMARY_KEEP_MESSAGES: int = 8  # newest messages left verbatim after a summary
+    SUMMARY_MAX_WORDS: int = 150
+    SUMMARY_MAX_TOKENS: int = 256  # num_predict for summary generations
+    SUMMARY_MAX_CONCURRENT: int = 2  # sessions summarized at once
+    SUMMARY_RESERVED_SLOTS: int = 2  # generation slots kept free for user requests when a summary starts
+    LONG_TERM_MEMORY_ENABLED: bool = False  # index every turn and recall relevant ones once they leave the history
+    LONG_TERM_MEMORY_TOP_K: int = 3  # archived turns recalled per message
+    LONG_TERM_MEMORY_MIN_SCORE: float = 1.0  # BM25 score an archived turn needs to be recalled
+    LONG_TERM_MEMORY_TURN_TOKENS: int = 200  # each recalled turn is cut to this many tokens
     
     # Scraping
     SCRAPE_TIMEOUT: int = 10
-    SCRAPE_MAX_CHARS: int = 5000
+    SCRAPE_MAX_CHARS: int = 5000  # scraped text that goes into the prompt
+    SCRAPE_RANKING_ENABLED: bool = True  # pick the passages most relevant to the message instead of the page's start
+    SCRAPE_MAX_PAGE_CHARS: int = 50000  # page text kept for ranking
+    SCRAPE_CHUNK_CHARS: int = 600
+    SCRAPE_MAX_BYTES: int = 2_000_000  # stop downloading a page after this many bytes
+    SCRAPE_ALLOWED_CONTENT_TYPES: list[str] = ["text/html", "application/xhtml+xml", "text/plain"]
+    SCRAPE_EXTRACTOR: Literal["bs4", "lxml"] = "bs4"  # "lxml" reuses the streaming parser's text and skips BeautifulSoup
+    SCRAPE_CACHE_ENABLED: bool = True
+    SCRAPE_CACHE_TTL: int = 900  # serve cached text without revalidating for this long
+    SCRAPE_CACHE_STALE_TTL: int = 86400  # keep entries this long for conditional revalidation
+    SCRAPE_NEGATIVE_CACHE_TTL: int = 60  # remember failed fetches for this long
+    SCRAPE_CACHE_LOCAL_SIZE: int = 256  # in-process LRU entries in front of Redis
+    
+    # Search
+    SEARCH_SEARXNG_URL: Optional[str] = None  # SearXNG-compatible JSON endpoint used instead of DuckDuckGo
+    SEARCH_TIMEOUT: int = 10
+    SEARCH_CACHE_TTL: int = 120  # seconds; 0 disables the search cache
+    SEARCH_CACHE_LOCAL_SIZE: int = 512
+    SEARCH_INTENT_CLASSIFIER: Literal["keyword", "scored"] = "scored"  # how messages are checked for a search need
+    SEARCH_INTENT_THRESHOLD: float = 0.5  # search probability above which the scored classifier searches
+    DEEP_SEARCH_PAGES: int = 3  # top results opened in deep search mode
+    DEEP_SEARCH_DEADLINE: float = 4.0  # seconds; pages not fetched by then are dropped
+    DEEP_SEARCH_PER_HOST: int = 1  # concurrent fetches per host within one deep search
+    DEEP_SEARCH_MAX_CHARS: int = 4000  # passage text added on top of the result snippets
+    
+    # Batch chat
+    BATCH_MAX_ITEMS: int = 1000  # items accepted per /chat/batch request
+    BATCH_MAX_CONCURRENCY: int = 4  # items of one batch answered at once
+    BATCH_ADMISSION_RETRIES: int = 2  # retries of an item turned away by admission control, after its Retry-After
+    
+    # Knowledge base
+    KNOWLEDGE_BASE_ENABLED: bool = False  # retrieve passages from ingested documents for every chat turn
+    KNOWLEDGE_BASE_DIR: str = "data/knowledge_base"  # memory-mapped inverted index and chunk text
+    KNOWLEDGE_BASE_API_KEY: Optional[str] = None  # required in X-API-Key to ingest or delete documents, if set
+    KNOWLEDGE_BASE_CHUNK_CHARS: int = 800
+    KNOWLEDGE_BASE_TOP_K: int = 4  # passages retrieved per message
+    KNOWLEDGE_BASE_MIN_SCORE: float = 0.2  # share of the best BM25 score the message allows (0-1) a passage needs to be used
+    KNOWLEDGE_BASE_MAX_CHARS: int = 3000  # passage text added to the prompt
+    KNOWLEDGE_BASE_MAX_DOCUMENT_CHARS: int = 2_000_000  # larger uploads are rejected
+    
+    # Chat pipeline stage timeouts (seconds); history (then recall), search, scrape and knowledge run concurrently
+    STAGE_TIMEOUT_HISTORY: float = 2.0
+    STAGE_TIMEOUT_RECALL: float = 0.5  # runs after the history read; on timeout the turn goes ahead without recalled turns
+    STAGE_TIMEOUT_SEARCH: float = 6.0
+    STAGE_TIMEOUT_SCRAPE: float = 12.0
+    STAGE_TIMEOUT_KNOWLEDGE: float = 0.5
     
     # CORS
     CORS_ORIGINS: list[str] = ["*"]
     
+    def num_ctx_for(self, model: str) -> int:
+        """Context window size to request for a model."""
+        return self.OLLAMA_NUM_CTX_BY_MODEL.get(model, self.OLLAMA_NUM_CTX)
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
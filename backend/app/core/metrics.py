@@ -0,0 +1,249 @@
+"""
+Prometheus metrics shared across the application.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Redis connection pool
+REDIS_POOL_MAX_CONNECTIONS = Gauge(
+    "redis_pool_max_connections",
+    "Maximum number of connections in the Redis pool"
+)
+REDIS_POOL_IN_USE_CONNECTIONS = Gauge(
+    "redis_pool_in_use_connections",
+    "Redis connections currently checked out of the pool"
+)
+REDIS_POOL_IDLE_CONNECTIONS = Gauge(
+    "redis_pool_idle_connections",
+    "Open Redis connections waiting in the pool"
+)
+REDIS_POOL_WAITS = Counter(
+    "redis_pool_waits_total",
+    "Connection requests that found the Redis pool saturated and had to wait"
+)
+REDIS_POOL_TIMEOUTS = Counter(
+    "redis_pool_timeouts_total",
+    "Connection requests that gave up waiting for a free Redis connection"
+)
+
+REDIS_OPERATION_SECONDS = Histogram(
+    "redis_operation_seconds",
+    "Session store round trips by operation (read, write, fold, recall)",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+# Write-behind persistence
+WRITE_BEHIND_PENDING = Gauge(
+    "write_behind_pending_writes",
+    "Session writes queued or running in the background"
+)
+WRITE_BEHIND_WRITES = Counter(
+    "write_behind_writes_total",
+    "Session writes by outcome (ok, retried, failed, inline)",
+    ["result"]
+)
+WRITE_BEHIND_LAG_SECONDS = Histogram(
+    "write_behind_lag_seconds",
+    "Time from submitting a background session write to it being stored",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+# Chat pipeline
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Duration of each pre-LLM chat stage (history, search, scrape, pre_llm, prompt_build)",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+)
+PROMPT_TOKENS = Histogram(
+    "chat_prompt_tokens",
+    "Estimated prompt tokens per chat turn",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+)
+
+# Search
+SEARCH_TRIGGERS = Counter(
+    "search_triggers_total",
+    "Chat turns that ran a web search, by mode (auto, deep)",
+    ["mode"]
+)
+SEARCH_INTENT_DECISIONS = Counter(
+    "search_intent_decisions_total",
+    "Search intent decisions on chat messages, by classifier and decision (search, skip)",
+    ["classifier", "decision"]
+)
+SEARCH_INTENT_SCORE = Histogram(
+    "search_intent_score",
+    "Search probability assigned to chat messages by the intent classifier",
+    ["classifier"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+)
+SEARCH_CACHE_REQUESTS = Counter(
+    "search_cache_requests_total",
+    "Search lookups by cache outcome (hit, miss or coalesced onto an in-flight search)",
+    ["result"]
+)
+SEARCH_SECONDS = Histogram(
+    "search_seconds",
+    "Upstream DuckDuckGo search duration",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13)
+)
+
+# Scraping
+SCRAPE_CACHE_REQUESTS = Counter(
+    "scrape_cache_requests_total",
+    "Scrape lookups by cache outcome (hit, stale, miss); revalidated counts stale entries confirmed by a 304",
+    ["result"]
+)
+SCRAPE_SECONDS = Histogram(
+    "scrape_seconds",
+    "Scrape duration by phase (fetch: download and stream-parse, parse: BeautifulSoup extraction)",
+    ["phase"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# Ollama admission control
+OLLAMA_IN_FLIGHT = Gauge(
+    "ollama_in_flight_generations",
+    "Generations currently holding an Ollama slot"
+)
+OLLAMA_QUEUE_DEPTH = Gauge(
+    "ollama_queue_depth",
+    "Generations waiting for an Ollama slot"
+)
+OLLAMA_QUEUE_WAIT_SECONDS = Histogram(
+    "ollama_queue_wait_seconds",
+    "Time generations waited for an Ollama slot",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+)
+OLLAMA_ADMISSION_REJECTIONS = Counter(
+    "ollama_admission_rejections_total",
+    "Generations rejected with 429 by reason (queue_full, wait_estimate, timeout)",
+    ["reason"]
+)
+OLLAMA_BACKEND_OUTSTANDING = Gauge(
+    "ollama_backend_outstanding_requests",
+    "Requests currently sent to each Ollama backend",
+    ["backend"]
+)
+OLLAMA_BACKEND_HEALTHY = Gauge(
+    "ollama_backend_healthy",
+    "1 if the Ollama backend is in rotation, 0 if it has been ejected",
+    ["backend"]
+)
+
+# Ollama generations
+RESPONSE_CACHE_REQUESTS = Counter(
+    "llm_response_cache_requests_total",
+    "Cacheable chat turns by response cache outcome (hit, miss or coalesced onto an identical generation)",
+    ["result"]
+)
+SEMANTIC_CACHE_REQUESTS = Counter(
+    "semantic_cache_requests_total",
+    "Semantic cache lookups by outcome (hit, miss, expired, error)",
+    ["result"]
+)
+SEMANTIC_CACHE_LOOKUP_SECONDS = Histogram(
+    "semantic_cache_lookup_seconds",
+    "Semantic cache lookup duration, embedding included",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "semantic_cache_similarity",
+    "Cosine similarity of the closest cached question",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 1.0)
+)
+SEMANTIC_CACHE_ENTRIES = Gauge(
+    "semantic_cache_entries",
+    "Answers held in the semantic cache"
+)
+SEMANTIC_CACHE_EVICTIONS = Counter(
+    "semantic_cache_evictions_total",
+    "Semantic cache entries removed, by reason (lru, expired)",
+    ["reason"]
+)
+OLLAMA_TTFT_SECONDS = Histogram(
+    "ollama_time_to_first_token_seconds",
+    "Time from sending a generation to its first token, by mode (stream, generate)",
+    ["mode"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+OLLAMA_GENERATION_SECONDS = Histogram(
+    "ollama_generation_seconds",
+    "Total generation time, by mode (stream, generate)",
+    ["mode"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+)
+OLLAMA_PROMPT_EVAL_TOKENS = Counter(
+    "ollama_prompt_eval_tokens_total",
+    "Prompt tokens Ollama prefilled (prompt_eval_count)"
+)
+OLLAMA_EVAL_TOKENS = Counter(
+    "ollama_eval_tokens_total",
+    "Tokens Ollama generated (eval_count)"
+)
+OLLAMA_EVAL_SECONDS = Counter(
+    "ollama_eval_seconds_total",
+    "Time Ollama spent generating tokens (eval_duration)"
+)
+OLLAMA_EVAL_TOKENS_PER_SECOND = Gauge(
+    "ollama_eval_tokens_per_second",
+    "Decode throughput of the most recent generation (eval_count / eval_duration)"
+)
+
+# Batch chat
+BATCH_ITEMS = Counter(
+    "chat_batch_items_total",
+    "Batch chat items by outcome (ok, rejected, error)",
+    ["result"]
+)
+BATCH_ITEM_SECONDS = Histogram(
+    "chat_batch_item_seconds",
+    "Time to answer one batch chat item, admission waits included",
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+# Knowledge base
+KNOWLEDGE_LOOKUP_SECONDS = Histogram(
+    "knowledge_lookup_seconds",
+    "Knowledge base retrieval time per chat turn",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+KNOWLEDGE_PASSAGES = Histogram(
+    "knowledge_passages",
+    "Knowledge base passages added to the prompt per chat turn",
+    buckets=(0, 1, 2, 3, 4, 6, 8)
+)
+KNOWLEDGE_CHUNKS = Gauge(
+    "knowledge_chunks",
+    "Searchable chunks in the knowledge base"
+)
+KNOWLEDGE_INGEST_SECONDS = Histogram(
+    "knowledge_ingest_seconds",
+    "Time to index an ingested document",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# Long-term session memory
+MEMORY_RECALL_CANDIDATES = Histogram(
+    "memory_recall_candidate_turns",
+    "Archived turns sharing a term with the message, per long-term memory lookup",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+MEMORY_RECALLED_TURNS = Histogram(
+    "memory_recalled_turns",
+    "Archived turns added to the prompt per long-term memory lookup",
+    buckets=(0, 1, 2, 3, 5, 8)
+)
+
+# Session summaries
+SUMMARY_RUNS = Counter(
+    "session_summary_runs_total",
+    "Background session summaries by outcome (folded, stale, rejected, deferred, error, cancelled)",
+    ["result"]
+)
+SUMMARY_SECONDS = Histogram(
+    "session_summary_seconds",
+    "Duration of background session summaries, including the wait for a generation slot",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+)
@@ -1,47 +1,90 @@
 """
 Redis client initialization and connection management.
 """
-import redis
-from redis import Redis
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.exceptions import ConnectionError
 from app.core.config import settings
+from app.core import metrics
 from app.utils.logger import logger
 
 
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Bounded connection pool that records waits when it is saturated."""
+    
+    async def get_connection(self, command_name, *keys, **options):
+        if not self.can_get_connection():
+            metrics.REDIS_POOL_WAITS.inc()
+        try:
+            return await super().get_connection(command_name, *keys, **options)
+        except ConnectionError as e:
+            if str(e) == "No connection available.":
+                metrics.REDIS_POOL_TIMEOUTS.inc()
+            raise
+    
+    def in_use_count(self) -> int:
+        """Number of connections currently checked out."""
+        return len(self._in_use_connections)
+    
+    def idle_count(self) -> int:
+        """Number of open connections waiting in the pool."""
+        return len(self._available_connections)
+
+
 class RedisClient:
-    """Singleton Redis client wrapper."""
+    """Singleton asyncio Redis client backed by a bounded connection pool."""
     
     _instance: Redis | None = None
+    _pool: InstrumentedConnectionPool | None = None
     
     @classmethod
     def get_client(cls) -> Redis:
-        """Get or create Redis client instance."""
+        """Get or create Redis client instance. Connections are opened lazily."""
         if cls._instance is None:
-            try:
-                cls._instance = redis.Redis(
-                    host=settings.REDIS_HOST,
-                    port=settings.REDIS_PORT,
-                    db=settings.REDIS_DB,
-                    decode_responses=True,
-                    socket_connect_timeout=5,
-                    socket_timeout=5
-                )
-                # Test connection
-                cls._instance.ping()
-                logger.info(f"Connected to Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT}")
-            except redis.ConnectionError as e:
-                logger.error(f"Failed to connect to Redis: {e}")
-                raise
+            cls._pool = InstrumentedConnectionPool(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                decode_responses=True,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL
+            )
+            cls._instance = Redis(connection_pool=cls._pool)
+            
+            pool = cls._pool
+            metrics.REDIS_POOL_MAX_CONNECTIONS.set(pool.max_connections)
+            metrics.REDIS_POOL_IN_USE_CONNECTIONS.set_function(pool.in_use_count)
+            metrics.REDIS_POOL_IDLE_CONNECTIONS.set_function(pool.idle_count)
         return cls._instance
     
     @classmethod
-    def close(cls) -> None:
-        """Close Redis connection."""
+    async def connect(cls) -> Redis:
+        """Create the client and verify the server is reachable."""
+        client = cls.get_client()
+        try:
+            await client.ping()
+            logger.info(
+                f"Connected to Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT} "
+                f"(pool size {settings.REDIS_MAX_CONNECTIONS})"
+            )
+        except ConnectionError as e:
+            logger.error(f"Failed to connect to Redis: {e}")
+            raise
+        return client
+    
+    @classmethod
+    async def close(cls) -> None:
+        """Close Redis connections."""
         if cls._instance:
-            cls._instance.close()
+            await cls._instance.aclose()
+            await cls._pool.disconnect()
             cls._instance = None
+            cls._pool = None
             logger.info("Redis connection closed")
 
 
-def get_redis() -> Redis:
+async def get_redis() -> Redis:
     """Dependency function to get Redis client."""
     return RedisClient.get_client()
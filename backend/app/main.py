@@ -4,9 +4,10 @@ Main FastAPI application entry point.
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.api import routes_chat, routes_health
+from app.api import routes_chat, routes_health, routes_knowledge, routes_metrics
 from app.core.config import settings
 from app.core.redis_client import RedisClient
+from app.services.memory_service import MemoryService
 from app.utils.logger import logger
 
 
@@ -15,21 +16,35 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
     # Startup
     logger.info("Starting AI Assistant API")
-    logger.info(f"Ollama URL: {settings.OLLAMA_BASE_URL}")
-    logger.info(f"Redis: {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+    logger.info(f"Ollama URLs: {', '.join(backend.url for backend in routes_chat.ollama_service.backends)}")
+    logger.info(f"Redis: {settings.REDIS_HOST}:{settings.REDIS_PORT} (pool size {settings.REDIS_MAX_CONNECTIONS})")
     logger.info(f"Session TTL: {settings.SESSION_TTL_SECONDS} seconds")
     
-    # Initialize Redis connection
+    # Initialize Redis connection and convert legacy JSON blob sessions
     try:
-        RedisClient.get_client()
+        redis_client = await RedisClient.connect()
+        migrated = await MemoryService(redis_client).migrate_legacy_sessions()
+        if migrated:
+            logger.info(f"Migrated {migrated} legacy sessions to list storage")
     except Exception as e:
         logger.error(f"Failed to connect to Redis on startup: {e}")
     
+    routes_chat.ollama_service.start_health_checks()
+    if settings.KNOWLEDGE_BASE_ENABLED:
+        routes_chat.knowledge_base.open()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down AI Assistant API")
-    RedisClient.close()
+    await routes_chat.write_behind.flush(settings.WRITE_BEHIND_FLUSH_TIMEOUT)
+    await routes_chat.summary_service.close()
+    routes_chat.semantic_cache.close()
+    routes_chat.knowledge_base.close()
+    await routes_chat.ollama_service.close()
+    await routes_chat.scrape_service.close()
+    await routes_chat.search_service.close()
+    await RedisClient.close()
 
 
 # Create FastAPI app
@@ -52,6 +67,8 @@ app.add_middleware(
 # Include routers
 app.include_router(routes_health.router)
 app.include_router(routes_chat.router)
+app.include_router(routes_knowledge.router)
+app.include_router(routes_metrics.router)
 
 
 @app.get("/")
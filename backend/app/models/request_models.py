@@ -11,6 +11,7 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, description="User message")
     use_scrape: bool = Field(default=False, description="Whether to scrape a URL for context")
     scrape_url: Optional[str] = Field(default=None, description="URL to scrape if use_scrape is true")
+    deep_search: bool = Field(default=False, description="Search the web and read the top result pages for context")
 
 
 class ChatResponse(BaseModel):
@@ -19,6 +20,29 @@ class ChatResponse(BaseModel):
     session_expired: bool = Field(default=False, description="Whether the session had expired")
 
 
+class BatchChatItem(BaseModel):
+    """One prompt of a batch chat request."""
+    id: Optional[str] = Field(default=None, description="Caller's identifier, echoed in the result")
+    message: str = Field(..., min_length=1, description="User message")
+    session_id: Optional[str] = Field(
+        default=None,
+        description="Session to read and extend; without one the item is stateless and nothing is stored"
+    )
+    use_scrape: bool = Field(default=False, description="Whether to scrape a URL for context")
+    scrape_url: Optional[str] = Field(default=None, description="URL to scrape if use_scrape is true")
+    deep_search: bool = Field(default=False, description="Search the web and read the top result pages for context")
+
+
+class BatchChatRequest(BaseModel):
+    """Request model for batch chat endpoint."""
+    items: list[BatchChatItem] = Field(..., min_length=1, description="Prompts to answer")
+    concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="Items answered at once; capped by BATCH_MAX_CONCURRENCY"
+    )
+
+
 class ResetRequest(BaseModel):
     """Request model for session reset endpoint."""
     session_id: str = Field(..., description="Session identifier to reset")
@@ -37,6 +61,35 @@ class SessionHistoryResponse(BaseModel):
     message_count: int = Field(..., description="Number of messages in history")
 
 
+class DocumentRequest(BaseModel):
+    """Request model for knowledge base ingestion."""
+    title: str = Field(..., min_length=1, max_length=300, description="Document title, shown with its passages")
+    text: str = Field(..., min_length=1, description="Plain document text")
+    source: Optional[str] = Field(default=None, description="Origin such as a path or URL; re-ingesting it replaces the document")
+
+
+class DocumentResponse(BaseModel):
+    """Response model for an ingested document."""
+    id: str = Field(..., description="Document identifier")
+    title: str = Field(..., description="Document title")
+    source: Optional[str] = Field(default=None, description="Document origin")
+    chunks: int = Field(..., description="Number of indexed chunks")
+    characters: int = Field(..., description="Length of the ingested text")
+    created: float = Field(..., description="Ingestion time (Unix seconds)")
+
+
+class DocumentListResponse(BaseModel):
+    """Response model for the knowledge base document list."""
+    documents: list[DocumentResponse] = Field(..., description="Ingested documents, newest first")
+    chunk_count: int = Field(..., description="Searchable chunks across all documents")
+
+
+class KnowledgeSearchResponse(BaseModel):
+    """Response model for knowledge base search."""
+    query: str = Field(..., description="Search query")
+    passages: list[dict] = Field(..., description="Matching passages with their document title and score")
+
+
 class HealthResponse(BaseModel):
     """Response model for health check endpoint."""
     status: str = Field(..., description="Health status")
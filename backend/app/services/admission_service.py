@@ -0,0 +1,166 @@
+"""
+Admission control for generation requests sent to Ollama.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from app.core import metrics
+from app.utils.logger import logger
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+
+
+class AdmissionRejected(Exception):
+    """The request was turned away instead of being queued or kept waiting."""
+    
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded priority wait queue.
+    
+    At most `max_concurrent` callers hold a slot at once. Others wait in
+    priority order (FIFO within a priority), unless the queue is full or
+    their estimated wait already exceeds `max_wait`, in which case they are
+    rejected immediately. The wait estimate comes from a moving average of
+    how long slots are held.
+    """
+    
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queued = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._service_time: Optional[float] = None
+    
+    def estimated_wait(self, priority: int) -> float:
+        """Seconds a new request with `priority` can expect to wait for a slot."""
+        if self.in_flight < self.max_concurrent and not self.queued:
+            return 0.0
+        if self._service_time is None:
+            return 0.0
+        ahead = sum(1 for p, _, future in self._waiters if p <= priority and not future.done())
+        return (ahead + 1) / self.max_concurrent * self._service_time
+    
+    def _reject(self, reason: str, message: str, wait: float) -> AdmissionRejected:
+        metrics.OLLAMA_ADMISSION_REJECTIONS.labels(reason=reason).inc()
+        retry_after = max(1, math.ceil(wait or self._service_time or 1))
+        logger.warning(f"Generation rejected ({reason}): {message}; retry after {retry_after}s")
+        return AdmissionRejected(message, retry_after)
+    
+    async def acquire(self, priority: int = PRIORITY_DEFAULT) -> None:
+        """
+        Wait for a slot.
+        
+        Args:
+            priority: Queue priority; lower values are served first
+        
+        Raises:
+            AdmissionRejected: If the queue is full, the estimated wait is too
+                long, or no slot freed up within `max_wait`
+        """
+        if self.in_flight < self.max_concurrent and not self.queued:
+            self.in_flight += 1
+            metrics.OLLAMA_QUEUE_WAIT_SECONDS.observe(0)
+            return
+        
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full", "Generation queue is full", self.estimated_wait(priority))
+        estimate = self.estimated_wait(priority)
+        if estimate > self.max_wait:
+            raise self._reject(
+                "wait_estimate",
+                f"Estimated wait {estimate:.1f}s exceeds {self.max_wait}s",
+                estimate
+            )
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            # asyncio.timeout rather than wait_for: wait_for on 3.11 swallows a
+            # cancellation that arrives after the slot was handed over
+            async with asyncio.timeout(self.max_wait):
+                await future
+        except TimeoutError:
+            if not future.done() or future.cancelled():
+                self.queued -= 1
+                raise self._reject(
+                    "timeout",
+                    f"No generation slot within {self.max_wait}s",
+                    self.estimated_wait(priority)
+                )
+            # The slot was handed over just as the wait ran out; keep it
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller went away
+                self.release()
+            else:
+                self.queued -= 1
+            raise
+        metrics.OLLAMA_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started)
+    
+    def release(self, held_for: Optional[float] = None) -> None:
+        """
+        Give a slot back, handing it to the best waiting request if any.
+        
+        Args:
+            held_for: Seconds the slot was used, to refine wait estimates
+        """
+        if held_for is not None:
+            if self._service_time is None:
+                self._service_time = held_for
+            else:
+                self._service_time = 0.8 * self._service_time + 0.2 * held_for
+        
+        if self.in_flight <= self.max_concurrent and self._hand_over():
+            return
+        self.in_flight -= 1
+    
+    def resize(self, max_concurrent: int) -> None:
+        """
+        Change the number of slots.
+        
+        Growing hands the new slots to waiting requests straight away;
+        shrinking takes effect as held slots are released.
+        
+        Args:
+            max_concurrent: New slot count
+        """
+        self.max_concurrent = max_concurrent
+        while self.in_flight < self.max_concurrent and self._hand_over():
+            self.in_flight += 1
+    
+    def _hand_over(self) -> bool:
+        """Give a slot to the best waiting request; False if none is waiting."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.queued -= 1
+                future.set_result(None)
+                return True
+        return False
+    
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_DEFAULT) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block."""
+        await self.acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
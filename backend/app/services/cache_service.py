@@ -0,0 +1,117 @@
+"""
+Two-tier cache: an in-process LRU in front of Redis.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.core.redis_client import RedisClient
+from app.utils.logger import logger
+
+
+class LRUCache:
+    """Small in-process LRU with per-entry expiry."""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+    
+    def get(self, key: str) -> Optional[dict]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        if self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    JSON-document cache with an in-process LRU in front of a shared Redis tier.
+    
+    Reads check the LRU first and fall back to Redis, populating the LRU on a
+    Redis hit. Redis errors are logged and treated as misses so the cache never
+    fails a request.
+    """
+    
+    def __init__(self, namespace: str, local_size: int, local_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.local = LRUCache(local_size)
+        self.local_ttl = local_ttl
+    
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+    
+    async def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a cached document.
+        
+        Args:
+            key: Cache key within this namespace
+        
+        Returns:
+            Cached document or None on a miss
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        
+        try:
+            client = RedisClient.get_client()
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.get(self._redis_key(key))
+                pipe.ttl(self._redis_key(key))
+                raw, ttl = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache read from Redis failed for {self.namespace}: {e}")
+            return None
+        if raw is None:
+            return None
+        
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        if ttl and ttl > 0:
+            self.local.set(key, value, min(ttl, self.local_ttl or ttl))
+        return value
+    
+    async def set(self, key: str, value: dict, ttl: int) -> None:
+        """
+        Store a document in both tiers.
+        
+        Args:
+            key: Cache key within this namespace
+            value: JSON-serializable document
+            ttl: Expiry in seconds
+        """
+        self.local.set(key, value, min(ttl, self.local_ttl or ttl))
+        try:
+            await RedisClient.get_client().set(self._redis_key(key), json.dumps(value), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Cache write to Redis failed for {self.namespace}: {e}")
+    
+    async def delete(self, key: str) -> None:
+        """Remove a document from both tiers."""
+        self.local.delete(key)
+        try:
+            await RedisClient.get_client().delete(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"Cache delete from Redis failed for {self.namespace}: {e}")
@@ -0,0 +1,338 @@
+"""
+Staged preparation of a chat turn ahead of the LLM call.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Optional, Union
+from app.core import metrics
+from app.core.config import settings
+from app.models.request_models import ChatRequest
+from app.services.knowledge_service import KnowledgeBase
+from app.services.memory_service import MemoryService
+from app.services.scrape_service import ScrapeService
+from app.services.search_service import SearchService
+from app.services.write_behind_service import WriteBehindQueue
+from app.utils.prompt_builder import (
+    ContextText, build_budgeted_prompt, build_budgeted_followup_prompt,
+    prompt_token_budget
+)
+from app.utils.search_intent import create_classifier
+from app.utils.text_ranker import rank_sources, select_passages
+from app.utils.logger import logger
+
+
+class StageTimeout(Exception):
+    """A required pipeline stage did not finish within its deadline."""
+
+
+@dataclass
+class PreparedTurn:
+    """Everything the LLM call needs for one chat turn."""
+    prompt: str
+    context: Optional[list[int]]
+    session_expired: bool
+    history: list[dict]
+    stage_timings: dict[str, float] = field(default_factory=dict)
+    prompt_tokens: dict[str, int] = field(default_factory=dict)
+    cacheable: bool = False  # the prompt alone determines the reply and holds no live search results
+    standalone: bool = False  # a first turn without search or scraped context; the message alone is the question
+
+
+async def run_stage(
+    name: str,
+    awaitable: Awaitable[Any],
+    timeout: float,
+    timings: dict[str, float],
+    default: Any = None,
+    required: bool = False
+) -> Any:
+    """
+    Await one pipeline stage under its own deadline and record its duration.
+    
+    Optional stages degrade to `default` on timeout or error; required stages
+    raise StageTimeout on timeout and re-raise any other error.
+    
+    Args:
+        name: Stage name for logs and timings
+        awaitable: Stage coroutine
+        timeout: Seconds before the stage is abandoned
+        timings: Mapping that receives the stage duration in seconds
+        default: Result used when an optional stage fails
+        required: Whether the turn cannot proceed without this stage
+    
+    Returns:
+        Stage result or `default`
+    """
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Stage '{name}' timed out after {timeout}s")
+        if required:
+            raise StageTimeout(f"Stage '{name}' timed out after {timeout}s")
+        return default
+    except Exception as e:
+        if required:
+            raise
+        logger.error(f"Stage '{name}' failed: {e}")
+        return default
+    finally:
+        timings[name] = time.perf_counter() - started
+        metrics.CHAT_STAGE_SECONDS.labels(stage=name).observe(timings[name])
+
+
+def _with_knowledge(knowledge: str, context: Optional[ContextText]) -> ContextText:
+    """Put knowledge base passages ahead of search or scrape context, so the budget drops them last."""
+    if context is None:
+        return knowledge
+    if isinstance(context, str):
+        return f"{knowledge}\n\n{context}"
+    return knowledge.split("\n\n") + context
+
+
+class ChatPipeline:
+    """
+    Prepares the prompt for a chat turn.
+    
+    Session history, web search, page scraping and knowledge base retrieval
+    do not depend on each other, so they run concurrently, each under its own
+    timeout; pre-LLM latency is the slowest of them rather than their sum.
+    """
+    
+    def __init__(
+        self,
+        search_service: SearchService,
+        scrape_service: ScrapeService,
+        write_behind: Optional[WriteBehindQueue] = None,
+        knowledge_base: Optional[KnowledgeBase] = None
+    ):
+        self.search_service = search_service
+        self.scrape_service = scrape_service
+        self.write_behind = write_behind
+        self.knowledge_base = knowledge_base
+        self.intent_classifier = create_classifier(
+            settings.SEARCH_INTENT_CLASSIFIER,
+            threshold=settings.SEARCH_INTENT_THRESHOLD
+        )
+    
+    def needs_search(self, request: ChatRequest) -> bool:
+        """Auto-detect if web search is needed."""
+        if request.use_scrape:
+            return False
+        if request.deep_search:
+            return True
+        decision = self.intent_classifier.classify(request.message)
+        name = self.intent_classifier.name
+        metrics.SEARCH_INTENT_DECISIONS.labels(
+            classifier=name,
+            decision="search" if decision.search else "skip"
+        ).inc()
+        metrics.SEARCH_INTENT_SCORE.labels(classifier=name).observe(decision.score)
+        logger.debug(
+            f"Search intent ({name}): {'search' if decision.search else 'skip'} "
+            f"score={decision.score:.2f} matches={decision.matches}"
+        )
+        return decision.search
+    
+    async def _history(self, memory: Optional[MemoryService], request: ChatRequest, timings: dict[str, float]):
+        """
+        History and recall stages: waits up to WRITE_BEHIND_WAIT_TIMEOUT for
+        the session's queued writes so the previous turn is included, loads the history as a required
+        stage, then recalls relevant archived turns as an optional one if
+        older messages have left the history. A slow recall only costs the
+        turn its recalled turns. Stateless turns (no memory) have no history.
+        """
+        if memory is None:
+            return [], None, None, []
+        if self.write_behind is not None:
+            # Waiting for the previous turn's write is bounded separately from
+            # the history read, so slow writes delay the turn rather than fail it
+            started = time.perf_counter()
+            if not await self.write_behind.wait_for(request.session_id, settings.WRITE_BEHIND_WAIT_TIMEOUT):
+                logger.warning(
+                    f"Session {request.session_id} still had queued writes after "
+                    f"{settings.WRITE_BEHIND_WAIT_TIMEOUT}s; reading its history without them"
+                )
+            timings["write_wait"] = time.perf_counter() - started
+        history, context, summary = await run_stage(
+            "history",
+            memory.get_history_with_context(request.session_id),
+            settings.STAGE_TIMEOUT_HISTORY,
+            timings,
+            required=True
+        )
+        recalled = []
+        if settings.LONG_TERM_MEMORY_ENABLED and (summary or len(history) >= settings.MAX_HISTORY_MESSAGES):
+            recalled = await run_stage(
+                "recall",
+                memory.recall_turns(
+                    request.session_id,
+                    request.message,
+                    exclude_recent=len(history) // 2,
+                    limit=settings.LONG_TERM_MEMORY_TOP_K
+                ),
+                settings.STAGE_TIMEOUT_RECALL,
+                timings,
+                default=[]
+            )
+            metrics.MEMORY_RECALLED_TURNS.observe(len(recalled))
+        return history, context, summary, recalled
+    
+    async def _search(self, message: str, deep: bool = False) -> Optional[str]:
+        """Search stage: formatted results, plus passages from the top pages in deep mode, or None."""
+        logger.info(f"🌐 Auto web search triggered for: {message}")
+        metrics.SEARCH_TRIGGERS.labels(mode="deep" if deep else "auto").inc()
+        results = await self.search_service.search(message, num_results=5)
+        if not results:
+            logger.warning(f"⚠️ No search results found for: {message}")
+            return None
+        logger.info(f"📊 Formatted search results for AI context")
+        formatted = self.search_service.format_results_for_prompt(results)
+        if not deep:
+            return formatted
+        
+        urls = [result["url"] for result in results[:settings.DEEP_SEARCH_PAGES] if result.get("url")]
+        pages = await self.scrape_service.scrape_many(
+            urls,
+            deadline=settings.DEEP_SEARCH_DEADLINE,
+            per_host=settings.DEEP_SEARCH_PER_HOST
+        )
+        passages = rank_sources(
+            pages,
+            message,
+            max_chars=settings.DEEP_SEARCH_MAX_CHARS,
+            chunk_chars=settings.SCRAPE_CHUNK_CHARS
+        )
+        logger.info(f"📄 Deep search read {len(pages)}/{len(urls)} pages, kept {len(passages)} passages")
+        # One block per excerpt after the snippets, so the prompt budget drops the weakest excerpts first
+        return formatted + "\n\n".join(f"Excerpt from {url}:\n{passage}" for url, passage in passages)
+    
+    async def _scrape(self, url: str, message: str) -> Union[str, list[str]]:
+        """Scrape stage: the page passages most relevant to the message, or a scraping error marker."""
+        logger.info(f"Scraping requested for URL: {url}")
+        text = await self.scrape_service.scrape_website(url)
+        if not settings.SCRAPE_RANKING_ENABLED or text.startswith("[Scraping Error"):
+            return text
+        passages = select_passages(
+            text,
+            message,
+            max_chars=settings.SCRAPE_MAX_CHARS,
+            chunk_chars=settings.SCRAPE_CHUNK_CHARS
+        )
+        logger.info(
+            f"Selected {len(passages)} passages ({sum(len(p) for p in passages)} of {len(text)} characters) from {url}"
+        )
+        return passages
+    
+    async def _knowledge(self, message: str) -> Optional[str]:
+        """Knowledge stage: passages from the local knowledge base, or None."""
+        # The lookup reads memory-mapped files; off the event loop, the stage timeout can fire
+        return await asyncio.to_thread(self.knowledge_base.retrieve, message)
+    
+    async def prepare(self, request: ChatRequest, memory: Optional[MemoryService]) -> PreparedTurn:
+        """
+        Gather history, search results and scraped content and build the prompt.
+        
+        When the session has a fresh Ollama KV context that still leaves room
+        in the token budget, the prompt only carries the new message and the
+        context is returned for reuse; otherwise the session summary, recalled
+        archived turns and history are serialized into the prompt, trimmed to
+        the budget, and the context is None.
+        
+        Args:
+            request: Chat request being answered
+            memory: Memory service bound to the request's Redis client, or
+                None for a stateless turn that neither reads nor needs a session
+        
+        Returns:
+            Prepared prompt, context and session status
+        
+        Raises:
+            StageTimeout: If session history could not be loaded in time
+        """
+        timings: dict[str, float] = {}
+        stages = [self._history(memory, request, timings)]
+        searched = self.needs_search(request)
+        if searched:
+            search_timeout = settings.STAGE_TIMEOUT_SEARCH
+            if request.deep_search:
+                search_timeout += settings.DEEP_SEARCH_DEADLINE
+            stages.append(run_stage(
+                "search",
+                self._search(request.message, deep=request.deep_search),
+                search_timeout,
+                timings
+            ))
+        if request.use_scrape and request.scrape_url:
+            stages.append(run_stage(
+                "scrape",
+                self._scrape(request.scrape_url, request.message),
+                settings.STAGE_TIMEOUT_SCRAPE,
+                timings
+            ))
+        use_knowledge = self.knowledge_base is not None and settings.KNOWLEDGE_BASE_ENABLED
+        if use_knowledge:
+            stages.append(run_stage(
+                "knowledge",
+                self._knowledge(request.message),
+                settings.STAGE_TIMEOUT_KNOWLEDGE,
+                timings
+            ))
+        
+        started = time.perf_counter()
+        (history, context, summary, recalled), *extra = await asyncio.gather(*stages)
+        timings["pre_llm"] = time.perf_counter() - started
+        metrics.CHAT_STAGE_SECONDS.labels(stage="pre_llm").observe(timings["pre_llm"])
+        
+        knowledge = extra.pop() if use_knowledge else None
+        
+        # Build prompt with search results or scraped content, within the model's token budget
+        additional_context = next((text for text in extra if text), None)
+        if knowledge:
+            additional_context = _with_knowledge(knowledge, additional_context)
+        started = time.perf_counter()
+        budget = prompt_token_budget()
+        build = None
+        if context and settings.OLLAMA_CONTEXT_REUSE and len(context) <= settings.OLLAMA_CONTEXT_MAX_TOKENS:
+            build = build_budgeted_followup_prompt(
+                user_message=request.message,
+                scraped_text=additional_context,
+                token_budget=budget,
+                context_tokens=len(context)
+            )
+            if build.total_tokens > budget:
+                logger.debug(f"Context for session {request.session_id} no longer fits the budget, rebuilding")
+                build = None
+            else:
+                logger.debug(f"Reusing {len(context)} context tokens for session {request.session_id}")
+        if build is None:
+            context = None
+            build = build_budgeted_prompt(
+                history=history,
+                user_message=request.message,
+                scraped_text=additional_context,
+                token_budget=budget,
+                summary=summary,
+                recalled=recalled
+            )
+        
+        timings["prompt_build"] = time.perf_counter() - started
+        metrics.CHAT_STAGE_SECONDS.labels(stage="prompt_build").observe(timings["prompt_build"])
+        metrics.PROMPT_TOKENS.observe(build.total_tokens)
+        logger.info(f"Prompt tokens: {build.describe()}")
+        logger.info(
+            "Pre-LLM stages: " + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items())
+        )
+        
+        # A session exists exactly when its history list is non-empty
+        return PreparedTurn(
+            prompt=build.prompt,
+            context=context,
+            session_expired=len(history) == 0,
+            history=history,
+            stage_timings=timings,
+            prompt_tokens=build.tokens,
+            cacheable=settings.RESPONSE_CACHE_ENABLED and context is None and not searched,
+            standalone=settings.SEMANTIC_CACHE_ENABLED and not history and not extra and not knowledge
+        )
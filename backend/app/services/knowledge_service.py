@@ -0,0 +1,145 @@
+"""
+Local knowledge base of ingested documents for prompt context.
+"""
+import asyncio
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+from app.core import metrics
+from app.core.config import settings
+from app.utils.document_index import DocumentIndex
+from app.utils.logger import logger
+from app.utils.prompt_builder import KNOWLEDGE_HEADING
+from app.utils.text_ranker import split_chunks
+
+
+class KnowledgeBase:
+    """
+    Chunks documents into a DocumentIndex in KNOWLEDGE_BASE_DIR and retrieves
+    the passages most relevant to a chat message.
+    
+    Retrieval is a BM25 lookup over memory-mapped files in this process, with
+    no network or model calls. Ingestion runs in a worker thread; a document
+    ingested with the `source` of an existing one replaces it.
+    """
+    
+    def __init__(self):
+        self.index: Optional[DocumentIndex] = None
+        metrics.KNOWLEDGE_CHUNKS.set_function(lambda: self.index.chunk_count if self.index else 0)
+    
+    def open(self) -> None:
+        """Open the on-disk index."""
+        if self.index is None:
+            self.index = DocumentIndex(Path(settings.KNOWLEDGE_BASE_DIR))
+            logger.info(
+                f"Knowledge base opened with {len(self.index.documents)} documents "
+                f"({self.index.chunk_count} chunks)"
+            )
+    
+    def _require_index(self) -> DocumentIndex:
+        if self.index is None:
+            self.open()
+        return self.index
+    
+    def documents(self) -> list[dict]:
+        """Metadata of every ingested document, newest first."""
+        index = self._require_index()
+        documents = [{"id": doc_id, **doc} for doc_id, doc in index.documents.items()]
+        return sorted(documents, key=lambda doc: doc["created"], reverse=True)
+    
+    async def add_document(self, title: str, text: str, source: Optional[str] = None) -> dict:
+        """
+        Chunk and index a document.
+        
+        Args:
+            title: Document title, shown with its passages in prompts
+            text: Plain document text
+            source: Optional origin (path or URL); re-ingesting a source replaces it
+        
+        Returns:
+            The stored document metadata with its id
+        
+        Raises:
+            ValueError: If the text contains nothing to index
+        """
+        index = self._require_index()
+        chunks = split_chunks(" ".join(text.split()), settings.KNOWLEDGE_BASE_CHUNK_CHARS)
+        if not chunks:
+            raise ValueError("Document has no text to index")
+        
+        replaces = None
+        if source:
+            replaces = next((doc_id for doc_id, doc in index.documents.items() if doc.get("source") == source), None)
+        document_id = uuid.uuid4().hex
+        metadata = {"title": title, "source": source, "characters": len(text), "created": time.time()}
+        
+        started = time.perf_counter()
+        stored = await asyncio.to_thread(index.add, document_id, metadata, chunks, replaces)
+        metrics.KNOWLEDGE_INGEST_SECONDS.observe(time.perf_counter() - started)
+        logger.info(
+            f"Indexed document {document_id} ({title!r}, {len(chunks)} chunks)"
+            + (f", replacing {replaces}" if replaces else "")
+        )
+        return {"id": document_id, **stored}
+    
+    async def delete_document(self, document_id: str) -> bool:
+        """
+        Remove a document from the index.
+        
+        Returns:
+            False if no such document exists
+        """
+        removed = await asyncio.to_thread(self._require_index().remove, document_id)
+        if removed:
+            logger.info(f"Removed document {document_id} from the knowledge base")
+        return removed
+    
+    def search(self, query: str) -> list[tuple[str, str, float]]:
+        """
+        Passages most relevant to a query within KNOWLEDGE_BASE_MAX_CHARS.
+        
+        Args:
+            query: The user's message
+        
+        Returns:
+            (document title, passage, score) triples, best first
+        """
+        index = self._require_index()
+        started = time.perf_counter()
+        hits = index.search(query, limit=settings.KNOWLEDGE_BASE_TOP_K, min_score=settings.KNOWLEDGE_BASE_MIN_SCORE)
+        metrics.KNOWLEDGE_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        
+        passages = []
+        used = 0
+        for hit in hits:
+            if used + len(hit.text) > settings.KNOWLEDGE_BASE_MAX_CHARS:
+                continue
+            document = index.documents.get(hit.document_id, {})
+            passages.append((document.get("title", ""), hit.text, hit.score))
+            used += len(hit.text)
+        metrics.KNOWLEDGE_PASSAGES.observe(len(passages))
+        return passages
+    
+    def retrieve(self, query: str) -> Optional[str]:
+        """
+        Knowledge base context for a chat message, one block per passage.
+        
+        Args:
+            query: The user's message
+        
+        Returns:
+            Formatted passages for the prompt, or None if nothing matched
+        """
+        passages = self.search(query)
+        if not passages:
+            return None
+        logger.info(f"📚 Knowledge base matched {len(passages)} passages")
+        blocks = [f"[{title}] {passage}" for title, passage, _ in passages]
+        return KNOWLEDGE_HEADING + "\n\n" + "\n\n".join(blocks)
+    
+    def close(self) -> None:
+        """Close the on-disk index."""
+        if self.index is not None:
+            self.index.close()
+            self.index = None
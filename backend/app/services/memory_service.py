@@ -1,10 +1,115 @@
 """
 Conversation memory management using Redis.
 """
+import hashlib
 import json
-from redis import Redis
+from collections import Counter
+from typing import Optional
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from app.core import metrics
 from app.core.config import settings
 from app.utils.logger import logger
+from app.utils.text_ranker import bm25_idf, bm25_term_score, tokenize
+
+
+# Converts a legacy JSON-array session blob into a list in place, keeping its TTL.
+# Returns the number of migrated messages, 0 if the key is not a legacy blob,
+# or -1 if the blob was unreadable and has been dropped.
+MIGRATE_LEGACY_SCRIPT = """
+local key = KEYS[1]
+if redis.call('TYPE', key).ok ~= 'string' then
+    return 0
+end
+local ttl = redis.call('PTTL', key)
+local ok, messages = pcall(cjson.decode, redis.call('GET', key))
+redis.call('DEL', key)
+if not ok or type(messages) ~= 'table' then
+    return -1
+end
+for _, message in ipairs(messages) do
+    redis.call('RPUSH', key, cjson.encode(message))
+end
+redis.call('LTRIM', key, -tonumber(ARGV[1]), -1)
+if ttl > 0 then
+    redis.call('PEXPIRE', key, ttl)
+end
+return #messages
+"""
+
+# Replaces the oldest messages of a session with a new running summary, but
+# only if they are still exactly the messages that were summarized (the list
+# may have been trimmed, reset or rewritten meanwhile). The summary inherits
+# the session's TTL. Returns 1 if folded, 0 if the messages had changed.
+FOLD_SUMMARY_SCRIPT = """
+local key = KEYS[1]
+local count = #ARGV - 1
+local head = redis.call('LRANGE', key, 0, count - 1)
+if #head ~= count then
+    return 0
+end
+for i = 1, count do
+    if head[i] ~= ARGV[i + 1] then
+        return 0
+    end
+end
+redis.call('LTRIM', key, count, -1)
+local ttl = redis.call('PTTL', key)
+if ttl > 0 then
+    redis.call('SET', KEYS[2], ARGV[1], 'PX', ttl)
+else
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+# Postings per hash field in the postings key. A term's postings are split
+# into fields "term#0", "term#1", ... of this many entries, with their count
+# in "term#n", so archiving a turn rewrites at most one block per term
+# instead of the term's whole posting list.
+POSTINGS_BLOCK = 32
+
+# Adds a turn to a session's archive: the turn itself under a new sequential id
+# in KEYS[1], and one "id:frequency:length" posting per term appended to the
+# term's last block in KEYS[2]. ARGV is the TTL, the encoded turn, its term
+# count, then term/frequency pairs. Returns the turn id.
+ARCHIVE_TURN_SCRIPT = """
+local id = redis.call('HINCRBY', KEYS[1], 'turns', 1)
+redis.call('HINCRBY', KEYS[1], 'terms', ARGV[3])
+redis.call('HSET', KEYS[1], 'turn:' .. id, ARGV[2])
+for i = 4, #ARGV, 2 do
+    local count = redis.call('HINCRBY', KEYS[2], ARGV[i] .. '#n', 1)
+    local field = ARGV[i] .. '#' .. math.floor((count - 1) / %(block)d)
+    local block = redis.call('HGET', KEYS[2], field) or ''
+    redis.call('HSET', KEYS[2], field, block .. id .. ':' .. ARGV[i + 1] .. ':' .. ARGV[3] .. ' ')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return id
+""" % {"block": POSTINGS_BLOCK}
+
+# Reads the postings of each term in ARGV from KEYS[1]; returns one
+# space-separated posting string per term. The bare term field holds postings
+# written before they were split into blocks.
+RECALL_POSTINGS_SCRIPT = """
+local result = {}
+for i, term in ipairs(ARGV) do
+    local count = tonumber(redis.call('HGET', KEYS[1], term .. '#n') or '0')
+    local fields = {term}
+    for block = 0, math.floor((count - 1) / %(block)d) do
+        fields[#fields + 1] = term .. '#' .. block
+    end
+    local parts = {}
+    for _, postings in ipairs(redis.call('HMGET', KEYS[1], unpack(fields))) do
+        if postings then
+            parts[#parts + 1] = postings
+        end
+    end
+    result[i] = table.concat(parts)
+end
+return result
+""" % {"block": POSTINGS_BLOCK}
 
 
 class MemoryService:
@@ -14,12 +119,70 @@ class MemoryService:
         self.redis = redis_client
         self.ttl = settings.SESSION_TTL_SECONDS
         self.max_messages = settings.MAX_HISTORY_MESSAGES
+        self._migrate_legacy = self.redis.register_script(MIGRATE_LEGACY_SCRIPT)
+        self._fold_summary = self.redis.register_script(FOLD_SUMMARY_SCRIPT)
+        self._archive_turn = self.redis.register_script(ARCHIVE_TURN_SCRIPT)
+        self._recall_postings = self.redis.register_script(RECALL_POSTINGS_SCRIPT)
     
     def _get_key(self, session_id: str) -> str:
         """Generate Redis key for a session."""
         return f"session:{session_id}"
     
-    def get_history(self, session_id: str) -> list[dict]:
+    def _get_context_key(self, session_id: str) -> str:
+        """Generate Redis key for a session's Ollama KV context."""
+        return f"context:{session_id}"
+    
+    def _get_summary_key(self, session_id: str) -> str:
+        """Generate Redis key for a session's running summary of folded messages."""
+        return f"summary:{session_id}"
+    
+    def _get_archive_key(self, session_id: str) -> str:
+        """Generate Redis key for a session's archived turns and their counts."""
+        return f"archive:{session_id}"
+    
+    def _get_postings_key(self, session_id: str) -> str:
+        """Generate Redis key for the term postings of a session's archived turns."""
+        return f"postings:{session_id}"
+    
+    @staticmethod
+    def _decode_summary(session_id: str, raw: Optional[str]) -> Optional[dict]:
+        """Decode a stored summary record ({"text", "messages"}), or None."""
+        if not raw or isinstance(raw, Exception):
+            return None
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning(f"Discarding unreadable summary for session {session_id}")
+            return None
+    
+    @staticmethod
+    def _reply_digest(content: str) -> str:
+        """Fingerprint of the assistant reply a stored context ends with."""
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+    
+    async def _migrate_key(self, key: str) -> int:
+        """Convert a legacy JSON blob session to a Redis list."""
+        migrated = await self._migrate_legacy(keys=[key], args=[self.max_messages])
+        if migrated > 0:
+            logger.info(f"Migrated {migrated} messages in {key} to list storage")
+        elif migrated < 0:
+            logger.error(f"Dropped unreadable legacy history in {key}")
+        return migrated
+    
+    async def migrate_legacy_sessions(self) -> int:
+        """
+        Convert every legacy JSON blob session to list storage.
+        
+        Returns:
+            Number of sessions migrated
+        """
+        migrated = 0
+        async for key in self.redis.scan_iter(match="session:*", count=500, _type="string"):
+            if await self._migrate_key(key) > 0:
+                migrated += 1
+        return migrated
+    
+    async def get_history(self, session_id: str) -> list[dict]:
         """
         Retrieve conversation history for a session.
         
@@ -31,54 +194,308 @@ class MemoryService:
         """
         key = self._get_key(session_id)
         try:
-            data = self.redis.get(key)
-            if data is None:
+            with metrics.REDIS_OPERATION_SECONDS.labels(operation="read").time():
+                items = await self.redis.lrange(key, 0, -1)
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            await self._migrate_key(key)
+            items = await self.redis.lrange(key, 0, -1)
+        return self._decode_history(session_id, items)
+    
+    async def get_history_with_context(
+        self,
+        session_id: str
+    ) -> tuple[list[dict], Optional[list[int]], Optional[str]]:
+        """
+        Retrieve conversation history, the Ollama context and the running
+        summary in one round trip.
+        
+        The context is only returned when it was produced by the turn that
+        ends the current history for the configured model; otherwise it is
+        stale and callers should rebuild the prompt from history.
+        
+        Args:
+            session_id: Unique session identifier
+        
+        Returns:
+            Tuple of the message list, the context tokens (or None) and the
+            summary of messages older than the list (or None)
+        """
+        key = self._get_key(session_id)
+        with metrics.REDIS_OPERATION_SECONDS.labels(operation="read").time():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(key, 0, -1)
+                pipe.get(self._get_context_key(session_id))
+                pipe.get(self._get_summary_key(session_id))
+                items, raw_context, raw_summary = await pipe.execute(raise_on_error=False)
+        
+        if isinstance(items, ResponseError):
+            if "WRONGTYPE" not in str(items):
+                raise items
+            await self._migrate_key(key)
+            items = await self.redis.lrange(key, 0, -1)
+        history = self._decode_history(session_id, items)
+        summary_record = self._decode_summary(session_id, raw_summary) if history else None
+        summary = summary_record.get("text") if summary_record else None
+        
+        if not raw_context or isinstance(raw_context, Exception) or not history:
+            return history, None, summary
+        try:
+            record = json.loads(raw_context)
+        except json.JSONDecodeError:
+            logger.warning(f"Discarding unreadable context for session {session_id}")
+            return history, None, summary
+        last = history[-1]
+        if (
+            record.get("model") != settings.OLLAMA_MODEL
+            or last.get("role") != "assistant"
+            or record.get("reply") != self._reply_digest(last.get("content", ""))
+        ):
+            logger.debug(f"Stored context for session {session_id} is stale")
+            return history, None, summary
+        return history, record.get("tokens"), summary
+    
+    async def get_summary_state(self, session_id: str) -> tuple[list[str], Optional[dict]]:
+        """
+        Read the raw stored messages and the summary record for summarization.
+        
+        Args:
+            session_id: Unique session identifier
+        
+        Returns:
+            Tuple of the encoded list elements, oldest first, and the summary
+            record ({"text", "messages"}) or None
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.lrange(self._get_key(session_id), 0, -1)
+            pipe.get(self._get_summary_key(session_id))
+            items, raw_summary = await pipe.execute(raise_on_error=False)
+        if isinstance(items, Exception):
+            return [], None
+        return items, self._decode_summary(session_id, raw_summary)
+    
+    async def fold_into_summary(self, session_id: str, folded: list[str], summary: str, messages: int) -> bool:
+        """
+        Atomically drop the oldest messages and store the summary that replaces them.
+        
+        Args:
+            session_id: Unique session identifier
+            folded: Encoded list elements the summary covers, as read by get_summary_state
+            summary: New running summary text
+            messages: Total number of messages the summary now covers
+        
+        Returns:
+            True if folded, False if the oldest messages changed in the meantime
+        """
+        record = json.dumps({"text": summary, "messages": messages})
+        with metrics.REDIS_OPERATION_SECONDS.labels(operation="fold").time():
+            folded_ok = await self._fold_summary(
+                keys=[self._get_key(session_id), self._get_summary_key(session_id)],
+                args=[record, *folded]
+            )
+        return bool(folded_ok)
+    
+    def _decode_history(self, session_id: str, items: list[str]) -> list[dict]:
+        """Decode raw list elements into message dictionaries."""
+        try:
+            if not items:
                 logger.debug(f"No history found for session {session_id}")
                 return []
-            history = json.loads(data)
+            history = [json.loads(item) for item in items]
             logger.debug(f"Retrieved {len(history)} messages for session {session_id}")
             return history
         except (json.JSONDecodeError, TypeError) as e:
             logger.error(f"Error decoding history for session {session_id}: {e}")
             return []
     
-    def append_message(self, session_id: str, role: str, content: str) -> None:
+    def _archive_args(self, messages: list[dict]) -> Optional[list]:
+        """ARCHIVE_TURN_SCRIPT arguments for a turn, or None if it has no searchable terms."""
+        turn = {m["role"]: m["content"] for m in messages}
+        terms = Counter(tokenize(" ".join(m["content"] for m in messages)))
+        if not terms:
+            return None
+        args = [self.ttl, json.dumps(turn), sum(terms.values())]
+        for term, frequency in terms.items():
+            args.extend((term, frequency))
+        return args
+    
+    async def recall_turns(self, session_id: str, query: str, exclude_recent: int, limit: int) -> list[dict]:
         """
-        Append a message to the conversation history and refresh TTL.
+        Archived turns most relevant to a message, by BM25 over the session's turns.
+        
+        Only the postings of the message's own terms are read, so the cost
+        follows the number of matching turns rather than the session length.
         
         Args:
             session_id: Unique session identifier
-            role: Message role ('user' or 'assistant')
-            content: Message content
+            query: The user's message
+            exclude_recent: Number of newest turns to skip because they are still in the history
+            limit: Maximum number of turns to return
+        
+        Returns:
+            Turns as {"user", "assistant", "score"} dictionaries, least relevant first
         """
-        key = self._get_key(session_id)
+        terms = sorted(set(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+        archive_key = self._get_archive_key(session_id)
+        with metrics.REDIS_OPERATION_SECONDS.labels(operation="recall").time():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hmget(archive_key, "turns", "terms")
+                await self._recall_postings(keys=[self._get_postings_key(session_id)], args=terms, client=pipe)
+                (turn_count, term_count), postings = await pipe.execute()
+            turn_count = int(turn_count or 0)
+            newest = turn_count - exclude_recent
+            if newest <= 0:
+                return []
+            avg_length = int(term_count or 0) / turn_count
+            
+            scores: dict[int, float] = {}
+            for raw in postings:
+                if not raw:
+                    continue
+                entries = [entry.split(":") for entry in raw.split()]
+                idf = bm25_idf(turn_count, len(entries))
+                for turn_id, frequency, length in entries:
+                    turn_id = int(turn_id)
+                    if turn_id <= newest:
+                        scores[turn_id] = scores.get(turn_id, 0.0) + bm25_term_score(
+                            idf, int(frequency), int(length), avg_length
+                        )
+            metrics.MEMORY_RECALL_CANDIDATES.observe(len(scores))
+            
+            best = sorted(
+                (item for item in scores.items() if item[1] >= settings.LONG_TERM_MEMORY_MIN_SCORE),
+                key=lambda item: item[1],
+                reverse=True
+            )[:limit]
+            if not best:
+                return []
+            raw_turns = await self.redis.hmget(archive_key, [f"turn:{turn_id}" for turn_id, _ in best])
         
-        # Get existing history
-        history = self.get_history(session_id)
+        recalled = []
+        for (turn_id, score), raw in zip(reversed(best), reversed(raw_turns)):
+            if raw:
+                turn = json.loads(raw)
+                recalled.append({"user": turn.get("user", ""), "assistant": turn.get("assistant", ""), "score": score})
+        logger.debug(f"Recalled {len(recalled)} of {turn_count} archived turns for session {session_id}")
+        return recalled
+    
+    async def append_messages(
+        self,
+        session_id: str,
+        messages: list[dict],
+        context: Optional[list[int]] = None,
+        archive: bool = False
+    ) -> int:
+        """
+        Append messages to the conversation history and refresh TTL in one round trip.
         
-        # Append new message
-        history.append({
-            "role": role,
-            "content": content
-        })
+        Args:
+            session_id: Unique session identifier
+            messages: Message dictionaries with 'role' and 'content' keys
+            context: Ollama context tokens produced by the last message, if any;
+                any previously stored context is dropped when omitted
+            archive: Also index the messages as one turn for `recall_turns`
         
-        # Keep only last N messages
-        if len(history) > self.max_messages:
-            history = history[-self.max_messages:]
+        Returns:
+            Number of messages stored for the session afterwards
+        """
+        key = self._get_key(session_id)
+        encoded = [json.dumps({"role": m["role"], "content": m["content"]}) for m in messages]
+        context_record = None
+        if context and messages[-1]["role"] == "assistant":
+            context_record = json.dumps({
+                "model": settings.OLLAMA_MODEL,
+                "reply": self._reply_digest(messages[-1]["content"]),
+                "tokens": context
+            })
+        archive_args = self._archive_args(messages) if archive else None
         
-        # Save back to Redis with TTL
         try:
-            self.redis.setex(
-                key,
-                self.ttl,
-                json.dumps(history)
-            )
-            logger.debug(f"Appended {role} message to session {session_id}, TTL refreshed")
+            try:
+                length = await self._write_messages(session_id, encoded, context_record, archive_args)
+            except ResponseError as e:
+                if "WRONGTYPE" not in str(e):
+                    raise
+                await self._migrate_key(key)
+                length = await self._write_messages(session_id, encoded, context_record, archive_args)
+            logger.debug(f"Appended {len(messages)} messages to session {session_id}, TTL refreshed")
+            return length
         except Exception as e:
             logger.error(f"Error saving history for session {session_id}: {e}")
             raise
     
-    def reset_session(self, session_id: str) -> None:
+    async def _write_messages(
+        self,
+        session_id: str,
+        encoded: list[str],
+        context_record: Optional[str],
+        archive_args: Optional[list] = None
+    ) -> int:
+        """
+        RPUSH, keep only the last N messages, store the context, archive the
+        turn if given and refresh the TTLs atomically; returns the stored list
+        length.
+        """
+        key = self._get_key(session_id)
+        context_key = self._get_context_key(session_id)
+        with metrics.REDIS_OPERATION_SECONDS.labels(operation="write").time():
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, *encoded)
+                pipe.ltrim(key, -self.max_messages, -1)
+                pipe.expire(key, self.ttl)
+                pipe.expire(self._get_summary_key(session_id), self.ttl)
+                if archive_args:
+                    await self._archive_turn(
+                        keys=[self._get_archive_key(session_id), self._get_postings_key(session_id)],
+                        args=archive_args,
+                        client=pipe
+                    )
+                if context_record:
+                    pipe.set(context_key, context_record, ex=self.ttl)
+                else:
+                    pipe.delete(context_key)
+                results = await pipe.execute()
+        return min(results[0], self.max_messages)
+    
+    async def append_turn(
+        self,
+        session_id: str,
+        user_message: str,
+        assistant_reply: str,
+        context: Optional[list[int]] = None
+    ) -> int:
+        """
+        Store a user message and the assistant reply as one write.
+        
+        Args:
+            session_id: Unique session identifier
+            user_message: Message sent by the user
+            assistant_reply: Reply generated by the assistant
+            context: Ollama context tokens returned with the reply
+        
+        Returns:
+            Number of messages stored for the session afterwards
+        """
+        return await self.append_messages(session_id, [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_reply}
+        ], context=context, archive=settings.LONG_TERM_MEMORY_ENABLED)
+    
+    async def append_message(self, session_id: str, role: str, content: str) -> None:
+        """
+        Append a message to the conversation history and refresh TTL.
+        
+        Args:
+            session_id: Unique session identifier
+            role: Message role ('user' or 'assistant')
+            content: Message content
+        """
+        await self.append_messages(session_id, [{"role": role, "content": content}])
+    
+    async def reset_session(self, session_id: str) -> None:
         """
         Clear all conversation history for a session.
         
@@ -87,7 +504,13 @@ class MemoryService:
         """
         key = self._get_key(session_id)
         try:
-            deleted = self.redis.delete(key)
+            deleted = await self.redis.delete(
+                key,
+                self._get_context_key(session_id),
+                self._get_summary_key(session_id),
+                self._get_archive_key(session_id),
+                self._get_postings_key(session_id)
+            )
             if deleted:
                 logger.info(f"Session {session_id} reset successfully")
             else:
@@ -96,7 +519,7 @@ class MemoryService:
             logger.error(f"Error resetting session {session_id}: {e}")
             raise
     
-    def session_exists(self, session_id: str) -> bool:
+    async def session_exists(self, session_id: str) -> bool:
         """
         Check if a session exists in Redis.
         
@@ -107,4 +530,4 @@ class MemoryService:
             True if session exists, False otherwise
         """
         key = self._get_key(session_id)
-        return self.redis.exists(key) > 0
+        return await self.redis.exists(key) > 0
@@ -1,55 +1,361 @@
 """
 Ollama API integration for LLaMA model inference.
 """
-import requests
+import asyncio
+import hashlib
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Optional
+import httpx
+from app.core import metrics
 from app.core.config import settings
+from app.services.admission_service import AdmissionController, PRIORITY_DEFAULT
 from app.utils.logger import logger
 
 
+@dataclass
+class GenerationResult:
+    """Generated text plus the bookkeeping fields Ollama returns with it."""
+    text: str
+    context: Optional[list[int]] = None
+    prompt_eval_count: int = 0
+    eval_count: int = 0
+    eval_duration: int = 0
+    total_duration: int = 0
+    
+    @classmethod
+    def from_response(cls, text: str, data: dict) -> "GenerationResult":
+        """Build a result from the final /api/generate response object."""
+        return cls(
+            text=text,
+            context=data.get("context"),
+            prompt_eval_count=data.get("prompt_eval_count", 0),
+            eval_count=data.get("eval_count", 0),
+            eval_duration=data.get("eval_duration", 0),
+            total_duration=data.get("total_duration", 0)
+        )
+
+
+def record_generation_metrics(mode: str, data: dict, elapsed: float, ttft: Optional[float] = None) -> None:
+    """
+    Export latency and token throughput for a finished generation.
+    
+    Args:
+        mode: "stream" or "generate"
+        data: Final /api/generate response object with Ollama's counters
+        elapsed: Seconds from sending the request to the final chunk
+        ttft: Measured time to first token; derived from Ollama's own
+            durations (everything before decoding) when not given
+    """
+    eval_count = data.get("eval_count", 0)
+    eval_seconds = data.get("eval_duration", 0) / 1e9
+    if ttft is None and data.get("total_duration"):
+        ttft = max(data["total_duration"] / 1e9 - eval_seconds, 0.0)
+    if ttft is not None:
+        metrics.OLLAMA_TTFT_SECONDS.labels(mode=mode).observe(ttft)
+    metrics.OLLAMA_GENERATION_SECONDS.labels(mode=mode).observe(elapsed)
+    metrics.OLLAMA_PROMPT_EVAL_TOKENS.inc(data.get("prompt_eval_count", 0))
+    metrics.OLLAMA_EVAL_TOKENS.inc(eval_count)
+    metrics.OLLAMA_EVAL_SECONDS.inc(eval_seconds)
+    if eval_count and eval_seconds > 0:
+        metrics.OLLAMA_EVAL_TOKENS_PER_SECOND.set(eval_count / eval_seconds)
+
+
+class OllamaBackend:
+    """One Ollama host with its own connection pool, load and health state."""
+    
+    def __init__(self, url: str, timeout: int, on_health_change: Optional[Callable[[], None]] = None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self._on_health_change = on_health_change
+        self._client: httpx.AsyncClient | None = None
+        metrics.OLLAMA_BACKEND_OUTSTANDING.labels(backend=self.url).set_function(lambda: self.outstanding)
+        metrics.OLLAMA_BACKEND_HEALTHY.labels(backend=self.url).set_function(lambda: int(self.healthy))
+    
+    def get_client(self) -> httpx.AsyncClient:
+        """Get or create the keep-alive HTTP client for this host."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=httpx.Timeout(self.timeout, connect=settings.OLLAMA_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+    
+    async def close(self) -> None:
+        """Close the HTTP client and its pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def record_success(self) -> None:
+        """Reset the failure count and re-admit the host if it was ejected."""
+        self.failures = 0
+        if not self.healthy:
+            self.healthy = True
+            logger.info(f"Ollama backend {self.url} is healthy again; re-admitted")
+            if self._on_health_change:
+                self._on_health_change()
+    
+    def record_failure(self) -> None:
+        """Count a failed request or health check; eject after too many in a row."""
+        self.failures += 1
+        if self.healthy and self.failures >= settings.OLLAMA_EJECT_AFTER_FAILURES:
+            self.healthy = False
+            logger.warning(f"Ejecting Ollama backend {self.url} after {self.failures} consecutive failures")
+            if self._on_health_change:
+                self._on_health_change()
+
+
 class OllamaService:
-    """Handles communication with Ollama API."""
+    """
+    Handles communication with Ollama API.
+    
+    Requests are spread over one or more Ollama hosts. Each goes to the
+    healthy host with the fewest outstanding requests, except that a
+    session sticks to its rendezvous-hashed host (where its KV cache is
+    warm) while that host is at most OLLAMA_AFFINITY_MAX_SKEW requests
+    busier than the least loaded one. Admission capacity is
+    OLLAMA_MAX_CONCURRENT per healthy host and follows ejections and
+    re-admissions.
+    """
     
     def __init__(self):
-        self.base_url = settings.OLLAMA_BASE_URL
+        urls = settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL]
         self.model = settings.OLLAMA_MODEL
         self.timeout = settings.OLLAMA_TIMEOUT
+        self.backends = [
+            OllamaBackend(url, self.timeout, on_health_change=self._update_capacity)
+            for url in dict.fromkeys(urls)
+        ]
+        self._health_task: asyncio.Task | None = None
+        self.admission = AdmissionController(
+            max_concurrent=self._capacity(),
+            max_queue=settings.OLLAMA_QUEUE_SIZE,
+            max_wait=settings.OLLAMA_QUEUE_TIMEOUT
+        )
+        metrics.OLLAMA_IN_FLIGHT.set_function(lambda: self.admission.in_flight)
+        metrics.OLLAMA_QUEUE_DEPTH.set_function(lambda: self.admission.queued)
+    
+    def _capacity(self) -> int:
+        """Generation slots for the healthy hosts (one host's worth if none is)."""
+        healthy = sum(1 for backend in self.backends if backend.healthy)
+        return settings.OLLAMA_MAX_CONCURRENT * max(healthy, 1)
     
-    def call_ollama(self, prompt: str) -> str:
+    def _update_capacity(self) -> None:
+        """Resize admission after a host was ejected or re-admitted."""
+        capacity = self._capacity()
+        if capacity != self.admission.max_concurrent:
+            logger.info(f"Ollama admission capacity is now {capacity} slots")
+            self.admission.resize(capacity)
+    
+    def select_backend(self, session_id: Optional[str] = None) -> OllamaBackend:
         """
-        Send a prompt to Ollama and return the generated response.
+        Pick the host for a request.
         
         Args:
-            prompt: The complete prompt to send to the model
+            session_id: Session the request belongs to, for affinity
         
         Returns:
-            Generated text response from the model
-        
-        Raises:
-            Exception: If the API call fails
+            The chosen backend; ejected hosts are only used when none is healthy
         """
-        url = f"{self.base_url}/api/generate"
+        candidates = [backend for backend in self.backends if backend.healthy] or self.backends
+        least_loaded = min(candidates, key=lambda backend: (backend.outstanding, random.random()))
+        if not session_id or not settings.OLLAMA_SESSION_AFFINITY:
+            return least_loaded
         
+        preferred = max(
+            candidates,
+            key=lambda backend: hashlib.sha1(f"{backend.url}|{session_id}".encode("utf-8")).digest()
+        )
+        if preferred.outstanding <= least_loaded.outstanding + settings.OLLAMA_AFFINITY_MAX_SKEW:
+            return preferred
+        return least_loaded
+    
+    @asynccontextmanager
+    async def _use_backend(self, session_id: Optional[str]) -> AsyncIterator[OllamaBackend]:
+        """Select a backend and count the request as outstanding on it."""
+        backend = self.select_backend(session_id)
+        backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+    
+    async def _check_backend(self, backend: OllamaBackend) -> None:
+        """Probe one host with a cheap /api/tags request."""
+        try:
+            response = await backend.get_client().get("/api/tags", timeout=settings.OLLAMA_HEALTH_CHECK_TIMEOUT)
+            healthy = response.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+        if healthy:
+            backend.record_success()
+        else:
+            backend.record_failure()
+    
+    async def _health_loop(self) -> None:
+        """Check every host periodically so ejected ones can be re-admitted."""
+        while True:
+            await asyncio.gather(*(self._check_backend(backend) for backend in self.backends))
+            await asyncio.sleep(settings.OLLAMA_HEALTH_CHECK_INTERVAL)
+    
+    def start_health_checks(self) -> None:
+        """Start the background health checker if it is enabled and not running."""
+        if settings.OLLAMA_HEALTH_CHECK_INTERVAL > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def close(self) -> None:
+        """Stop health checks and close every host's HTTP client."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            await backend.close()
+        logger.info("Ollama HTTP clients closed")
+    
+    def _build_payload(
+        self,
+        prompt: str,
+        stream: bool,
+        context: Optional[list[int]] = None,
+        options: Optional[dict] = None
+    ) -> dict:
+        """Build the /api/generate request body; `options` override the default sampling options."""
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": stream,
             "options": {
                 "temperature": 0.7,
                 "top_p": 0.9,
-                "top_k": 40
+                "top_k": 40,
+                "num_ctx": settings.num_ctx_for(self.model)
             }
         }
+        if options:
+            payload["options"].update(options)
+        if context:
+            payload["context"] = context
+        return payload
+    
+    def request_key(self, prompt: str, options: Optional[dict] = None) -> str:
+        """
+        Stable hash of everything that determines a generation from a fresh
+        prompt: the model, the prompt and the sampling options.
+        """
+        payload = self._build_payload(prompt, stream=False, options=options)
+        identity = {name: payload[name] for name in ("model", "prompt", "options")}
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    async def embed(self, text: str, model: str, timeout: float) -> list[float]:
+        """
+        Embed text with Ollama's /api/embed endpoint.
+        
+        Embeddings are cheap next to generations and callers are latency
+        sensitive, so they bypass the admission queue.
+        
+        Args:
+            text: Text to embed
+            model: Embedding model name
+            timeout: Seconds before the request is abandoned
+        
+        Returns:
+            The embedding vector
+        
+        Raises:
+            Exception: If the API call fails
+        """
+        async with self._use_backend(None) as backend:
+            try:
+                response = await backend.get_client().post(
+                    "/api/embed",
+                    json={"model": model, "input": text},
+                    timeout=timeout
+                )
+            except httpx.HTTPError as e:
+                raise Exception(f"Ollama embedding request to {backend.url} failed: {str(e)}")
+            if response.status_code != 200:
+                raise Exception(f"Ollama embed API returned status {response.status_code}: {response.text}")
+            embeddings = response.json().get("embeddings") or []
+            if not embeddings:
+                raise Exception("Ollama embed API returned no embedding")
+            return embeddings[0]
+    
+    async def call_ollama(self, prompt: str) -> str:
+        """
+        Send a prompt to Ollama and return the generated response.
+        
+        Args:
+            prompt: The complete prompt to send to the model
+        
+        Returns:
+            Generated text response from the model
+        
+        Raises:
+            Exception: If the API call fails
+        """
+        result = await self.generate(prompt)
+        return result.text
+    
+    async def generate(
+        self,
+        prompt: str,
+        context: Optional[list[int]] = None,
+        priority: int = PRIORITY_DEFAULT,
+        session_id: Optional[str] = None,
+        options: Optional[dict] = None
+    ) -> GenerationResult:
+        """
+        Send a prompt to Ollama and return the response with its KV context.
+        
+        Args:
+            prompt: The prompt to send to the model
+            context: Context tokens returned by a previous call in the same
+                conversation; when given, only `prompt` is prefilled
+            priority: Admission queue priority; lower values are served first
+            session_id: Session the prompt belongs to, for backend affinity
+            options: Ollama options overriding the defaults (e.g. num_predict)
         
+        Returns:
+            Generated text along with context tokens and eval counters
+        
+        Raises:
+            AdmissionRejected: If no generation slot is available in time
+            Exception: If the API call fails
+        """
+        payload = self._build_payload(prompt, stream=False, context=context, options=options)
+        
+        async with self.admission.slot(priority), self._use_backend(session_id) as backend:
+            return await self._generate(backend, payload, context)
+    
+    async def _generate(self, backend: OllamaBackend, payload: dict, context: Optional[list[int]]) -> GenerationResult:
+        """Run one non-streaming /api/generate call while holding a slot."""
+        url = f"{backend.url}/api/generate"
         try:
             logger.info(f"Calling Ollama at {url} with model {self.model}")
-            response = requests.post(
-                url,
-                json=payload,
-                timeout=self.timeout
-            )
+            started = time.perf_counter()
+            response = await backend.get_client().post("/api/generate", json=payload)
             
             # Check for HTTP errors
             if response.status_code != 200:
+                # 4xx means a bad request (unknown model, bad options), not a bad host
+                if response.status_code >= 500:
+                    backend.record_failure()
                 error_msg = f"Ollama API returned status {response.status_code}: {response.text}"
                 logger.error(error_msg)
                 raise Exception(error_msg)
@@ -57,25 +363,36 @@ class OllamaService:
             # Parse response
             data = response.json()
             generated_text = data.get("response", "")
+            backend.record_success()
             
             if not generated_text:
                 logger.warning("Ollama returned empty response")
-                return "I apologize, but I couldn't generate a response. Please try again."
-            
-            logger.info(f"Ollama generated {len(generated_text)} characters")
-            return generated_text.strip()
+                return GenerationResult(
+                    text="I apologize, but I couldn't generate a response. Please try again."
+                )
             
-        except requests.exceptions.Timeout:
-            error_msg = f"Ollama request timed out after {self.timeout} seconds"
+            record_generation_metrics("generate", data, time.perf_counter() - started)
+            result = GenerationResult.from_response(generated_text.strip(), data)
+            logger.info(
+                f"Ollama generated {len(generated_text)} characters "
+                f"(prompt_eval_count={result.prompt_eval_count}, "
+                f"context_reused={bool(context)})"
+            )
+            return result
+        
+        except httpx.TimeoutException:
+            backend.record_failure()
+            error_msg = f"Ollama request to {backend.url} timed out after {self.timeout} seconds"
             logger.error(error_msg)
             raise Exception(error_msg)
         
-        except requests.exceptions.ConnectionError as e:
-            error_msg = f"Failed to connect to Ollama at {self.base_url}: {str(e)}"
+        except httpx.ConnectError as e:
+            backend.record_failure()
+            error_msg = f"Failed to connect to Ollama at {backend.url}: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg)
         
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             error_msg = f"Ollama request failed: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg)
@@ -84,3 +401,101 @@ class OllamaService:
             error_msg = f"Failed to parse Ollama response: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg)
+    
+    async def stream_ollama(
+        self,
+        prompt: str,
+        context: Optional[list[int]] = None,
+        priority: int = PRIORITY_DEFAULT,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Send a prompt to Ollama and yield its NDJSON stream chunk by chunk.
+        
+        The generation slot is held until the stream finishes or is closed.
+        
+        Args:
+            prompt: The complete prompt to send to the model
+            context: Context tokens from a previous call, as in `generate`
+            priority: Admission queue priority, as in `generate`
+            session_id: Session the prompt belongs to, as in `generate`
+        
+        Yields:
+            Parsed chunks with a 'response' token and a 'done' flag; the last
+            chunk has done=True
+        
+        Raises:
+            AdmissionRejected: If no generation slot is available in time
+            Exception: If the API call fails or the stream reports an error
+        """
+        payload = self._build_payload(prompt, stream=True, context=context)
+        
+        await self.admission.acquire(priority)
+        started = time.perf_counter()
+        backend = self.select_backend(session_id)
+        backend.outstanding += 1
+        url = f"{backend.url}/api/generate"
+        try:
+            logger.info(f"Streaming from Ollama at {url} with model {self.model}")
+            async with backend.get_client().stream("POST", "/api/generate", json=payload) as response:
+                if response.status_code != 200:
+                    if response.status_code >= 500:
+                        backend.record_failure()
+                    body = (await response.aread()).decode(errors="replace")
+                    error_msg = f"Ollama API returned status {response.status_code}: {body}"
+                    logger.error(error_msg)
+                    raise Exception(error_msg)
+                
+                first_token_at = None
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        error_msg = f"Ollama stream error: {chunk['error']}"
+                        logger.error(error_msg)
+                        raise Exception(error_msg)
+                    if first_token_at is None and chunk.get("response"):
+                        first_token_at = time.perf_counter()
+                    if chunk.get("done"):
+                        backend.record_success()
+                        record_generation_metrics(
+                            "stream",
+                            chunk,
+                            time.perf_counter() - started,
+                            ttft=(first_token_at - started) if first_token_at else None
+                        )
+                        logger.info(
+                            f"Ollama stream finished "
+                            f"(prompt_eval_count={chunk.get('prompt_eval_count', 0)}, "
+                            f"context_reused={bool(context)})"
+                        )
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+        
+        except httpx.TimeoutException:
+            backend.record_failure()
+            error_msg = f"Ollama request to {backend.url} timed out after {self.timeout} seconds"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        except httpx.ConnectError as e:
+            backend.record_failure()
+            error_msg = f"Failed to connect to Ollama at {backend.url}: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        except httpx.HTTPError as e:
+            error_msg = f"Ollama request failed: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        except ValueError as e:
+            error_msg = f"Failed to parse Ollama stream: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        finally:
+            backend.outstanding -= 1
+            self.admission.release(time.perf_counter() - started)
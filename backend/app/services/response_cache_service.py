@@ -0,0 +1,169 @@
+"""
+Exact-match cache of model replies to identical prompts.
+"""
+import asyncio
+from typing import AsyncIterator, Optional
+from app.core import metrics
+from app.core.config import settings
+from app.services.admission_service import PRIORITY_DEFAULT
+from app.services.cache_service import TieredCache
+from app.services.ollama_service import GenerationResult, OllamaService
+from app.utils.logger import logger
+from app.utils.singleflight import SingleFlight
+
+
+class ResponseCache:
+    """
+    Caches replies by a hash of the model, the final prompt and the sampling options.
+    
+    Only turns without a reused KV context or live search results should go
+    through it; their prompt alone determines the reply. Concurrent identical
+    prompts share one Ollama call, streamed or not. The reply's KV context is
+    cached with it, so a session served from the cache can still reuse
+    context next turn.
+    """
+    
+    def __init__(self, ollama_service: OllamaService):
+        self.ollama_service = ollama_service
+        self.cache = TieredCache(
+            namespace="llm",
+            local_size=settings.RESPONSE_CACHE_LOCAL_SIZE,
+            local_ttl=settings.RESPONSE_CACHE_TTL
+        )
+        self._flights = SingleFlight()
+    
+    async def _get(self, key: str) -> Optional[GenerationResult]:
+        cached = await self.cache.get(key)
+        if cached is None:
+            return None
+        return GenerationResult(text=cached["text"], context=cached.get("context"))
+    
+    async def generate(
+        self,
+        prompt: str,
+        priority: int = PRIORITY_DEFAULT,
+        session_id: Optional[str] = None
+    ) -> GenerationResult:
+        """
+        Reply to a prompt from the cache, or generate and cache the reply.
+        
+        Args:
+            prompt: Final prompt
+            priority: Admission queue priority for a generation
+            session_id: Session the prompt belongs to, for backend affinity
+        
+        Returns:
+            The cached or generated reply
+        """
+        key = self.ollama_service.request_key(prompt)
+        cached = await self._get(key)
+        if cached is not None:
+            metrics.RESPONSE_CACHE_REQUESTS.labels(result="hit").inc()
+            logger.info("Response cache hit")
+            return cached
+        
+        if self._flights.in_flight(key):
+            metrics.RESPONSE_CACHE_REQUESTS.labels(result="coalesced").inc()
+            logger.info("Joining in-flight generation for an identical prompt")
+        else:
+            metrics.RESPONSE_CACHE_REQUESTS.labels(result="miss").inc()
+        
+        async def fetch() -> GenerationResult:
+            result = await self.ollama_service.generate(prompt, priority=priority, session_id=session_id)
+            # The apology returned for an empty reply has no eval count; don't pin it
+            if result.eval_count:
+                await self.cache.set(
+                    key,
+                    {"text": result.text, "context": result.context},
+                    settings.RESPONSE_CACHE_TTL
+                )
+            return result
+        
+        return await self._flights.do(key, fetch)
+    
+    async def stream(
+        self,
+        prompt: str,
+        priority: int = PRIORITY_DEFAULT,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Stream the reply to a prompt from the cache, or generate and cache it.
+        
+        The first caller for a prompt streams Ollama's chunks as they arrive.
+        Identical prompts arriving meanwhile, streamed or not, share that
+        generation and get its full reply at once when it finishes, as from
+        the cache. If the caller goes away, the generation is stopped unless
+        another caller is still waiting for it.
+        
+        Args:
+            prompt: Final prompt
+            priority: Admission queue priority for a generation
+            session_id: Session the prompt belongs to, for backend affinity
+        
+        Yields:
+            Chunks shaped like OllamaService.stream_ollama's; the last has done=True
+        
+        Raises:
+            AdmissionRejected: If no generation slot is available in time
+            Exception: If the generation fails
+        """
+        key = self.ollama_service.request_key(prompt)
+        cached = await self._get(key)
+        if cached is not None:
+            metrics.RESPONSE_CACHE_REQUESTS.labels(result="hit").inc()
+            logger.info("Response cache hit")
+        else:
+            if self._flights.in_flight(key):
+                metrics.RESPONSE_CACHE_REQUESTS.labels(result="coalesced").inc()
+                logger.info("Joining in-flight generation for an identical prompt")
+            else:
+                metrics.RESPONSE_CACHE_REQUESTS.labels(result="miss").inc()
+            chunks: asyncio.Queue = asyncio.Queue()
+            
+            async def fetch() -> GenerationResult:
+                parts = []
+                async for chunk in self.ollama_service.stream_ollama(prompt, priority=priority, session_id=session_id):
+                    chunks.put_nowait(chunk)
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        result = GenerationResult.from_response("".join(parts).strip(), chunk)
+                        if result.eval_count and result.text:
+                            await self.cache.set(
+                                key,
+                                {"text": result.text, "context": result.context},
+                                settings.RESPONSE_CACHE_TTL
+                            )
+                        return result
+                return GenerationResult(text="".join(parts).strip())
+            
+            # Chunks only arrive when this call's `fetch` is the one that runs
+            shared = asyncio.create_task(self._flights.do(key, fetch))
+            streamed = False
+            try:
+                while not shared.done() or not chunks.empty():
+                    if chunks.empty():
+                        getter = asyncio.ensure_future(chunks.get())
+                        await asyncio.wait({getter, shared}, return_when=asyncio.FIRST_COMPLETED)
+                        if not getter.done():
+                            getter.cancel()
+                            continue
+                        chunk = getter.result()
+                    else:
+                        chunk = chunks.get_nowait()
+                    if chunk.get("done"):
+                        # Let the reply be cached before the caller sees the end of the stream
+                        await shared
+                    streamed = True
+                    yield chunk
+                    if chunk.get("done"):
+                        return
+                cached = shared.result()
+            finally:
+                if not shared.done():
+                    shared.cancel()
+            if streamed:
+                return
+        
+        yield {"response": cached.text, "done": False}
+        yield {"response": "", "done": True, "context": cached.context}
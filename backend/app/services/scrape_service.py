@@ -1,23 +1,60 @@
 """
 Web scraping service using BeautifulSoup for extracting content from URLs.
 """
-import requests
+import asyncio
+import hashlib
+import time
+from typing import Optional
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import httpx
 from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+from app.core import metrics
 from app.core.config import settings
+from app.services.cache_service import TieredCache
+from app.utils.html_text import SKIP_TAGS, IncrementalTextExtractor
 from app.utils.logger import logger
 
+# Bytes collected before each hand-off to the incremental parser's worker thread
+FEED_BATCH_BYTES = 64 * 1024
+
+
+class ScrapeRejected(Exception):
+    """The response is not something we should download and parse."""
+
 
 class ScrapeService:
     """Handles web scraping functionality."""
     
     def __init__(self):
         self.timeout = settings.SCRAPE_TIMEOUT
-        self.max_chars = settings.SCRAPE_MAX_CHARS
+        # With ranking on, keep most of the page; passages are selected per message later
+        self.max_chars = settings.SCRAPE_MAX_PAGE_CHARS if settings.SCRAPE_RANKING_ENABLED else settings.SCRAPE_MAX_CHARS
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                           "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
+        self.cache = TieredCache(
+            namespace="scrape",
+            local_size=settings.SCRAPE_CACHE_LOCAL_SIZE,
+            local_ttl=settings.SCRAPE_CACHE_TTL
+        )
+        self._client: httpx.AsyncClient | None = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get or create the shared HTTP client used for fetching pages."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                follow_redirects=True
+            )
+        return self._client
+    
+    async def close(self) -> None:
+        """Close the shared HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     def _validate_url(self, url: str) -> bool:
         """
@@ -35,6 +72,48 @@ class ScrapeService:
         except Exception:
             return False
     
+    def _normalize_url(self, url: str) -> str:
+        """
+        Canonicalize a URL so equivalent spellings share a cache entry.
+        
+        Lowercases scheme and host, drops default ports and the fragment,
+        sorts query parameters and uses "/" for an empty path.
+        
+        Args:
+            url: Validated URL
+        
+        Returns:
+            Normalized URL
+        """
+        parts = urlparse(url)
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower()
+        port = parts.port
+        if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+            host = f"{host}:{port}"
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return urlunparse((scheme, host, parts.path or "/", parts.params, query, ""))
+    
+    def _cache_key(self, url: str) -> str:
+        """Cache key for a normalized URL."""
+        return hashlib.sha1(self._normalize_url(url).encode("utf-8")).hexdigest()
+    
+    def _is_fresh(self, entry: dict) -> bool:
+        """Whether a cached entry can be served without contacting the origin."""
+        age = time.time() - entry.get("fetched_at", 0)
+        if entry.get("error"):
+            return age < settings.SCRAPE_NEGATIVE_CACHE_TTL
+        return age < settings.SCRAPE_CACHE_TTL
+    
+    async def _store(self, key: str, entry: dict) -> None:
+        """Write an entry to the cache with the TTL for its kind."""
+        if entry.get("error"):
+            ttl = settings.SCRAPE_NEGATIVE_CACHE_TTL
+        else:
+            ttl = max(settings.SCRAPE_CACHE_STALE_TTL, settings.SCRAPE_CACHE_TTL)
+        if ttl > 0:
+            await self.cache.set(key, entry, ttl)
+    
     def _clean_text(self, soup: BeautifulSoup) -> str:
         """
         Extract and clean visible text from BeautifulSoup object.
@@ -46,7 +125,7 @@ class ScrapeService:
             Cleaned text content
         """
         # Remove unwanted tags
-        for tag in soup(["script", "style", "nav", "header", "footer", "aside", "form", "button"]):
+        for tag in soup(list(SKIP_TAGS)):
             tag.decompose()
         
         # Get text
@@ -57,17 +136,29 @@ class ScrapeService:
         chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
         text = " ".join(chunk for chunk in chunks if chunk)
         
-        # Limit length
+        return self._truncate(text)
+    
+    def _truncate(self, text: str) -> str:
+        """Limit cleaned text to the page text budget."""
         if len(text) > self.max_chars:
             text = text[:self.max_chars] + "..."
             logger.debug(f"Truncated scraped text to {self.max_chars} characters")
-        
         return text
     
-    def scrape_website(self, url: str) -> str:
+    def _parse(self, content: bytes) -> str:
+        """Parse HTML bytes with BeautifulSoup and return cleaned text."""
+        soup = BeautifulSoup(content, "lxml")
+        return self._clean_text(soup)
+    
+    async def scrape_website(self, url: str) -> str:
         """
         Fetch a URL and return cleaned text content.
         
+        Cleaned text is cached per normalized URL. Fresh entries are served
+        directly; stale ones are revalidated with a conditional GET, and a 304
+        reuses the cached text without parsing the page again. Failures are
+        cached for SCRAPE_NEGATIVE_CACHE_TTL seconds.
+        
         Args:
             url: URL to scrape
         
@@ -80,52 +171,228 @@ class ScrapeService:
             logger.warning(error_msg)
             return f"[Scraping Error: {error_msg}]"
         
+        key = self._cache_key(url)
+        cached: Optional[dict] = None
+        if settings.SCRAPE_CACHE_ENABLED:
+            cached = await self.cache.get(key)
+            if cached and self._is_fresh(cached):
+                metrics.SCRAPE_CACHE_REQUESTS.labels(result="hit").inc()
+                logger.info(f"Scrape cache hit for {url}")
+                return cached.get("error") or cached["text"]
+            metrics.SCRAPE_CACHE_REQUESTS.labels(result="stale" if cached else "miss").inc()
+        
+        # Stale successful entries can be revalidated instead of re-downloaded
+        revalidate = cached if cached and not cached.get("error") else None
+        
+        entry = await self._fetch(url, revalidate)
+        if settings.SCRAPE_CACHE_ENABLED:
+            await self._store(key, entry)
+        return entry.get("error") or entry["text"]
+    
+    async def scrape_many(self, urls: list[str], deadline: float, per_host: int) -> dict[str, str]:
+        """
+        Scrape several URLs concurrently under one deadline.
+        
+        At most `per_host` fetches run against the same host at a time. Pages
+        that are not done when the deadline passes are cancelled and left out,
+        so one slow host cannot hold up the others.
+        
+        Args:
+            urls: URLs to scrape
+            deadline: Seconds to wait for all of them
+            per_host: Concurrent fetches allowed per host
+        
+        Returns:
+            Cleaned text keyed by URL, for the pages scraped successfully in time
+        """
+        slots: dict[str, asyncio.Semaphore] = {}
+        
+        async def limited(url: str) -> str:
+            host = (urlparse(url).hostname or "").lower()
+            slot = slots.setdefault(host, asyncio.Semaphore(per_host))
+            async with slot:
+                return await self.scrape_website(url)
+        
+        tasks = {asyncio.create_task(limited(url)): url for url in dict.fromkeys(urls)}
+        if not tasks:
+            return {}
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=deadline)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        for task in pending:
+            logger.info(f"Dropped {tasks[task]}: not scraped within the {deadline}s deadline")
+        pages = {}
+        for task in done:
+            if task.exception() is not None:
+                logger.error(f"Scraping {tasks[task]} failed: {task.exception()}")
+                continue
+            text = task.result()
+            if text and not text.startswith("[Scraping Error"):
+                pages[tasks[task]] = text
+        return pages
+    
+    def _check_headers(self, response: httpx.Response) -> None:
+        """
+        Reject responses by Content-Type and Content-Length before reading the body.
+        
+        Raises:
+            ScrapeRejected: If the body is not HTML/text or is declared too large
+        """
+        content_type = response.headers.get("Content-Type", "")
+        mime = content_type.split(";")[0].strip().lower()
+        if mime and mime not in settings.SCRAPE_ALLOWED_CONTENT_TYPES:
+            raise ScrapeRejected(f"Unsupported content type {mime}")
+        
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > settings.SCRAPE_MAX_BYTES:
+            raise ScrapeRejected(f"Page too large ({int(length)} bytes, limit {settings.SCRAPE_MAX_BYTES})")
+    
+    async def _read_body(self, response: httpx.Response) -> tuple[bytes, Optional[str]]:
+        """
+        Stream the body up to SCRAPE_MAX_BYTES.
+        
+        With SCRAPE_EXTRACTOR=lxml, chunks are fed to an incremental lxml
+        parser in FEED_BATCH_BYTES batches on a worker thread; as soon as it
+        has collected more visible text than will be kept, the rest of the
+        page is not downloaded. With bs4 the body is parsed once, after the
+        download, so it is only read here.
+        
+        Args:
+            response: Streaming response with validated headers
+        
+        Returns:
+            Body bytes read so far, and the visible text the parser collected
+            (None when the incremental parser is not used)
+        """
+        extractor = None
+        if settings.SCRAPE_EXTRACTOR == "lxml":
+            extractor = IncrementalTextExtractor(
+                limit=self.max_chars + 1,
+                # Without a charset header the parser sniffs <meta charset>
+                encoding=response.charset_encoding
+            )
+        body = bytearray()
+        fed = 0
+        async for chunk in response.aiter_bytes():
+            remaining = settings.SCRAPE_MAX_BYTES - len(body)
+            body.extend(chunk[:remaining])
+            if extractor is not None and len(body) - fed >= FEED_BATCH_BYTES:
+                await asyncio.to_thread(extractor.feed, bytes(body[fed:]))
+                fed = len(body)
+                if extractor.done:
+                    logger.debug(f"Collected enough text after {len(body)} bytes; stopping download")
+                    break
+            if len(body) >= settings.SCRAPE_MAX_BYTES:
+                logger.info(f"Stopped reading {response.url} at the {settings.SCRAPE_MAX_BYTES} byte budget")
+                break
+        if extractor is None:
+            return bytes(body), None
+        
+        def finish() -> str:
+            extractor.feed(bytes(body[fed:]))
+            return extractor.close()
+        
+        return bytes(body), await asyncio.to_thread(finish)
+    
+    async def _fetch(self, url: str, cached: Optional[dict]) -> dict:
+        """
+        Download and clean a page, revalidating a cached copy when possible.
+        
+        The body is streamed: Content-Type and Content-Length are checked
+        before reading, and reading stops at the byte budget or once enough
+        visible text has been collected.
+        
+        Args:
+            url: URL to fetch
+            cached: Stale successful cache entry, if any
+        
+        Returns:
+            Cache entry with either 'text' or 'error'
+        """
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        
         try:
             logger.info(f"Scraping URL: {url}")
             
             # Fetch URL
-            response = requests.get(
-                url,
-                headers=self.headers,
-                timeout=self.timeout,
-                allow_redirects=True
-            )
+            started = time.perf_counter()
+            async with self._get_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and cached:
+                    metrics.SCRAPE_CACHE_REQUESTS.labels(result="revalidated").inc()
+                    logger.info(f"Scrape cache revalidated for {url}")
+                    return {**cached, "fetched_at": time.time()}
+                
+                # Check status code
+                if response.status_code != 200:
+                    error_msg = f"HTTP {response.status_code} error for {url}"
+                    logger.warning(error_msg)
+                    return self._error_entry(error_msg, cached)
+                
+                self._check_headers(response)
+                content, streamed_text = await self._read_body(response)
+            metrics.SCRAPE_SECONDS.labels(phase="fetch").observe(time.perf_counter() - started)
             
-            # Check status code
-            if response.status_code != 200:
-                error_msg = f"HTTP {response.status_code} error for {url}"
-                logger.warning(error_msg)
-                return f"[Scraping Error: {error_msg}]"
-            
-            # Parse HTML
-            soup = BeautifulSoup(response.content, "lxml")
-            
-            # Extract and clean text
-            cleaned_text = self._clean_text(soup)
+            if settings.SCRAPE_EXTRACTOR == "lxml":
+                # Text was already extracted by the streaming parser
+                cleaned_text = self._truncate(streamed_text)
+            else:
+                # Parse HTML and extract text off the event loop
+                with metrics.SCRAPE_SECONDS.labels(phase="parse").time():
+                    cleaned_text = await asyncio.to_thread(self._parse, content)
             
             if not cleaned_text:
                 logger.warning(f"No text content extracted from {url}")
-                return "[Scraping Error: No text content found on the page]"
+                return {"error": "[Scraping Error: No text content found on the page]", "fetched_at": time.time()}
             
             logger.info(f"Successfully scraped {len(cleaned_text)} characters from {url}")
-            return cleaned_text
-            
-        except requests.exceptions.Timeout:
+            return {
+                "text": cleaned_text,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched_at": time.time()
+            }
+        
+        except ScrapeRejected as e:
+            error_msg = f"{e} for {url}"
+            logger.warning(error_msg)
+            return {"error": f"[Scraping Error: {error_msg}]", "fetched_at": time.time()}
+        
+        except httpx.TimeoutException:
             error_msg = f"Request timed out after {self.timeout} seconds for {url}"
             logger.error(error_msg)
-            return f"[Scraping Error: {error_msg}]"
+            return self._error_entry(error_msg, cached)
         
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             error_msg = f"Failed to connect to {url}"
             logger.error(error_msg)
-            return f"[Scraping Error: {error_msg}]"
+            return self._error_entry(error_msg, cached)
         
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             error_msg = f"Request failed for {url}: {str(e)}"
             logger.error(error_msg)
-            return f"[Scraping Error: {error_msg}]"
+            return self._error_entry(error_msg, cached)
         
         except Exception as e:
             error_msg = f"Unexpected error scraping {url}: {str(e)}"
             logger.error(error_msg)
-            return f"[Scraping Error: {error_msg}]"
+            return self._error_entry(error_msg, cached)
+    
+    def _error_entry(self, error_msg: str, cached: Optional[dict]) -> dict:
+        """
+        Build the cache entry for a failed fetch.
+        
+        A stale copy is kept in place of the error so a flaky origin does not
+        wipe out good content; it will be revalidated again on the next request.
+        """
+        if cached:
+            logger.info("Serving stale scraped content after fetch failure")
+            return cached
+        return {"error": f"[Scraping Error: {error_msg}]", "fetched_at": time.time()}
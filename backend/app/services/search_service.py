@@ -1,26 +1,111 @@
 """
 Web search service using DuckDuckGo for searching the internet.
 """
+import asyncio
+import hashlib
+import httpx
 from duckduckgo_search import DDGS
 from typing import List, Dict
+from app.core import metrics
+from app.core.config import settings
+from app.services.cache_service import TieredCache
 from app.utils.logger import logger
+from app.utils.singleflight import SingleFlight
 import traceback
 
 
 class SearchService:
-    """Handles web search functionality using DuckDuckGo."""
+    """
+    Handles web search functionality using DuckDuckGo.
+    
+    When SEARCH_SEARXNG_URL is set, searches go to that SearXNG-compatible
+    JSON endpoint instead (a self-hosted metasearch instance, or a stub
+    server in load tests).
+    """
     
     def __init__(self):
-        self.ddgs = DDGS()
+        self.cache = TieredCache(
+            namespace="search",
+            local_size=settings.SEARCH_CACHE_LOCAL_SIZE,
+            local_ttl=settings.SEARCH_CACHE_TTL
+        )
+        self._flights = SingleFlight()
+        self._client: httpx.AsyncClient | None = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get or create the shared HTTP client for the SearXNG endpoint."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=settings.SEARCH_SEARXNG_URL,
+                timeout=settings.SEARCH_TIMEOUT
+            )
+        return self._client
+    
+    async def close(self) -> None:
+        """Close the shared HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _normalize_query(self, query: str) -> str:
+        """Lowercase and collapse whitespace so trivially different queries share a cache entry."""
+        return " ".join(query.lower().split())
+    
+    def _cache_key(self, query: str, num_results: int) -> str:
+        """Cache key for a normalized query and result count."""
+        normalized = self._normalize_query(query)
+        return hashlib.sha1(f"{num_results}:{normalized}".encode("utf-8")).hexdigest()
     
-    def search(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
+    async def search(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """
         Search DuckDuckGo and return top results with real-time data.
         
+        Results are cached per normalized query for SEARCH_CACHE_TTL seconds,
+        and concurrent identical searches share one upstream call.
+        
         Args:
             query: Search query
             num_results: Number of results to return (default 5)
         
+        Returns:
+            List of dicts with 'title', 'url', and 'snippet'
+        """
+        key = self._cache_key(query, num_results)
+        
+        if settings.SEARCH_CACHE_TTL > 0:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                metrics.SEARCH_CACHE_REQUESTS.labels(result="hit").inc()
+                logger.info(f"🔍 Search cache hit for: {query}")
+                return cached["results"]
+        
+        if self._flights.in_flight(key):
+            metrics.SEARCH_CACHE_REQUESTS.labels(result="coalesced").inc()
+            logger.info(f"🔍 Joining in-flight search for: {query}")
+        else:
+            metrics.SEARCH_CACHE_REQUESTS.labels(result="miss").inc()
+        
+        async def fetch() -> List[Dict[str, str]]:
+            with metrics.SEARCH_SECONDS.time():
+                if settings.SEARCH_SEARXNG_URL:
+                    results = await self._search_searxng(query, num_results)
+                else:
+                    results = await asyncio.to_thread(self._search_ddg, query, num_results)
+            # Empty lists usually mean a failure or rate limit; don't pin them
+            if results and settings.SEARCH_CACHE_TTL > 0:
+                await self.cache.set(key, {"results": results}, settings.SEARCH_CACHE_TTL)
+            return results
+        
+        return await self._flights.do(key, fetch)
+    
+    def _search_ddg(self, query: str, num_results: int) -> List[Dict[str, str]]:
+        """
+        Run a blocking DuckDuckGo text search.
+        
+        Args:
+            query: Search query
+            num_results: Number of results to return
+        
         Returns:
             List of dicts with 'title', 'url', and 'snippet'
         """
@@ -30,15 +115,14 @@ class SearchService:
             # Use DuckDuckGo search library for real-time results
             results = []
             
-            # Text search for web results
-            search_results = self.ddgs.text(query, max_results=num_results)
-            
-            for result in search_results:
-                results.append({
-                    "title": result.get('title', 'No title'),
-                    "url": result.get('href', result.get('link', '')),
-                    "snippet": result.get('body', result.get('snippet', ''))
-                })
+            # Text search for web results; one client per call keeps worker threads independent
+            with DDGS() as ddgs:
+                for result in ddgs.text(query, max_results=num_results):
+                    results.append({
+                        "title": result.get('title', 'No title'),
+                        "url": result.get('href', result.get('link', '')),
+                        "snippet": result.get('body', result.get('snippet', ''))
+                    })
             
             logger.info(f"✅ Found {len(results)} real-time search results")
             
@@ -47,12 +131,42 @@ class SearchService:
                 logger.info(f"First result: {results[0]['title'][:50]}...")
             
             return results
-            
+        
         except Exception as e:
             logger.error(f"❌ Search failed: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             return []
     
+    async def _search_searxng(self, query: str, num_results: int) -> List[Dict[str, str]]:
+        """
+        Run a search against a SearXNG-compatible JSON API.
+        
+        Args:
+            query: Search query
+            num_results: Number of results to return
+        
+        Returns:
+            List of dicts with 'title', 'url', and 'snippet'
+        """
+        try:
+            logger.info(f"🔍 Searching {settings.SEARCH_SEARXNG_URL} for: {query}")
+            response = await self._get_client().get("/search", params={"q": query, "format": "json"})
+            response.raise_for_status()
+            results = [
+                {
+                    "title": result.get("title", "No title"),
+                    "url": result.get("url", ""),
+                    "snippet": result.get("content", "")
+                }
+                for result in response.json().get("results", [])[:num_results]
+            ]
+            logger.info(f"✅ Found {len(results)} real-time search results")
+            return results
+        
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"❌ Search failed: {e}")
+            return []
+    
     def format_results_for_prompt(self, results: List[Dict[str, str]]) -> str:
         """
         Format search results into a text block for the LLM prompt.
@@ -0,0 +1,139 @@
+"""
+Semantic answer cache for standalone first-turn questions.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from app.core import metrics
+from app.core.config import settings
+from app.services.ollama_service import OllamaService
+from app.utils.logger import logger
+from app.utils.vector_index import ACCESS_BATCH, VectorIndex
+
+
+@dataclass
+class SemanticMatch:
+    """Outcome of a lookup: the cached answer on a hit, and the question's embedding for storing a miss."""
+    vector: Optional[np.ndarray] = None
+    answer: Optional[str] = None
+    score: float = 0.0
+
+
+class SemanticCache:
+    """
+    Answers paraphrases of questions already answered.
+    
+    Questions are embedded through Ollama (SEMANTIC_CACHE_EMBED_MODEL) and
+    matched by cosine similarity against a VectorIndex in
+    SEMANTIC_CACHE_DIR. A match scoring at least SEMANTIC_CACHE_THRESHOLD
+    returns its stored answer without a generation. Entries expire after
+    SEMANTIC_CACHE_TTL seconds, and at SEMANTIC_CACHE_MAX_ENTRIES the least
+    recently used one is evicted. Any embedding failure is a miss.
+    """
+    
+    def __init__(self, ollama_service: OllamaService):
+        self.ollama_service = ollama_service
+        self.index: Optional[VectorIndex] = None
+        self._open_lock = asyncio.Lock()
+        metrics.SEMANTIC_CACHE_ENTRIES.set_function(lambda: len(self.index) if self.index else 0)
+    
+    @staticmethod
+    def _normalize_question(question: str) -> str:
+        return " ".join(question.lower().split())
+    
+    async def _get_index(self, dim: int) -> VectorIndex:
+        """Open the on-disk index once the embedding dimension is known."""
+        async with self._open_lock:
+            if self.index is None:
+                self.index = await asyncio.to_thread(
+                    VectorIndex,
+                    Path(settings.SEMANTIC_CACHE_DIR),
+                    dim,
+                    settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                    f"{settings.SEMANTIC_CACHE_EMBED_MODEL}|{settings.OLLAMA_MODEL}"
+                )
+                logger.info(f"Semantic cache opened with {len(self.index)} entries")
+            return self.index
+    
+    async def lookup(self, question: str) -> SemanticMatch:
+        """
+        Find a cached answer to a question or a close paraphrase of it.
+        
+        Args:
+            question: The user's message
+        
+        Returns:
+            The match; `answer` is None on a miss, `vector` is None if the
+            question could not be embedded
+        """
+        started = time.perf_counter()
+        try:
+            vector = np.asarray(
+                await self.ollama_service.embed(
+                    self._normalize_question(question),
+                    model=settings.SEMANTIC_CACHE_EMBED_MODEL,
+                    timeout=settings.SEMANTIC_CACHE_EMBED_TIMEOUT
+                ),
+                dtype=np.float32
+            )
+            index = await self._get_index(len(vector))
+            found = await asyncio.to_thread(index.search, vector) if len(vector) == index.dim else None
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            metrics.SEMANTIC_CACHE_REQUESTS.labels(result="error").inc()
+            return SemanticMatch()
+        finally:
+            metrics.SEMANTIC_CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        
+        match = SemanticMatch(vector=vector)
+        if found is None:
+            metrics.SEMANTIC_CACHE_REQUESTS.labels(result="miss").inc()
+            return match
+        slot, match.score = found
+        metrics.SEMANTIC_CACHE_SIMILARITY.observe(match.score)
+        entry = index.get(slot) if match.score >= settings.SEMANTIC_CACHE_THRESHOLD else None
+        if index.pending_access >= ACCESS_BATCH:
+            await asyncio.to_thread(index.write_access)
+        if entry is None:
+            metrics.SEMANTIC_CACHE_REQUESTS.labels(result="miss").inc()
+            return match
+        if entry["created"] + settings.SEMANTIC_CACHE_TTL < time.time():
+            await asyncio.to_thread(index.remove_where, lambda stored: stored is entry)
+            metrics.SEMANTIC_CACHE_EVICTIONS.labels(reason="expired").inc()
+            metrics.SEMANTIC_CACHE_REQUESTS.labels(result="expired").inc()
+            return match
+        
+        metrics.SEMANTIC_CACHE_REQUESTS.labels(result="hit").inc()
+        logger.info(f"Semantic cache hit ({match.score:.3f}) for {question!r} via {entry['question']!r}")
+        match.answer = entry["answer"]
+        return match
+    
+    async def add(self, match: SemanticMatch, question: str, answer: str) -> None:
+        """
+        Remember the answer to a question that missed.
+        
+        Args:
+            match: Result of `lookup` for the question
+            question: The user's message
+            answer: Generated reply
+        """
+        if match.vector is None or self.index is None or not answer or len(match.vector) != self.index.dim:
+            return
+        entry = {"question": question, "answer": answer, "created": time.time()}
+        try:
+            evicted = await asyncio.to_thread(self.index.add, match.vector, entry)
+        except Exception as e:
+            logger.warning(f"Semantic cache write failed: {e}")
+            return
+        if evicted is not None:
+            expired = evicted["created"] + settings.SEMANTIC_CACHE_TTL < time.time()
+            metrics.SEMANTIC_CACHE_EVICTIONS.labels(reason="expired" if expired else "lru").inc()
+    
+    def close(self) -> None:
+        """Flush the index to disk."""
+        if self.index is not None:
+            self.index.flush()
+            self.index = None
@@ -0,0 +1,120 @@
+"""
+Background folding of older session messages into a running summary.
+"""
+import asyncio
+import json
+import time
+from app.core import metrics
+from app.core.config import settings
+from app.services.admission_service import AdmissionRejected, PRIORITY_BACKGROUND
+from app.services.memory_service import MemoryService
+from app.services.ollama_service import OllamaService
+from app.utils.prompt_builder import build_summary_prompt, prompt_token_budget
+from app.utils.logger import logger
+
+
+class SummaryService:
+    """
+    Keeps long sessions short by summarizing their oldest messages.
+    
+    Once a session holds more than SUMMARY_TRIGGER_MESSAGES messages, a
+    background task asks the model to fold all but the newest
+    SUMMARY_KEEP_MESSAGES of them, together with the previous summary, into
+    a new summary. The fold is applied atomically and only if those messages
+    are still at the head of the list. A skipped or failed fold is simply
+    retried after the session's next turn.
+    
+    Summaries run at background priority, but once started a generation
+    holds its slot until it finishes. So a summary only starts while, on top
+    of it, SUMMARY_RESERVED_SLOTS slots would stay free for user requests
+    (all but one when there are fewer slots than that), and at most
+    SUMMARY_MAX_CONCURRENT run at once. With a single slot
+    this means only when Ollama is idle, and a request arriving during the
+    summary waits for it.
+    """
+    
+    def __init__(self, ollama_service: OllamaService):
+        self.ollama_service = ollama_service
+        self._tasks: dict[str, asyncio.Task] = {}
+    
+    def schedule(self, memory: MemoryService, session_id: str, stored_messages: int) -> None:
+        """
+        Start summarizing a session in the background if it has grown long enough.
+        
+        Args:
+            memory: Memory service bound to the Redis client
+            session_id: Unique session identifier
+            stored_messages: Number of messages the session holds after the latest write
+        """
+        if not settings.SUMMARY_ENABLED or stored_messages <= settings.SUMMARY_TRIGGER_MESSAGES:
+            return
+        if session_id in self._tasks:
+            return
+        admission = self.ollama_service.admission
+        headroom = min(settings.SUMMARY_RESERVED_SLOTS, admission.max_concurrent - 1)
+        if len(self._tasks) >= settings.SUMMARY_MAX_CONCURRENT or admission.queued or (
+            admission.in_flight + 1 + headroom > admission.max_concurrent
+        ):
+            metrics.SUMMARY_RUNS.labels(result="deferred").inc()
+            return
+        
+        task = asyncio.create_task(self._summarize(memory, session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+    
+    async def _summarize(self, memory: MemoryService, session_id: str) -> None:
+        """Fold a session's oldest messages into its summary."""
+        started = time.perf_counter()
+        result = "error"
+        try:
+            items, record = await memory.get_summary_state(session_id)
+            fold_count = len(items) - settings.SUMMARY_KEEP_MESSAGES
+            if fold_count <= 0:
+                result = "stale"
+                return
+            folded = items[:fold_count]
+            previous = record.get("text") if record else None
+            prompt = build_summary_prompt(
+                [json.loads(item) for item in folded],
+                previous_summary=previous,
+                token_budget=prompt_token_budget(),
+                max_words=settings.SUMMARY_MAX_WORDS
+            )
+            generation = await self.ollama_service.generate(
+                prompt,
+                priority=PRIORITY_BACKGROUND,
+                options={"temperature": 0.2, "num_predict": settings.SUMMARY_MAX_TOKENS}
+            )
+            summary = generation.text.strip()
+            if not generation.eval_count or not summary:
+                logger.warning(f"Empty summary for session {session_id}; keeping its messages")
+                return
+            
+            covered = (record.get("messages", 0) if record else 0) + fold_count
+            if await memory.fold_into_summary(session_id, folded, summary, covered):
+                result = "folded"
+                logger.info(
+                    f"Folded {fold_count} messages of session {session_id} into its summary "
+                    f"({covered} messages, {len(summary)} characters)"
+                )
+            else:
+                result = "stale"
+                logger.debug(f"Session {session_id} changed while summarizing; summary discarded")
+        except AdmissionRejected:
+            result = "rejected"
+            logger.debug(f"No generation slot to summarize session {session_id}; will retry next turn")
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Summarizing session {session_id} failed: {e}")
+        finally:
+            metrics.SUMMARY_RUNS.labels(result=result).inc()
+            metrics.SUMMARY_SECONDS.observe(time.perf_counter() - started)
+    
+    async def close(self) -> None:
+        """Cancel summaries still running."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
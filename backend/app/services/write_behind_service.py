@@ -0,0 +1,108 @@
+"""
+Write-behind persistence of chat turns.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+from app.core import metrics
+from app.utils.logger import logger
+
+Write = Callable[[], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """
+    Runs session writes in the background so replies do not wait for Redis.
+    
+    Writes for the same session run one after another in submission order;
+    writes for different sessions run concurrently. Readers call
+    `wait_for(session_id)` before loading a session, so a request always
+    sees the turns written before it. When disabled, or once `max_pending`
+    writes are outstanding, `persist` writes inline instead.
+    """
+    
+    def __init__(self, enabled: bool, max_pending: int, retries: int):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.retries = retries
+        self.pending = 0
+        self._tails: dict[str, asyncio.Task] = {}
+        metrics.WRITE_BEHIND_PENDING.set_function(lambda: self.pending)
+    
+    async def persist(self, session_id: str, write: Write) -> None:
+        """
+        Run `write` for a session, in the background when possible.
+        
+        Args:
+            session_id: Session the write belongs to; orders writes
+            write: Coroutine function performing the write
+        
+        Raises:
+            Exception: Whatever `write` raises, when it runs inline
+        """
+        if not self.enabled or self.pending >= self.max_pending:
+            await self.wait_for(session_id)
+            await write()
+            metrics.WRITE_BEHIND_WRITES.labels(result="inline").inc()
+            return
+        
+        previous = self._tails.get(session_id)
+        self.pending += 1
+        task = asyncio.create_task(self._run(session_id, previous, write, time.perf_counter()))
+        self._tails[session_id] = task
+        task.add_done_callback(lambda done: self._forget(session_id, done))
+    
+    def _forget(self, session_id: str, task: asyncio.Task) -> None:
+        self.pending -= 1
+        if self._tails.get(session_id) is task:
+            del self._tails[session_id]
+    
+    async def _run(self, session_id: str, previous: Optional[asyncio.Task], write: Write, submitted: float) -> None:
+        """Wait for the session's previous write, then write with retries."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        for attempt in range(self.retries + 1):
+            try:
+                await write()
+                metrics.WRITE_BEHIND_WRITES.labels(result="ok" if attempt == 0 else "retried").inc()
+                metrics.WRITE_BEHIND_LAG_SECONDS.observe(time.perf_counter() - submitted)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    metrics.WRITE_BEHIND_WRITES.labels(result="failed").inc()
+                    logger.error(f"Dropping turn for session {session_id} after {attempt + 1} failed writes: {e}")
+                    return
+                logger.warning(f"Write for session {session_id} failed, retrying: {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+    
+    async def wait_for(self, session_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every write submitted so far for a session has finished.
+        
+        Args:
+            session_id: Session whose writes to wait for
+            timeout: Seconds to wait at most, or None to wait as long as it takes
+        
+        Returns:
+            True if the writes finished, False if `timeout` ran out first
+        """
+        task = self._tails.get(session_id)
+        if task is None:
+            return True
+        _, unfinished = await asyncio.wait([task], timeout=timeout)
+        return not unfinished
+    
+    async def flush(self, timeout: float) -> None:
+        """
+        Wait for all outstanding writes, e.g. on shutdown.
+        
+        Args:
+            timeout: Seconds to wait before giving up on the rest
+        """
+        tasks = list(self._tails.values())
+        if not tasks:
+            return
+        logger.info(f"Flushing {self.pending} pending session writes")
+        _, unfinished = await asyncio.wait(tasks, timeout=timeout)
+        if unfinished:
+            logger.error(f"{len(unfinished)} sessions still had unwritten turns after {timeout}s")
@@ -0,0 +1,449 @@
+"""
+On-disk inverted index over document chunks with BM25 ranking.
+"""
+import json
+import os
+import shutil
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Optional
+import numpy as np
+from app.utils.text_ranker import bm25_idf, bm25_term_ceiling, bm25_term_score, tokenize
+
+INDEX_VERSION = 3
+POINTER = "CURRENT"
+# Postings segments a generation may reference before ingestion merges them into one
+MAX_SEGMENTS = 8
+
+
+@dataclass
+class _Segment:
+    """Postings of the chunks added by one ingestion (or a merge), never modified once written."""
+    name: str
+    vocab: dict[str, tuple[int, int]]  # term -> (first row in postings, row count)
+    postings: np.ndarray  # (rows, 2) int32: chunk id, term frequency; grouped by term
+
+
+@dataclass
+class _Snapshot:
+    """One immutable generation of the index files, swapped whole on every change."""
+    segments: list[_Segment]
+    lengths: np.ndarray  # int32 term count per chunk id, -1 once deleted
+    spans: np.ndarray  # (chunk ids, 2) int64: byte offset and length of each chunk in chunks.jsonl
+    chunks_file: BinaryIO  # this generation's chunk text file; closed when the snapshot is collected
+    generation: int = 0
+    chunks_name: str = ""
+    documents: dict[str, dict] = field(default_factory=dict)
+    live_chunks: int = 0
+    live_terms: int = 0
+
+
+@dataclass
+class ChunkHit:
+    """A ranked chunk with its text and owning document."""
+    chunk_id: int
+    score: float  # BM25 score relative to the best the query allows, 0-1
+    document_id: str
+    text: str
+
+
+class DocumentIndex:
+    """
+    BM25 index over chunked documents, stored as flat files in `directory`.
+    
+    Each generation of the index is a `gen-NNNNNN` directory holding:
+    
+    - `lengths.i32`, `spans.i64`: per-chunk term count and the byte range
+      of its text in the generation's chunk file
+    - `documents.json`: document metadata and chunk id ranges
+    - `meta.json`: counts and the names of the chunk file and segments
+    
+    Postings live in `seg-NNNNNN` directories next to the generations, each
+    with `postings.i32` ((chunk id, term frequency) rows grouped by term)
+    and `vocab.json` (each term's slice of them). Segments are immutable and
+    shared between generations: ingesting a document writes one segment
+    with only its own postings, and a query reads a term's rows from every
+    segment. Removing a document, or ingesting while MAX_SEGMENTS segments
+    exist, merges all postings into a single segment instead, so segments
+    only ever hold live chunks.
+    
+    Chunk text lives in `chunks-NNNNNN.jsonl` next to the generations. It is
+    appended to while documents are only added, since older generations
+    never read past their own spans, and rewritten when one is removed.
+    
+    The arrays are memory-mapped, so opening the index reads only the
+    vocabularies and document list, and a query touches only the postings of
+    its own terms and the text of the chunks it returns. Every change writes
+    and syncs a new generation directory, then atomically replaces the
+    `CURRENT` file naming the live one; a crash at any point leaves the
+    previous generation intact. Searches never block on ingestion. Writes
+    are serialized by a lock.
+    """
+    
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write_lock = threading.Lock()
+        self._snapshot = self._load()
+        self._remove_stale_files()
+    
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+    
+    @staticmethod
+    def _generation_name(generation: int) -> str:
+        return f"gen-{generation:06d}"
+    
+    def _map(self, generation_dir: Path, name: str, dtype, columns: int = 0) -> np.ndarray:
+        """Memory-map a flat array file read-only; empty or missing files give an empty array."""
+        path = generation_dir / name
+        size = path.stat().st_size if path.exists() else 0
+        shape = (0, columns) if columns else (0,)
+        if not size:
+            return np.zeros(shape, dtype=dtype)
+        array = np.memmap(path, dtype=dtype, mode="r")
+        return array.reshape(-1, columns) if columns else array
+    
+    def _load_segment(self, name: str) -> _Segment:
+        segment_dir = self._path(name)
+        vocab = {term: tuple(span) for term, span in json.loads((segment_dir / "vocab.json").read_text()).items()}
+        return _Segment(name, vocab, self._map(segment_dir, "postings.i32", np.int32, columns=2))
+    
+    def _load(self) -> _Snapshot:
+        """Open the generation named by CURRENT, or an empty index if there is none."""
+        pointer = self._path(POINTER)
+        if not pointer.exists():
+            chunks_name = "chunks-000000.jsonl"
+            self._path(chunks_name).touch()
+            return _Snapshot(
+                segments=[],
+                lengths=np.zeros(0, dtype=np.int32),
+                spans=np.zeros((0, 2), dtype=np.int64),
+                chunks_file=open(self._path(chunks_name), "rb"),
+                chunks_name=chunks_name
+            )
+        generation_dir = self._path(pointer.read_text().strip())
+        meta = json.loads((generation_dir / "meta.json").read_text())
+        if meta.get("version") not in (2, INDEX_VERSION):
+            raise ValueError(f"Unsupported document index version {meta.get('version')} in {self.directory}")
+        # Version 2 kept a generation's single set of postings in its own directory
+        segments = meta.get("segments", [generation_dir.name])
+        return _Snapshot(
+            segments=[self._load_segment(name) for name in segments],
+            lengths=self._map(generation_dir, "lengths.i32", np.int32),
+            spans=self._map(generation_dir, "spans.i64", np.int64, columns=2),
+            chunks_file=open(self._path(meta["chunks_file"]), "rb"),
+            generation=meta["generation"],
+            chunks_name=meta["chunks_file"],
+            documents=json.loads((generation_dir / "documents.json").read_text()),
+            live_chunks=meta["live_chunks"],
+            live_terms=meta["live_terms"]
+        )
+    
+    def _remove_stale_files(self) -> None:
+        """Delete generations and chunk files the live generation does not use, e.g. after a crash."""
+        snapshot = self._snapshot
+        keep = {
+            POINTER,
+            self._generation_name(snapshot.generation),
+            snapshot.chunks_name,
+            *(segment.name for segment in snapshot.segments)
+        }
+        for path in self.directory.iterdir():
+            if path.name in keep:
+                continue
+            if path.is_dir() and path.name.startswith(("gen-", "seg-")):
+                shutil.rmtree(path, ignore_errors=True)
+            elif path.name.startswith("chunks-") or path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+    
+    @property
+    def documents(self) -> dict[str, dict]:
+        """Document metadata keyed by document id."""
+        return self._snapshot.documents
+    
+    @property
+    def chunk_count(self) -> int:
+        """Number of searchable chunks."""
+        return self._snapshot.live_chunks
+    
+    def search(self, query: str, limit: int, min_score: float = 0.0) -> list[ChunkHit]:
+        """
+        Chunks most relevant to a query, best first.
+        
+        Raw BM25 scores grow with the corpus (through IDF), so a fixed cutoff
+        suits either a small or a large index but not both. Scores are
+        therefore divided by the best score the query's indexed terms could
+        reach, giving a corpus-independent 0-1 relevance.
+        
+        Args:
+            query: Free-text query
+            limit: Maximum number of chunks
+            min_score: Relative score a chunk needs to be returned
+        
+        Returns:
+            Ranked chunks with their text
+        """
+        snapshot = self._snapshot
+        if not snapshot.live_chunks or limit <= 0:
+            return []
+        avg_length = snapshot.live_terms / snapshot.live_chunks
+        matched_ids, matched_scores = [], []
+        ceiling = 0.0
+        for term in set(tokenize(query)):
+            parts = [
+                segment.postings[span[0]:span[0] + span[1]]
+                for segment in snapshot.segments
+                if (span := segment.vocab.get(term)) is not None
+            ]
+            if not parts:
+                continue
+            rows = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            chunk_ids = rows[:, 0]
+            idf = bm25_idf(snapshot.live_chunks, len(rows))
+            ceiling += bm25_term_ceiling(idf)
+            matched_ids.append(chunk_ids)
+            matched_scores.append(bm25_term_score(idf, rows[:, 1], snapshot.lengths[chunk_ids], avg_length))
+        if not matched_ids:
+            return []
+        
+        chunk_ids, inverse = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores)) / ceiling
+        if len(scores) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        
+        hits = []
+        for position in best:
+            score = float(scores[position])
+            if score < min_score:
+                break
+            chunk_id = int(chunk_ids[position])
+            record = self._read_chunk(snapshot, chunk_id)
+            hits.append(ChunkHit(chunk_id, score, record["document"], record["text"]))
+        return hits
+    
+    @staticmethod
+    def _read_chunk(snapshot: _Snapshot, chunk_id: int) -> dict:
+        """Read one chunk's record from the generation's chunks.jsonl."""
+        offset, length = snapshot.spans[chunk_id]
+        return json.loads(os.pread(snapshot.chunks_file.fileno(), int(length), int(offset)))
+    
+    def add(self, document_id: str, metadata: dict, chunks: list[str], replaces: Optional[str] = None) -> dict:
+        """
+        Index a document's chunks, optionally replacing another document.
+        
+        Args:
+            document_id: New document id
+            metadata: JSON-serializable metadata stored with the document
+            chunks: Chunk texts in document order
+            replaces: Id of a document to remove in the same change
+        
+        Returns:
+            The stored document metadata, including its chunk id range
+        """
+        with self._write_lock:
+            removed = {replaces} if replaces and replaces in self._snapshot.documents else set()
+            self._rewrite(removed, document_id, metadata, chunks)
+            return self._snapshot.documents[document_id]
+    
+    def remove(self, document_id: str) -> bool:
+        """
+        Remove a document and its chunks, including their text on disk.
+        
+        Returns:
+            False if the document does not exist
+        """
+        with self._write_lock:
+            if document_id not in self._snapshot.documents:
+                return False
+            self._rewrite({document_id}, None, None, [])
+            return True
+    
+    def _rewrite(
+        self,
+        removed: set[str],
+        document_id: Optional[str],
+        metadata: Optional[dict],
+        chunks: list[str]
+    ) -> None:
+        """Write the next generation of the index files and swap it in."""
+        old = self._snapshot
+        generation = old.generation + 1
+        generation_dir = self._path(self._generation_name(generation))
+        # Left over from a write that crashed before it was published
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        generation_dir.mkdir()
+        documents = {doc_id: doc for doc_id, doc in old.documents.items() if doc_id not in removed}
+        first_id = len(old.lengths)
+        lengths = np.concatenate([old.lengths, np.zeros(len(chunks), dtype=np.int32)])
+        
+        dead = np.zeros(len(lengths), dtype=bool)
+        for doc_id in removed:
+            start, end = old.documents[doc_id]["chunk_ids"]
+            dead[start:end] = True
+        
+        # Chunk text: write a new file without the removed chunks, or append to the
+        # current one; older generations never read past their own spans
+        spans = np.concatenate([old.spans, np.full((len(chunks), 2), -1, dtype=np.int64)])
+        if removed:
+            chunks_name = f"chunks-{generation:06d}.jsonl"
+            with open(self._path(chunks_name), "wb") as out:
+                for chunk_id in np.flatnonzero((old.lengths >= 0) & ~dead[:first_id]):
+                    offset, length = old.spans[chunk_id]
+                    data = os.pread(old.chunks_file.fileno(), int(length), int(offset))
+                    spans[chunk_id] = (out.tell(), len(data))
+                    out.write(data)
+                self._append_chunks(out, document_id, chunks, first_id, spans)
+                _sync(out)
+        else:
+            chunks_name = old.chunks_name
+            with open(self._path(chunks_name), "ab") as out:
+                self._append_chunks(out, document_id, chunks, first_id, spans)
+                _sync(out)
+        spans[dead] = -1
+        lengths[dead] = -1
+        
+        # Postings: a segment with only the new chunks' rows, or, after a removal or
+        # once there are MAX_SEGMENTS, one segment merging every live row
+        terms, row_terms, rows = [], [], []
+        term_ids: dict[str, int] = {}
+        
+        def term_id(term: str) -> int:
+            if term not in term_ids:
+                term_ids[term] = len(terms)
+                terms.append(term)
+            return term_ids[term]
+        
+        merge = bool(removed) or len(old.segments) >= MAX_SEGMENTS
+        if merge:
+            # A segment's rows are grouped by term in its vocab order
+            for segment in old.segments:
+                ids = [term_id(term) for term in segment.vocab]
+                counts = [count for _, count in segment.vocab.values()]
+                row_terms.append(np.repeat(np.asarray(ids, dtype=np.int64), counts))
+                rows.append(np.asarray(segment.postings))
+        
+        new_terms, new_rows = [], []
+        for offset, text in enumerate(chunks):
+            chunk_id = first_id + offset
+            frequencies = Counter(tokenize(text))
+            lengths[chunk_id] = sum(frequencies.values())
+            for term, frequency in frequencies.items():
+                new_terms.append(term_id(term))
+                new_rows.append((chunk_id, frequency))
+        row_terms.append(np.asarray(new_terms, dtype=np.int64))
+        rows.append(np.asarray(new_rows, dtype=np.int32).reshape(-1, 2))
+        
+        segments = [] if merge else [segment.name for segment in old.segments]
+        all_rows = np.concatenate(rows)
+        if len(all_rows):
+            segment_name = f"seg-{generation:06d}"
+            self._write_segment(self._path(segment_name), terms, np.concatenate(row_terms), all_rows, dead)
+            segments.append(segment_name)
+        
+        if document_id is not None:
+            documents[document_id] = {
+                **metadata,
+                "chunk_ids": [first_id, first_id + len(chunks)],
+                "chunks": len(chunks)
+            }
+        live = lengths >= 0
+        meta = {
+            "version": INDEX_VERSION,
+            "generation": generation,
+            "chunks_file": chunks_name,
+            "segments": segments,
+            "live_chunks": int(live.sum()),
+            "live_terms": int(lengths[live].sum())
+        }
+        
+        self._write_array(generation_dir / "lengths.i32", lengths.astype(np.int32))
+        self._write_array(generation_dir / "spans.i64", spans.astype(np.int64))
+        self._write_json(generation_dir / "documents.json", documents)
+        self._write_json(generation_dir / "meta.json", meta)
+        self._publish(generation_dir)
+        
+        # Searches still holding the old snapshot keep its files open until they
+        # finish, so its directory can be unlinked right away
+        self._snapshot = self._load()
+        self._remove_stale_files()
+    
+    def _write_segment(
+        self,
+        segment_dir: Path,
+        terms: list[str],
+        row_terms: np.ndarray,
+        rows: np.ndarray,
+        dead: np.ndarray
+    ) -> None:
+        """Write postings rows, minus those of dead chunks, grouped by term."""
+        # Left over from a write that crashed before it was published
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        segment_dir.mkdir()
+        keep = ~dead[rows[:, 0]]
+        order = np.argsort(row_terms[keep], kind="stable")
+        row_terms, rows = row_terms[keep][order], rows[keep][order]
+        counts = np.bincount(row_terms, minlength=len(terms))
+        starts = np.cumsum(counts) - counts
+        vocab = {
+            term: (int(starts[index]), int(counts[index]))
+            for index, term in enumerate(terms) if counts[index]
+        }
+        self._write_array(segment_dir / "postings.i32", rows.astype(np.int32))
+        self._write_json(segment_dir / "vocab.json", vocab)
+        _sync_directory(segment_dir)
+    
+    @staticmethod
+    def _append_chunks(out, document_id: Optional[str], chunks: list[str], first_id: int, spans: np.ndarray) -> None:
+        for offset, text in enumerate(chunks):
+            data = json.dumps({"document": document_id, "text": text}).encode() + b"\n"
+            spans[first_id + offset] = (out.tell(), len(data))
+            out.write(data)
+    
+    @staticmethod
+    def _write_array(path: Path, array: np.ndarray) -> None:
+        with open(path, "wb") as out:
+            array.tofile(out)
+            _sync(out)
+    
+    @staticmethod
+    def _write_json(path: Path, value) -> None:
+        with open(path, "w") as out:
+            out.write(json.dumps(value))
+            _sync(out)
+    
+    def _publish(self, generation_dir: Path) -> None:
+        """Point CURRENT at a fully written generation, the single atomic step of a change."""
+        # The generation's directory entries must be durable before CURRENT names it
+        _sync_directory(generation_dir)
+        _sync_directory(self.directory)
+        tmp = self._path(POINTER + ".tmp")
+        with open(tmp, "w") as out:
+            out.write(generation_dir.name)
+            _sync(out)
+        os.replace(tmp, self._path(POINTER))
+        _sync_directory(self.directory)
+    
+    def close(self) -> None:
+        """Release the open chunk file."""
+        self._snapshot.chunks_file.close()
+
+
+def _sync(file) -> None:
+    """Flush a file object through to disk."""
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def _sync_directory(path: Path) -> None:
+    """Make a directory's entries (created or renamed files) durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
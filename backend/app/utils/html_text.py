@@ -0,0 +1,175 @@
+"""
+Incremental visible-text extraction from HTML using lxml's feed parser.
+"""
+import codecs
+import re
+from typing import Optional
+from lxml import etree
+
+# Elements whose text never counts as visible page content
+SKIP_TAGS = ("script", "style", "nav", "header", "footer", "aside", "form", "button")
+
+# Bytes searched for a BOM or <meta charset> when the encoding is not known,
+# as in the HTML encoding sniffing algorithm
+SNIFF_BYTES = 1024
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-z0-9_.:-]+)""", re.IGNORECASE)
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be")
+)
+
+
+class VisibleTextCollector:
+    """
+    lxml parser target that collects whitespace-normalized text outside SKIP_TAGS.
+    
+    Text is gathered while the document is fed in chunks, so callers can stop
+    reading as soon as `limit` characters have been collected. lxml splits a
+    text node into several `data` calls around entities (`don&#39;t`,
+    `AT&amp;T`), so raw text is buffered until the next tag or comment and
+    normalized as one node, like BeautifulSoup's strings.
+    """
+    
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.parts: list[str] = []
+        self.length = 0
+        self._skip_depth = 0
+        self._node: list[str] = []
+    
+    @property
+    def done(self) -> bool:
+        """Whether enough text has been collected."""
+        return self.limit is not None and self.length >= self.limit
+    
+    def _flush(self) -> None:
+        """Store the buffered text node."""
+        if not self._node:
+            return
+        normalized = " ".join("".join(self._node).split())
+        self._node.clear()
+        if normalized:
+            self.parts.append(normalized)
+            self.length += len(normalized) + 1
+    
+    def start(self, tag, attrib):
+        self._flush()
+        if self._skip_depth or tag in SKIP_TAGS:
+            self._skip_depth += 1
+    
+    def end(self, tag):
+        self._flush()
+        if self._skip_depth:
+            self._skip_depth -= 1
+    
+    def data(self, text):
+        if not self._skip_depth:
+            self._node.append(text)
+    
+    def comment(self, text):
+        self._flush()
+    
+    def close(self):
+        return self.text()
+    
+    def text(self) -> str:
+        """Collected text joined with single spaces."""
+        self._flush()
+        return " ".join(self.parts)
+
+
+def sniff_encoding(prefix: bytes) -> str:
+    """
+    Encoding of an HTML document from its first bytes.
+    
+    Args:
+        prefix: Start of the document, ideally SNIFF_BYTES long
+    
+    Returns:
+        The BOM's encoding, else a valid `<meta charset>` declaration, else UTF-8
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    match = _META_CHARSET.search(prefix[:SNIFF_BYTES])
+    if match:
+        try:
+            name = codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            return "utf-8"
+        # A page served as bytes cannot really be UTF-16 if its meta tag is readable as ASCII
+        return "utf-8" if name.startswith("utf-16") else name
+    return "utf-8"
+
+
+class IncrementalTextExtractor:
+    """
+    Feeds HTML bytes to lxml chunk by chunk and collects visible text.
+    
+    Without a known encoding (e.g. no charset in the Content-Type header),
+    the first SNIFF_BYTES are held back and checked with `sniff_encoding`
+    before parsing starts.
+    """
+    
+    def __init__(self, limit: Optional[int] = None, encoding: Optional[str] = None):
+        self.collector = VisibleTextCollector(limit)
+        self._parser: Optional[etree.HTMLParser] = None
+        self._prefix = bytearray()
+        self._closed = False
+        if encoding is not None:
+            self._start(encoding)
+    
+    def _start(self, encoding: str) -> None:
+        self._parser = etree.HTMLParser(target=self.collector, encoding=encoding)
+        if self._prefix:
+            self._parser.feed(bytes(self._prefix))
+            self._prefix.clear()
+    
+    @property
+    def done(self) -> bool:
+        """Whether the text budget has been reached."""
+        return self.collector.done
+    
+    def feed(self, chunk: bytes) -> None:
+        """Parse the next chunk of the document."""
+        if not chunk or self._closed:
+            return
+        if self._parser is None:
+            self._prefix.extend(chunk)
+            if len(self._prefix) >= SNIFF_BYTES:
+                self._start(sniff_encoding(bytes(self._prefix)))
+            return
+        self._parser.feed(chunk)
+    
+    def close(self) -> str:
+        """Finish parsing and return the collected text."""
+        if not self._closed:
+            self._closed = True
+            if self._parser is None:
+                if not self._prefix:
+                    return ""
+                self._start(sniff_encoding(bytes(self._prefix)))
+            try:
+                self._parser.close()
+            except etree.XMLSyntaxError:
+                # Truncated or empty documents still yield what was collected
+                pass
+        return self.collector.text()
+
+
+def extract_visible_text(content: bytes, encoding: Optional[str] = None, limit: Optional[int] = None) -> str:
+    """
+    Extract whitespace-normalized visible text from a complete HTML document.
+    
+    Args:
+        content: HTML bytes
+        encoding: Document encoding, if known; otherwise it is sniffed
+        limit: Stop collecting after roughly this many characters
+    
+    Returns:
+        Visible text joined with single spaces
+    """
+    extractor = IncrementalTextExtractor(limit=limit, encoding=encoding)
+    extractor.feed(content)
+    return extractor.close()
@@ -13,4 +13,7 @@ logging.basicConfig(
     ]
 )
 
+# httpx logs every request at INFO; keep it quiet unless something goes wrong
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 logger = logging.getLogger("ai-assistant")
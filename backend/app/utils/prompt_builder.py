@@ -1,13 +1,327 @@
 """
 Prompt construction utilities for the AI model.
 """
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, Union
+from app.core.config import settings
+from app.utils.tokens import estimate_tokens, truncate_to_tokens
+
+
+SYSTEM_INSTRUCTION = (
+    "You are a helpful AI assistant with access to real-time web search results. "
+    "Use the previous conversation and any search results or scraped content to provide "
+    "accurate, up-to-date information. Be concise but clear, accurate, and helpful. "
+    "If you don't know something, say so. When using search results, cite the sources."
+)
+
+HISTORY_HEADER = "\n--- Conversation History ---"
+HISTORY_FOOTER = "\n--- End of History ---\n"
+SUMMARY_LABEL = "\nSummary of earlier conversation: "
+RECALL_LABEL = "\nEarlier in this conversation: "
+KNOWLEDGE_HEADING = "Knowledge base excerpts:"
+
+SUMMARY_INSTRUCTION = (
+    "Summarize the conversation below so it can stand in for the original messages later. "
+    "Keep names, facts, numbers, decisions, open questions and the user's stated preferences; "
+    "drop greetings and filler. Write plain prose of at most {words} words, with no preamble."
+)
+
+# Messages always kept ahead of context when the budget allows: the last exchange
+RECENT_HISTORY_MESSAGES = 2
+
+# A context block is only cut to fit if at least this many tokens of it would remain
+MIN_PARTIAL_BLOCK_TOKENS = 32
+
+# Search results or scraped text, as one string or as blocks in descending order of value
+ContextText = Union[str, list[str]]
+
+
+@dataclass
+class PromptBuild:
+    """A rendered prompt plus its estimated token breakdown."""
+    prompt: str
+    tokens: dict[str, int] = field(default_factory=dict)
+    budget: Optional[int] = None
+    history_dropped: int = 0
+    context_dropped: int = 0
+    
+    @property
+    def total_tokens(self) -> int:
+        """Estimated tokens the model has to hold for this turn."""
+        return sum(self.tokens.values())
+    
+    def describe(self) -> str:
+        """One-line token breakdown for logs."""
+        parts = [f"{name}={count}" for name, count in self.tokens.items()]
+        summary = ", ".join(parts) + f", total={self.total_tokens}"
+        if self.budget is not None:
+            summary += f"/{self.budget}"
+        dropped = []
+        if self.history_dropped:
+            dropped.append(f"{self.history_dropped} history messages")
+        if self.context_dropped:
+            dropped.append(f"{self.context_dropped} context blocks")
+        if dropped:
+            summary += f" (dropped {', '.join(dropped)})"
+        return summary
+
+
+def prompt_token_budget(model: Optional[str] = None) -> int:
+    """
+    Tokens available to the prompt for a model: its context window minus the
+    room reserved for the reply.
+    
+    Args:
+        model: Model name; defaults to OLLAMA_MODEL
+    
+    Returns:
+        Prompt token budget
+    """
+    num_ctx = settings.num_ctx_for(model or settings.OLLAMA_MODEL)
+    return max(num_ctx - settings.OLLAMA_RESPONSE_TOKENS, 0)
+
+
+def _context_parts(scraped_text: str) -> list[str]:
+    """Wrap search results, knowledge base excerpts or scraped page content in labelled delimiters."""
+    parts = []
+    if "search results:" in scraped_text.lower():
+        parts.append("\n--- REAL-TIME SEARCH RESULTS ---")
+        parts.append("\nThe following are CURRENT, UP-TO-DATE search results from the web.")
+        parts.append("\nUSE THIS INFORMATION to answer the user's question with the latest data:")
+    elif scraped_text.startswith(KNOWLEDGE_HEADING):
+        parts.append("\n--- Knowledge Base ---")
+        parts.append("\nThese excerpts come from the organization's own documents. Prefer them when relevant:")
+    else:
+        parts.append("\n--- Web Page Content ---")
+        parts.append("\nHere is content scraped from a related web page. Use it if relevant, ignore if not:")
+    parts.append(f"\n{scraped_text}")
+    if "search results:" in scraped_text.lower():
+        parts.append("\n--- END OF SEARCH RESULTS ---\n")
+    elif scraped_text.startswith(KNOWLEDGE_HEADING):
+        parts.append("\n--- End of Knowledge Base ---\n")
+    else:
+        parts.append("\n--- End of Web Page Content ---\n")
+    return parts
+
+
+def _context_blocks(scraped_text: ContextText) -> list[str]:
+    """
+    Split context into blocks ordered from most to least valuable.
+    
+    Strings are split on blank lines, which orders search results by rank;
+    lists are taken as already ordered.
+    """
+    if isinstance(scraped_text, str):
+        scraped_text = scraped_text.split("\n\n")
+    blocks = [block.strip("\n") for block in scraped_text if block.strip()]
+    # A heading such as "Here are the top search results:" travels with the entry after it
+    merged = []
+    for block in blocks:
+        if merged and merged[-1].endswith(":") and "\n" not in merged[-1]:
+            merged[-1] += "\n\n" + block
+        else:
+            merged.append(block)
+    return merged
+
+
+def _history_lines(history: list[dict]) -> list[str]:
+    """Render history messages, oldest first."""
+    lines = []
+    for msg in history:
+        role = msg.get("role", "unknown")
+        content = msg.get("content", "")
+        if role == "user":
+            lines.append(f"\nUser: {content}")
+        elif role == "assistant":
+            lines.append(f"\nAssistant: {content}")
+    return lines
+
+
+def _recalled_lines(recalled: list[dict], max_tokens: int) -> list[str]:
+    """Render recalled turns, each cut to `max_tokens`, in the order given."""
+    return [
+        truncate_to_tokens(f"{RECALL_LABEL}User: {turn['user']} / Assistant: {turn['assistant']}", max_tokens)
+        for turn in recalled
+    ]
+
+
+def _user_turn(user_message: str) -> str:
+    return f"\nUser: {user_message}\n\nAssistant:"
+
+
+def _newest_that_fit(costs: list[int], allowance: int) -> int:
+    """Number of trailing items, newest first, that fit in `allowance` together."""
+    kept = 0
+    for cost in reversed(costs):
+        if cost > allowance:
+            break
+        allowance -= cost
+        kept += 1
+    return kept
+
+
+def _select_context(blocks: list[str], costs: list[int], allowance: int) -> list[str]:
+    """
+    Keep the most valuable context blocks that fit in `allowance`.
+    
+    The first block that does not fit is cut down to the remaining allowance
+    if a useful amount of it survives; everything after it is dropped.
+    """
+    if not blocks:
+        return []
+    # Delimiters and instructions around the context; their kind depends on all of it
+    # (search results anywhere, else a leading knowledge base heading, else page content)
+    text = "\n\n".join(blocks)
+    allowance -= estimate_tokens("".join(_context_parts(text))) - estimate_tokens(text)
+    selected = []
+    for block, cost in zip(blocks, costs):
+        if cost <= allowance:
+            selected.append(block)
+            allowance -= cost
+            continue
+        if allowance >= MIN_PARTIAL_BLOCK_TOKENS:
+            selected.append(truncate_to_tokens(block, allowance))
+        break
+    return selected
+
+
+def build_budgeted_prompt(
+    history: list[dict],
+    user_message: str,
+    scraped_text: Optional[ContextText] = None,
+    token_budget: Optional[int] = None,
+    summary: Optional[str] = None,
+    recalled: Optional[list[dict]] = None
+) -> PromptBuild:
+    """
+    Build the full prompt, trimming it to a token budget if one is given.
+    
+    The system instruction and the current message are always kept. The last
+    exchange is kept next, then context gets up to PROMPT_CONTEXT_SHARE of
+    what is left, older history fills the rest newest first, and any room
+    history does not use goes back to context. So the oldest history and the
+    lowest-ranked context blocks are the first to go. A summary of folded
+    messages opens the history and counts as its oldest entry; recalled
+    turns come before it, so they are dropped first, least relevant first.
+    
+    Args:
+        history: List of previous messages with 'role' and 'content' keys
+        user_message: Current user message
+        scraped_text: Optional scraped web page content or search results
+        token_budget: Prompt token budget, or None to keep everything
+        summary: Optional running summary of messages older than `history`
+        recalled: Optional archived turns ({"user", "assistant"}), least relevant first
+    
+    Returns:
+        The prompt with its per-section token breakdown
+    """
+    lines = _history_lines(history)
+    if summary:
+        lines.insert(0, SUMMARY_LABEL + summary)
+    if recalled:
+        lines[:0] = _recalled_lines(recalled, settings.LONG_TERM_MEMORY_TURN_TOKENS)
+    blocks = _context_blocks(scraped_text) if scraped_text else []
+    line_costs = [estimate_tokens(line) for line in lines]
+    block_costs = [estimate_tokens(block) + 1 for block in blocks]
+    
+    kept_lines, kept_blocks = lines, blocks
+    if token_budget is not None:
+        history_overhead = estimate_tokens(HISTORY_HEADER + HISTORY_FOOTER)
+        available = (
+            token_budget
+            - estimate_tokens(SYSTEM_INSTRUCTION)
+            - estimate_tokens(_user_turn(user_message))
+        )
+        
+        recent = _newest_that_fit(line_costs[-RECENT_HISTORY_MESSAGES:], available - history_overhead)
+        recent_cost = sum(line_costs[len(lines) - recent:]) + (history_overhead if recent else 0)
+        context_share = int((available - recent_cost) * settings.PROMPT_CONTEXT_SHARE)
+        kept_blocks = _select_context(blocks, block_costs, context_share)
+        context_cost = estimate_tokens("".join(_context_parts("\n\n".join(kept_blocks)))) if kept_blocks else 0
+        
+        keep = _newest_that_fit(line_costs, available - context_cost - history_overhead)
+        kept_lines = lines[len(lines) - keep:]
+        history_cost = sum(line_costs[len(lines) - keep:]) + (history_overhead if keep else 0)
+        kept_blocks = _select_context(blocks, block_costs, available - history_cost)
+    
+    # Render the untrimmed context exactly as it was given
+    if kept_blocks == blocks and isinstance(scraped_text, str):
+        context_text = scraped_text
+    else:
+        context_text = "\n\n".join(kept_blocks)
+    
+    sections = {"system": SYSTEM_INSTRUCTION + "\n"}
+    if context_text:
+        sections["context"] = "".join(_context_parts(context_text))
+    if kept_lines:
+        sections["history"] = HISTORY_HEADER + "".join(kept_lines) + HISTORY_FOOTER
+    sections["user"] = _user_turn(user_message)
+    
+    return PromptBuild(
+        prompt="".join(sections.values()),
+        tokens={name: estimate_tokens(text) for name, text in sections.items()},
+        budget=token_budget,
+        history_dropped=max(len(history) - len(kept_lines), 0),
+        context_dropped=len(blocks) - len(kept_blocks)
+    )
+
+
+def build_budgeted_followup_prompt(
+    user_message: str,
+    scraped_text: Optional[ContextText] = None,
+    token_budget: Optional[int] = None,
+    context_tokens: int = 0
+) -> PromptBuild:
+    """
+    Build the follow-up prompt for a reused KV context within a token budget.
+    
+    The reused context counts against the budget; what remains goes to this
+    turn's context blocks, best first. If even the bare message does not fit,
+    the returned build is over budget and the caller should rebuild the turn
+    from history instead.
+    
+    Args:
+        user_message: Current user message
+        scraped_text: Optional scraped web page content or search results for this turn
+        token_budget: Prompt token budget, or None to keep everything
+        context_tokens: Length of the KV context the prompt will extend
+    
+    Returns:
+        The prompt with its token breakdown, including the reused context
+    """
+    blocks = _context_blocks(scraped_text) if scraped_text else []
+    kept_blocks = blocks
+    if token_budget is not None:
+        available = token_budget - context_tokens - estimate_tokens(_user_turn(user_message))
+        kept_blocks = _select_context(blocks, [estimate_tokens(block) + 1 for block in blocks], available)
+    
+    if kept_blocks == blocks and isinstance(scraped_text, str):
+        context_text = scraped_text
+    else:
+        context_text = "\n\n".join(kept_blocks)
+    
+    sections = {}
+    if context_text:
+        sections["context"] = "".join(_context_parts(context_text))
+    sections["user"] = _user_turn(user_message)
+    
+    tokens = {"kv_context": context_tokens}
+    tokens.update({name: estimate_tokens(text) for name, text in sections.items()})
+    return PromptBuild(
+        prompt="".join(sections.values()).lstrip("\n"),
+        tokens=tokens,
+        budget=token_budget,
+        context_dropped=len(blocks) - len(kept_blocks)
+    )
 
 
 def build_prompt(
     history: list[dict],
     user_message: str,
-    scraped_text: Optional[str] = None
+    scraped_text: Optional[ContextText] = None,
+    token_budget: Optional[int] = None,
+    summary: Optional[str] = None,
+    recalled: Optional[list[dict]] = None
 ) -> str:
     """
     Build a comprehensive prompt including system instructions, history, and optional scraped content.
@@ -16,51 +330,62 @@ def build_prompt(
         history: List of previous messages with 'role' and 'content' keys
         user_message: Current user message
         scraped_text: Optional scraped web page content
+        token_budget: Optional prompt token budget; see build_budgeted_prompt
+        summary: Optional running summary of messages older than `history`
+        recalled: Optional archived turns relevant to the message; see build_budgeted_prompt
     
     Returns:
         Formatted prompt string for the AI model
     """
-    prompt_parts = []
+    return build_budgeted_prompt(history, user_message, scraped_text, token_budget, summary, recalled).prompt
+
+
+def build_followup_prompt(
+    user_message: str,
+    scraped_text: Optional[ContextText] = None
+) -> str:
+    """
+    Build the prompt for a turn whose earlier conversation is already held in
+    the model's KV context, so only the new material needs to be prefilled.
     
-    # System instruction
-    system_instruction = (
-        "You are a helpful AI assistant with access to real-time web search results. "
-        "Use the previous conversation and any search results or scraped content to provide "
-        "accurate, up-to-date information. Be concise but clear, accurate, and helpful. "
-        "If you don't know something, say so. When using search results, cite the sources."
-    )
-    prompt_parts.append(system_instruction)
-    prompt_parts.append("\n")
-    
-    # Add scraped content or search results if available
-    if scraped_text:
-        if "search results:" in scraped_text.lower():
-            prompt_parts.append("\n--- REAL-TIME SEARCH RESULTS ---")
-            prompt_parts.append("\nThe following are CURRENT, UP-TO-DATE search results from the web.")
-            prompt_parts.append("\nUSE THIS INFORMATION to answer the user's question with the latest data:")
-        else:
-            prompt_parts.append("\n--- Web Page Content ---")
-            prompt_parts.append("\nHere is content scraped from a related web page. Use it if relevant, ignore if not:")
-        prompt_parts.append(f"\n{scraped_text}")
-        if "search results:" in scraped_text.lower():
-            prompt_parts.append("\n--- END OF SEARCH RESULTS ---\n")
-        else:
-            prompt_parts.append("\n--- End of Web Page Content ---\n")
-    
-    # Add conversation history
-    if history:
-        prompt_parts.append("\n--- Conversation History ---")
-        for msg in history:
-            role = msg.get("role", "unknown")
-            content = msg.get("content", "")
-            if role == "user":
-                prompt_parts.append(f"\nUser: {content}")
-            elif role == "assistant":
-                prompt_parts.append(f"\nAssistant: {content}")
-        prompt_parts.append("\n--- End of History ---\n")
-    
-    # Add current user message
-    prompt_parts.append(f"\nUser: {user_message}")
-    prompt_parts.append("\n\nAssistant:")
-    
-    return "".join(prompt_parts)
+    Args:
+        user_message: Current user message
+        scraped_text: Optional scraped web page content or search results for this turn
+    
+    Returns:
+        Formatted prompt string for the AI model
+    """
+    return build_budgeted_followup_prompt(user_message, scraped_text).prompt
+
+
+def build_summary_prompt(
+    messages: list[dict],
+    previous_summary: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    max_words: int = 150
+) -> str:
+    """
+    Build the prompt that folds older messages into a session's running summary.
+    
+    When a budget is given, each message is cut to an equal share of what is
+    left after the instruction and the previous summary.
+    
+    Args:
+        messages: Messages to fold in, oldest first, with 'role' and 'content' keys
+        previous_summary: Summary of the messages folded earlier, if any
+        token_budget: Prompt token budget, or None to keep everything
+        max_words: Length the summary is asked to stay within
+    
+    Returns:
+        Formatted prompt string for the AI model
+    """
+    head = SUMMARY_INSTRUCTION.format(words=max_words) + "\n"
+    if previous_summary:
+        head += f"\n--- Summary So Far ---\n{previous_summary}\n"
+    tail = "\n--- End of Conversation ---\n\nSummary:"
+    
+    lines = _history_lines(messages)
+    if token_budget is not None and lines:
+        share = (token_budget - estimate_tokens(head + HISTORY_HEADER + tail)) // len(lines)
+        lines = [truncate_to_tokens(line, max(share, MIN_PARTIAL_BLOCK_TOKENS)) for line in lines]
+    return head + HISTORY_HEADER + "".join(lines) + tail
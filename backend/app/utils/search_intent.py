@@ -0,0 +1,143 @@
+"""
+Classifiers that decide whether a chat message needs a web search.
+"""
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Protocol
+
+
+SEARCH_KEYWORDS = [
+    'search', 'find', 'look up', 'lookup', 'google',
+    'what is', 'who is', 'where is', 'when is', 'how is',
+    'current', 'latest', 'recent', 'news', 'today', 'now',
+    'price', 'weather', 'stock', 'trending', 'happening'
+]
+
+# (pattern, weight) pairs for the scored classifier, in log-odds. Positive
+# features point at fresh or external facts, negative ones at tasks the
+# model can answer from the conversation alone.
+SCORED_FEATURES = [
+    (r"\b(?:search|google|look ?up)\b", 3.0),
+    (r"\bfind\b(?=.*\b(?:online|web|articles?|sources?|links?|sites?|websites?|papers?)\b)", 2.5),
+    (r"\b(?:latest|news|headlines?|trending|happening|breaking)\b", 2.5),
+    (r"\b(?:today|tonight|yesterday|tomorrow|this (?:week|month|year)|right now)\b", 2.0),
+    (r"\b(?:current|currently|recent|recently|nowadays|upcoming)\b", 2.0),
+    (r"\b(?:price|prices|weather|forecast|stocks?|score|scores|rates?|exchange rate|release date|election)\b", 2.0),
+    (r"\b20[2-9]\d\b", 2.0),
+    (r"\b(?:who|where|when) (?:is|are|was|did|does|will)\b", 2.0),
+    (r"\bnow\b", 0.8),
+    (r"\b(?:what|how) is\b", 0.3),
+    (r"(?<=[a-z,] )[A-Z][a-z]+(?: [A-Z][a-z]+)*", 0.5),
+    (r"\b(?:explain|write|rewrite|summarize|translate|refactor|debug|implement|define|proofread)\b", -2.0),
+    (r"\b(?:code|function|class|script|regex|query|essay|poem|email|story)\b", -1.0),
+    (r"\b(?:how (?:do|can|should) (?:i|you|we)|how to|difference between|different from|meaning of|example of)\b", -1.0),
+    (r"\b(?:you|your) (?:said|wrote|mentioned|answer)\b|\babove\b|\bprevious\b", -1.5),
+]
+SCORED_BIAS = -2.0
+
+
+@dataclass
+class IntentDecision:
+    """Whether to search, how confident the classifier is, and why."""
+    search: bool
+    score: float
+    matches: list[str] = field(default_factory=list)
+
+
+class IntentClassifier(Protocol):
+    name: str
+    
+    def classify(self, message: str) -> IntentDecision:
+        ...
+
+
+def compile_keywords(keywords: list[str]) -> re.Pattern:
+    """
+    Compile keywords into one case-insensitive pattern matching whole words only.
+    
+    Multi-word keywords may be separated by any whitespace, so "look up"
+    also matches "look\\nup" but "now" no longer matches inside "know".
+    """
+    alternatives = sorted(
+        (r"\s+".join(re.escape(word) for word in keyword.split()) for keyword in keywords),
+        key=len,
+        reverse=True
+    )
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+class KeywordIntentClassifier:
+    """Searches when the message contains any of the keywords as whole words."""
+    name = "keyword"
+    
+    def __init__(self, keywords: list[str] = SEARCH_KEYWORDS):
+        self.pattern = compile_keywords(keywords)
+    
+    def classify(self, message: str) -> IntentDecision:
+        matches = [match.group(0).lower() for match in self.pattern.finditer(message)]
+        return IntentDecision(search=bool(matches), score=1.0 if matches else 0.0, matches=matches)
+
+
+class ScoredIntentClassifier:
+    """
+    Logistic scoring over weighted regex features.
+    
+    Each matching feature adds its weight once; the sum plus a bias is
+    squashed to a probability and compared with `threshold`. A bare "what
+    is" no longer triggers a search on its own, while time-sensitive words
+    or an explicit request to search do.
+    """
+    name = "scored"
+    
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        features: list[tuple[str, float]] = SCORED_FEATURES,
+        bias: float = SCORED_BIAS
+    ):
+        self.threshold = threshold
+        self.bias = bias
+        # Only the capitalized-word feature is case sensitive
+        self.features = [
+            (re.compile(pattern, 0 if "[A-Z]" in pattern else re.IGNORECASE), weight)
+            for pattern, weight in features
+        ]
+    
+    def classify(self, message: str) -> IntentDecision:
+        logit = self.bias
+        matches = []
+        for pattern, weight in self.features:
+            match = pattern.search(message)
+            if match:
+                logit += weight
+                matches.append(f"{match.group(0).lower()}:{weight:+g}")
+        score = 1 / (1 + math.exp(-logit))
+        return IntentDecision(search=score >= self.threshold, score=score, matches=matches)
+
+
+CLASSIFIERS = {
+    KeywordIntentClassifier.name: KeywordIntentClassifier,
+    ScoredIntentClassifier.name: ScoredIntentClassifier,
+}
+
+
+def create_classifier(name: str, threshold: float = 0.5) -> IntentClassifier:
+    """
+    Build the classifier registered under `name`.
+    
+    Args:
+        name: "keyword" or "scored"
+        threshold: Search probability cut-off for the scored classifier
+    
+    Returns:
+        Classifier instance
+    
+    Raises:
+        ValueError: If no classifier has that name
+    """
+    if name not in CLASSIFIERS:
+        raise ValueError(f"Unknown search intent classifier {name!r}; expected one of {sorted(CLASSIFIERS)}")
+    if name == ScoredIntentClassifier.name:
+        return ScoredIntentClassifier(threshold=threshold)
+    return CLASSIFIERS[name]()
@@ -0,0 +1,90 @@
+"""
+Coalescing of concurrent identical async calls.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class _Flight:
+    """A shared call and the number of callers waiting on it."""
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+    
+    Callers that arrive while a call for the same key is in flight await the
+    same result (or exception) instead of starting their own. The call runs
+    in its own task, so a caller that is cancelled (a client disconnect, a
+    stage timeout) only stops waiting; the call itself is cancelled once no
+    caller is left waiting for it.
+    """
+    
+    def __init__(self):
+        self._inflight: dict[str, _Flight] = {}
+    
+    def in_flight(self, key: str) -> bool:
+        """Whether a call for `key` is currently running."""
+        return key in self._inflight
+    
+    async def join(self, key: str) -> Any:
+        """
+        Await the result of the call currently running for `key`.
+        
+        Raises:
+            KeyError: If no call for `key` is in flight
+        """
+        return await self._wait(key, self._inflight[key])
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` for `key`, or join the call already running for it.
+        
+        Args:
+            key: Identity of the call
+            fn: Zero-argument coroutine function producing the result
+        
+        Returns:
+            Result of the shared call
+        """
+        while True:
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._start(key, fn)
+            try:
+                return await self._wait(key, flight)
+            except asyncio.CancelledError:
+                # The shared call was cancelled under us without this caller
+                # being cancelled; run it again rather than fail
+                if not flight.task.cancelled() or asyncio.current_task().cancelling():
+                    raise
+    
+    def _start(self, key: str, fn: Callable[[], Awaitable[Any]]) -> _Flight:
+        flight = _Flight(asyncio.create_task(fn()))
+        self._inflight[key] = flight
+        
+        def finished(task: asyncio.Task) -> None:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            # Mark retrieved so a failure nobody waited for is not logged by asyncio
+            if not task.cancelled():
+                task.exception()
+        
+        flight.task.add_done_callback(finished)
+        return flight
+    
+    async def _wait(self, key: str, flight: _Flight) -> Any:
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Last caller gone: stop the call, and let the next caller start afresh
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                flight.task.cancel()
@@ -0,0 +1,209 @@
+"""
+Chunking and BM25 ranking of text passages against a query.
+"""
+import math
+import re
+from collections import Counter
+from typing import Optional
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in into is it its
+me my no not of on or our so than that the their them then there these they this to was
+we were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens without stopwords or single letters."""
+    return [
+        word for word in _WORD.findall(text.lower())
+        if word not in STOPWORDS and (len(word) > 1 or word.isdigit())
+    ]
+
+
+def split_chunks(text: str, max_chars: int) -> list[str]:
+    """
+    Split text into chunks of whole sentences, each at most `max_chars` long.
+    
+    Sentences longer than `max_chars` are cut at word boundaries.
+    
+    Args:
+        text: Whitespace-normalized text
+        max_chars: Maximum chunk length
+    
+    Returns:
+        Chunks in document order
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def bm25_idf(documents: int, frequency: int) -> float:
+    """Okapi BM25 inverse document frequency of a term found in `frequency` of `documents`."""
+    return math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+
+
+def bm25_term_score(
+    idf: float,
+    frequency: int,
+    length: int,
+    avg_length: float,
+    k1: float = 1.5,
+    b: float = 0.75
+) -> float:
+    """BM25 contribution of one query term occurring `frequency` times in a document of `length` terms."""
+    norm = k1 * (1 - b + b * length / (avg_length or 1))
+    return idf * frequency * (k1 + 1) / (frequency + norm)
+
+
+def bm25_term_ceiling(idf: float, k1: float = 1.5) -> float:
+    """Upper bound of `bm25_term_score` for a term, approached as its frequency grows."""
+    return idf * (k1 + 1)
+
+
+class BM25Index:
+    """In-memory Okapi BM25 index over a fixed list of documents."""
+    
+    def __init__(self, documents: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms = [Counter(tokenize(document)) for document in documents]
+        self.doc_lengths = [sum(terms.values()) for terms in self.doc_terms]
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if documents else 0.0
+        
+        document_frequency: Counter = Counter()
+        for terms in self.doc_terms:
+            document_frequency.update(terms.keys())
+        count = len(documents)
+        self.idf = {term: bm25_idf(count, frequency) for term, frequency in document_frequency.items()}
+    
+    def scores(self, query: str) -> list[float]:
+        """BM25 score of every document for `query`, in document order."""
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        results = []
+        for terms, length in zip(self.doc_terms, self.doc_lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term, 0)
+                if frequency:
+                    score += bm25_term_score(self.idf[term], frequency, length, self.avg_length, self.k1, self.b)
+            results.append(score)
+        return results
+    
+    def top(self, query: str, limit: Optional[int] = None) -> list[tuple[int, float]]:
+        """
+        Documents matching `query`, best first.
+        
+        Args:
+            query: Free-text query
+            limit: Maximum number of results
+        
+        Returns:
+            (document index, score) pairs with a positive score
+        """
+        ranked = sorted(
+            ((index, score) for index, score in enumerate(self.scores(query)) if score > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return ranked[:limit] if limit is not None else ranked
+
+
+def select_passages(text: str, query: str, max_chars: int, chunk_chars: int) -> list[str]:
+    """
+    Pick the chunks of `text` most relevant to `query` within a character budget.
+    
+    Text that already fits is returned whole. Otherwise it is chunked and only
+    chunks that match the query are kept, best first, followed by the page's
+    opening chunk; if nothing matches, the leading chunks are kept instead.
+    
+    Args:
+        text: Cleaned page text
+        query: The user's message
+        max_chars: Total characters to keep
+        chunk_chars: Target chunk length
+    
+    Returns:
+        Passages in descending order of relevance
+    """
+    if len(text) <= max_chars:
+        return [text]
+    
+    chunks = split_chunks(text, chunk_chars)
+    ranked = [index for index, _ in BM25Index(chunks).top(query)]
+    if not ranked:
+        ranked = list(range(len(chunks)))
+    elif 0 not in ranked:
+        # The opening usually says what the page is about; keep it as the weakest passage
+        ranked.append(0)
+    
+    selected = []
+    used = 0
+    for index in ranked:
+        if used + len(chunks[index]) > max_chars:
+            continue
+        selected.append(chunks[index])
+        used += len(chunks[index])
+    return selected or [chunks[ranked[0]][:max_chars]]
+
+
+def rank_sources(
+    sources: dict[str, str],
+    query: str,
+    max_chars: int,
+    chunk_chars: int
+) -> list[tuple[str, str]]:
+    """
+    Pick the passages most relevant to `query` across several documents.
+    
+    All documents are chunked into one index, so passages compete on the
+    same scale regardless of which page they come from.
+    
+    Args:
+        sources: Document text keyed by source (e.g. URL)
+        query: The user's message
+        max_chars: Total characters to keep
+        chunk_chars: Target chunk length
+    
+    Returns:
+        (source, passage) pairs matching the query, best first
+    """
+    chunks = [
+        (source, chunk)
+        for source, text in sources.items()
+        for chunk in split_chunks(text, chunk_chars)
+    ]
+    index = BM25Index([chunk for _, chunk in chunks])
+    
+    selected = []
+    used = 0
+    for position, _ in index.top(query):
+        source, chunk = chunks[position]
+        if used + len(chunk) > max_chars:
+            continue
+        selected.append((source, chunk))
+        used += len(chunk)
+    return selected
@@ -0,0 +1,231 @@
+"""
+Fixed-capacity cosine similarity index persisted in memory-mapped files.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from app.utils.logger import logger
+
+INDEX_VERSION = 1
+# Buffered access times before the semantic cache writes them out
+ACCESS_BATCH = 64
+
+
+class VectorIndex:
+    """
+    Brute-force cosine similarity search over at most `capacity` vectors.
+    
+    Vectors are L2-normalized and kept in a float32 memmap
+    (`vectors.f32`), so the index survives restarts without loading it
+    into the Python heap. Each slot's payload and last access time live in
+    an append-only JSON lines log (`entries.jsonl`), replayed on open and
+    compacted once it grows to twice the number of live entries, so LRU
+    order survives restarts. Access times from `get` are only buffered
+    in memory and reach the log in one batch on the next write, on
+    `write_access` or on `flush`. `meta.json` records the
+    dimension, capacity and a caller-defined tag (e.g. the embedding
+    model); an index whose metadata does not match is discarded.
+    
+    When full, adding a vector evicts the least recently used entry.
+    All methods are thread-safe.
+    """
+    
+    def __init__(self, directory: Path, dim: int, capacity: int, tag: str = ""):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.capacity = capacity
+        self.tag = tag
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        
+        meta_path = self.directory / "meta.json"
+        vectors_path = self.directory / "vectors.f32"
+        meta = {"version": INDEX_VERSION, "dim": dim, "capacity": capacity, "tag": tag}
+        reuse = False
+        if meta_path.exists() and vectors_path.exists():
+            try:
+                reuse = json.loads(meta_path.read_text()) == meta
+            except (OSError, json.JSONDecodeError):
+                reuse = False
+            if not reuse:
+                logger.info(f"Discarding vector index in {self.directory}: settings or embedding model changed")
+        if not reuse:
+            for name in ("vectors.f32", "entries.jsonl"):
+                (self.directory / name).unlink(missing_ok=True)
+            meta_path.write_text(json.dumps(meta))
+        
+        self.vectors = np.memmap(
+            vectors_path,
+            dtype=np.float32,
+            mode="r+" if reuse else "w+",
+            shape=(capacity, dim)
+        )
+        self.entries: list[Optional[dict]] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self._log_lines = 0
+        self._pending_access: set[int] = set()
+        if reuse:
+            self._replay_log()
+        self._log = open(self.directory / "entries.jsonl", "a", encoding="utf-8")
+    
+    def _replay_log(self) -> None:
+        """Rebuild slot payloads and access times from the entry log; the last record per slot wins."""
+        path = self.directory / "entries.jsonl"
+        if not path.exists():
+            return
+        with open(path, encoding="utf-8") as log:
+            for line in log:
+                self._log_lines += 1
+                try:
+                    record = json.loads(line)
+                    slot = record["slot"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                if not 0 <= slot < self.capacity:
+                    continue
+                if "entry" not in record:
+                    # Access record: only the slot's last use time changed
+                    if self.valid[slot]:
+                        self.last_used[slot] = record.get("used", 0)
+                    continue
+                entry = record["entry"]
+                self.entries[slot] = entry
+                self.valid[slot] = entry is not None
+                self.last_used[slot] = record.get("used", entry.get("created", 0)) if entry else 0
+    
+    def _append_log(self, slot: int, entry: Optional[dict]) -> None:
+        self._write_records([{"slot": slot, "entry": entry, "used": self.last_used[slot]}])
+    
+    def _write_records(self, records: list[dict]) -> None:
+        # Pending access times go first so replay keeps their order relative to the new records
+        pending = [{"slot": slot, "used": self.last_used[slot]} for slot in sorted(self._pending_access)]
+        self._pending_access.clear()
+        records = pending + records
+        if not records:
+            return
+        self._log.write("".join(json.dumps(record) + "\n" for record in records))
+        self._log.flush()
+        self._log_lines += len(records)
+        if self._log_lines > 2 * max(len(self), 64):
+            self._compact_log()
+    
+    def _compact_log(self) -> None:
+        """Rewrite the log with one record per live slot."""
+        path = self.directory / "entries.jsonl"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as log:
+            for slot in np.flatnonzero(self.valid):
+                record = {"slot": int(slot), "entry": self.entries[slot], "used": self.last_used[slot]}
+                log.write(json.dumps(record) + "\n")
+        self._log.close()
+        os.replace(tmp, path)
+        self._log = open(path, "a", encoding="utf-8")
+        self._log_lines = int(self.valid.sum())
+        self._pending_access.clear()
+    
+    def __len__(self) -> int:
+        return int(self.valid.sum())
+    
+    @property
+    def pending_access(self) -> int:
+        """Number of slots whose last access time has not reached the log yet."""
+        return len(self._pending_access)
+    
+    def search(self, vector: np.ndarray) -> Optional[tuple[int, float]]:
+        """
+        Most similar live entry.
+        
+        Args:
+            vector: Query vector of length `dim`
+        
+        Returns:
+            (slot, cosine similarity) or None if the index is empty
+        """
+        query = _normalize(vector)
+        with self._lock:
+            if not self.valid.any():
+                return None
+            # Multiply the whole memmap in place: indexing out the live rows
+            # first would copy every vector on each lookup
+            scores = np.where(self.valid, self.vectors @ query, -np.inf)
+            best = int(np.argmax(scores))
+            return best, float(scores[best])
+    
+    def get(self, slot: int) -> Optional[dict]:
+        """
+        Payload stored in a slot, marking it as recently used.
+        
+        Does no I/O: the access time is buffered until the next log write.
+        """
+        with self._lock:
+            if not self.valid[slot]:
+                return None
+            self.last_used[slot] = time.time()
+            self._pending_access.add(slot)
+            return self.entries[slot]
+    
+    def write_access(self) -> None:
+        """Append buffered access times to the entry log."""
+        with self._lock:
+            self._write_records([])
+    
+    def add(self, vector: np.ndarray, entry: dict) -> Optional[dict]:
+        """
+        Store a vector with its payload, evicting the least recently used entry when full.
+        
+        Args:
+            vector: Vector of length `dim`
+            entry: JSON-serializable payload
+        
+        Returns:
+            The evicted payload, if any
+        """
+        with self._lock:
+            free = np.flatnonzero(~self.valid)
+            evicted = None
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self.last_used))
+                evicted = self.entries[slot]
+            self.vectors[slot] = _normalize(vector)
+            self.entries[slot] = entry
+            self.valid[slot] = True
+            self.last_used[slot] = time.time()
+            self._append_log(slot, entry)
+            return evicted
+    
+    def remove_where(self, predicate) -> int:
+        """
+        Drop every entry whose payload matches `predicate`.
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            removed = 0
+            for slot in np.flatnonzero(self.valid):
+                if predicate(self.entries[slot]):
+                    self.entries[slot] = None
+                    self.valid[slot] = False
+                    self._append_log(int(slot), None)
+                    removed += 1
+            return removed
+    
+    def flush(self) -> None:
+        """Write the vectors and buffered access times to disk and close the entry log."""
+        with self._lock:
+            self._write_records([])
+            self.vectors.flush()
+            self._log.close()
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
@@ -0,0 +1,16 @@
+"""
+Shared fixtures: an in-memory Redis in place of the real server.
+"""
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from app.core.redis_client import RedisClient
+
+
+@pytest.fixture
+def redis_client():
+    """Point RedisClient at a fresh in-memory Redis for one test."""
+    client = FakeRedis(server=FakeServer(), decode_responses=True)
+    RedisClient._instance = client
+    yield client
+    RedisClient._instance = None
@@ -0,0 +1,204 @@
+"""
+Tests for admission control in front of Ollama.
+"""
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes_chat
+from app.core.config import settings
+from app.services.admission_service import (
+    AdmissionController, AdmissionRejected,
+    PRIORITY_BACKGROUND, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE
+)
+
+
+async def settle():
+    """Let every ready task run until it blocks."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, max_wait=5)
+        await admission.acquire()
+        served = []
+        
+        async def request(name: str, priority: int):
+            await admission.acquire(priority)
+            served.append(name)
+        
+        tasks = []
+        for name, priority in [
+            ("background", PRIORITY_BACKGROUND),
+            ("default", PRIORITY_DEFAULT),
+            ("interactive-1", PRIORITY_INTERACTIVE),
+            ("interactive-2", PRIORITY_INTERACTIVE),
+        ]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await settle()
+        assert admission.queued == 4
+        
+        for _ in tasks:
+            admission.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        assert (admission.in_flight, admission.queued) == (1, 0)
+        return served
+    
+    assert asyncio.run(scenario()) == ["interactive-1", "interactive-2", "default", "background"]
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait=30)
+        await admission.acquire()
+        admission.release(held_for=3.2)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await settle()
+        
+        with pytest.raises(AdmissionRejected, match="queue is full") as rejected:
+            await admission.acquire()
+        # One request ahead of it at 3.2s per slot: (1 + 1) * 3.2s, rounded up
+        assert rejected.value.retry_after == 7
+        assert admission.queued == 1
+        
+        admission.release()
+        await waiter
+    
+    asyncio.run(scenario())
+
+
+def test_long_estimated_wait_is_rejected_up_front():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, max_wait=5)
+        await admission.acquire()
+        admission.release(held_for=12.0)
+        await admission.acquire()
+        
+        with pytest.raises(AdmissionRejected, match="Estimated wait") as rejected:
+            await admission.acquire()
+        assert rejected.value.retry_after == 12
+        assert admission.queued == 0
+    
+    asyncio.run(scenario())
+
+
+def test_wait_past_max_wait_is_rejected():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, max_wait=0.05)
+        await admission.acquire()
+        with pytest.raises(AdmissionRejected, match="No generation slot"):
+            await admission.acquire()
+        assert (admission.in_flight, admission.queued) == (1, 0)
+        
+        # The slot is still handed to the next caller on release
+        waiter = asyncio.create_task(admission.acquire())
+        await settle()
+        admission.release()
+        await waiter
+        assert admission.in_flight == 1
+    
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_passes_a_handed_over_slot_on():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, max_wait=5)
+        await admission.acquire()
+        first = asyncio.create_task(admission.acquire())
+        await settle()
+        second = asyncio.create_task(admission.acquire())
+        await settle()
+        
+        # Hand the slot to the first waiter, then cancel it before it resumes
+        admission.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        
+        await asyncio.wait_for(second, timeout=1)
+        assert (admission.in_flight, admission.queued) == (1, 0)
+        admission.release()
+        assert admission.in_flight == 0
+    
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, max_wait=5)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await settle()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission.queued == 0
+        
+        admission.release()
+        assert admission.in_flight == 0
+    
+    asyncio.run(scenario())
+
+
+def test_resize_grows_into_waiters_and_shrinks_on_release():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, max_wait=5)
+        await admission.acquire()
+        waiters = [asyncio.create_task(admission.acquire()) for _ in range(3)]
+        await settle()
+        assert admission.queued == 3
+        
+        admission.resize(3)
+        await settle()
+        assert (admission.in_flight, admission.queued) == (3, 1)
+        assert sum(waiter.done() for waiter in waiters) == 2
+        
+        # Shrinking does not revoke held slots; releases drain down to the new size
+        admission.resize(1)
+        admission.release()
+        await settle()
+        assert (admission.in_flight, admission.queued) == (2, 1)
+        admission.release()
+        await settle()
+        assert (admission.in_flight, admission.queued) == (1, 1)
+        admission.release()
+        await settle()
+        # Back under the limit, the last waiter gets the slot
+        assert (admission.in_flight, admission.queued) == (1, 0)
+        await asyncio.gather(*waiters)
+    
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def client(redis_client):
+    app = FastAPI()
+    app.include_router(routes_chat.router)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def busy(monkeypatch):
+    """An admission controller with its only slot taken and no room to queue."""
+    admission = AdmissionController(max_concurrent=1, max_queue=0, max_wait=30)
+    admission.in_flight = 1
+    admission._service_time = 3.2
+    monkeypatch.setattr(routes_chat.ollama_service, "admission", admission)
+    return admission
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "response-cache"])
+@pytest.mark.parametrize("path", ["/api/llm/chat", "/api/llm/chat/stream"])
+def test_busy_chat_gets_429_with_retry_after(client, busy, path, cached, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", cached)
+    response = client.post(path, json={"session_id": "busy", "message": "hello there"})
+    
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "4"
+    assert "busy" in response.json()["detail"]
+    assert busy.in_flight == 1
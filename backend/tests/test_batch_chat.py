@@ -0,0 +1,71 @@
+"""
+Tests for the /chat/batch endpoint.
+"""
+import asyncio
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes_chat
+from app.services.ollama_service import GenerationResult
+
+
+class WorkerAbort(BaseException):
+    """A non-Exception error that escapes the per-item handlers."""
+
+
+@pytest.fixture
+def client(redis_client):
+    app = FastAPI()
+    app.include_router(routes_chat.router)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    async def fake_generate(prompt: str, **kwargs) -> GenerationResult:
+        await asyncio.sleep(0.01)
+        if "cancel me" in prompt:
+            raise asyncio.CancelledError()
+        if "abort me" in prompt:
+            raise WorkerAbort()
+        return GenerationResult(text="ok", eval_count=1)
+    
+    monkeypatch.setattr(routes_chat.ollama_service, "generate", fake_generate)
+
+
+def post_batch(client: TestClient, messages: list[str], concurrency: int = 2) -> list[dict]:
+    items = [{"id": f"item-{index}", "message": message} for index, message in enumerate(messages)]
+    response = client.post("/api/llm/chat/batch", json={"items": items, "concurrency": concurrency})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_streams_one_line_per_item(client, generate):
+    lines = post_batch(client, ["hello one", "hello two", "hello three"])
+    
+    assert lines[-1]["done"] is True
+    assert lines[-1]["failed"] == 0
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2]
+    assert all(line["reply"] == "ok" for line in lines[:-1])
+
+
+def test_cancelled_item_reports_an_error(client, generate):
+    lines = post_batch(client, ["hello one", "cancel me", "hello three"])
+    
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert "error" in by_index[1]
+    assert by_index[0]["reply"] == by_index[2]["reply"] == "ok"
+    assert lines[-1] == {**lines[-1], "done": True, "items": 3, "failed": 1}
+
+
+def test_dead_worker_does_not_stall_the_batch(client, generate):
+    messages = ["abort me", "hello one", "abort me", "hello two", "hello three"]
+    lines = post_batch(client, messages, concurrency=1)
+    
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert sorted(by_index) == [0, 1, 2, 3, 4]
+    assert "error" in by_index[0] and "error" in by_index[2]
+    assert all(by_index[index]["reply"] == "ok" for index in (1, 3, 4))
+    assert lines[-1] == {**lines[-1], "done": True, "items": 5, "failed": 2}
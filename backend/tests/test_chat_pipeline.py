@@ -0,0 +1,115 @@
+"""
+Tests for the staged preparation of chat turns.
+"""
+import asyncio
+import time
+import pytest
+from app.core.config import settings
+from app.models.request_models import ChatRequest
+from app.services.chat_pipeline import ChatPipeline, StageTimeout
+from app.services.scrape_service import ScrapeService
+from app.services.search_service import SearchService
+from app.services.write_behind_service import WriteBehindQueue
+
+
+class SlowMemory:
+    """Memory with a fixed delay for the history read and for recall."""
+    
+    def __init__(self, history_delay: float, recall_delay: float):
+        self.history_delay = history_delay
+        self.recall_delay = recall_delay
+        self.history = [
+            {"role": "user", "content": f"question {i}"} if i % 2 == 0
+            else {"role": "assistant", "content": f"answer {i}"}
+            for i in range(settings.MAX_HISTORY_MESSAGES)
+        ]
+    
+    async def get_history_with_context(self, session_id):
+        await asyncio.sleep(self.history_delay)
+        return self.history, None, "An earlier summary."
+    
+    async def recall_turns(self, session_id, query, exclude_recent, limit):
+        await asyncio.sleep(self.recall_delay)
+        return [{"user": "What was the launch code?", "assistant": "It was 1234.", "score": 3.0}]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(settings, "LONG_TERM_MEMORY_ENABLED", True)
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_ENABLED", False)
+    monkeypatch.setattr(settings, "STAGE_TIMEOUT_HISTORY", 0.5)
+    monkeypatch.setattr(settings, "STAGE_TIMEOUT_RECALL", 0.5)
+    return ChatPipeline(SearchService(), ScrapeService())
+
+
+def prepare(pipeline: ChatPipeline, memory: SlowMemory):
+    request = ChatRequest(session_id="s1", message="Remind me of the launch code")
+    return asyncio.run(pipeline.prepare(request, memory))
+
+
+def test_recalled_turns_reach_the_prompt(pipeline):
+    turn = prepare(pipeline, SlowMemory(history_delay=0.0, recall_delay=0.0))
+    assert "It was 1234." in turn.prompt
+
+
+def test_slow_recall_does_not_fail_the_turn(pipeline):
+    # Together the read and the recall take longer than the history timeout
+    turn = prepare(pipeline, SlowMemory(history_delay=0.2, recall_delay=0.45))
+    assert "It was 1234." in turn.prompt
+    assert turn.stage_timings["history"] < 0.45
+
+
+def test_recall_timeout_drops_only_recalled_turns(pipeline, monkeypatch):
+    monkeypatch.setattr(settings, "STAGE_TIMEOUT_RECALL", 0.1)
+    turn = prepare(pipeline, SlowMemory(history_delay=0.0, recall_delay=1.0))
+    assert "It was 1234." not in turn.prompt
+    assert "question 2" in turn.prompt
+
+
+def test_slow_history_read_still_fails(pipeline):
+    with pytest.raises(StageTimeout):
+        prepare(pipeline, SlowMemory(history_delay=1.0, recall_delay=0.0))
+
+
+def test_slow_queued_write_delays_but_does_not_fail_the_turn(pipeline):
+    async def scenario():
+        queue = WriteBehindQueue(enabled=True, max_pending=100, retries=0)
+        pipeline.write_behind = queue
+        memory = SlowMemory(history_delay=0.0, recall_delay=0.0)
+        
+        async def slow_write():
+            # Longer than the history timeout
+            await asyncio.sleep(0.7)
+            memory.history = memory.history + [{"role": "user", "content": "the previous turn"}]
+        
+        await queue.persist("s1", slow_write)
+        request = ChatRequest(session_id="s1", message="Remind me of the launch code")
+        return await pipeline.prepare(request, memory)
+    
+    turn = asyncio.run(scenario())
+    assert "the previous turn" in turn.prompt
+    assert turn.stage_timings["write_wait"] >= 0.6
+
+
+class BlockingKnowledgeBase:
+    """A knowledge base whose lookup blocks its thread, like a cold read of a large index."""
+    
+    def retrieve(self, message):
+        time.sleep(0.5)
+        return "Knowledge base excerpts:\n\nToo late."
+
+
+def test_slow_knowledge_lookup_times_out_without_blocking(pipeline, monkeypatch):
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_ENABLED", True)
+    monkeypatch.setattr(settings, "STAGE_TIMEOUT_KNOWLEDGE", 0.1)
+    pipeline.knowledge_base = BlockingKnowledgeBase()
+    
+    async def scenario():
+        started = time.perf_counter()
+        request = ChatRequest(session_id="s1", message="Remind me of the launch code")
+        turn = await pipeline.prepare(request, SlowMemory(history_delay=0.0, recall_delay=0.0))
+        return turn, time.perf_counter() - started
+    
+    turn, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.4
+    assert "Too late." not in turn.prompt
@@ -0,0 +1,96 @@
+"""
+Tests for the /chat/stream Server-Sent Events endpoint.
+"""
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes_chat
+from app.core.config import settings
+
+
+@pytest.fixture
+def client(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(routes_chat.write_behind, "enabled", False)
+    app = FastAPI()
+    app.include_router(routes_chat.router)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def stream_from(monkeypatch, chunks, error: Exception | None = None):
+    """Make Ollama stream `chunks`, then raise `error` if given."""
+    async def fake_stream(prompt: str, **kwargs):
+        for chunk in chunks:
+            yield chunk
+        if error is not None:
+            raise error
+    
+    monkeypatch.setattr(routes_chat.ollama_service, "stream_ollama", fake_stream)
+
+
+def parse_events(body: str) -> list[tuple[str, dict]]:
+    """Split an SSE body into (event name, data) pairs; unnamed events are 'message'."""
+    events = []
+    for frame in body.split("\n\n"):
+        if not frame:
+            continue
+        name = "message"
+        data = None
+        for line in frame.split("\n"):
+            field, _, value = line.partition(": ")
+            if field == "event":
+                name = value
+            elif field == "data":
+                data = json.loads(value)
+            else:
+                raise AssertionError(f"Unexpected SSE line {line!r}")
+        events.append((name, data))
+    return events
+
+
+def test_tokens_are_framed_as_events_and_the_turn_is_saved(client, monkeypatch):
+    stream_from(monkeypatch, [
+        {"response": "Hello", "done": False},
+        {"response": " there", "done": False},
+        {"response": "", "done": True, "context": [1, 2, 3]},
+    ])
+    response = client.post("/api/llm/chat/stream", json={"session_id": "sse", "message": "hello there"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.text.endswith("\n\n")
+    assert parse_events(response.text) == [
+        ("message", {"token": "Hello"}),
+        ("message", {"token": " there"}),
+        # A session without history is reported as expired
+        ("done", {"reply": "Hello there", "session_expired": True}),
+    ]
+    
+    history = client.get("/api/llm/session/sse").json()
+    assert [message["content"] for message in history["history"]] == ["hello there", "Hello there"]
+
+
+def test_failure_before_the_first_token_is_a_503(client, monkeypatch):
+    stream_from(monkeypatch, [], error=RuntimeError("connection refused"))
+    response = client.post("/api/llm/chat/stream", json={"session_id": "sse", "message": "hello there"})
+    
+    assert response.status_code == 503
+    assert "connection refused" in response.json()["detail"]
+
+
+def test_failure_mid_stream_ends_with_an_error_event(client, monkeypatch):
+    stream_from(monkeypatch, [{"response": "Partial", "done": False}], error=RuntimeError("host went away"))
+    response = client.post("/api/llm/chat/stream", json={"session_id": "sse", "message": "hello there"})
+    
+    # Headers were already sent, so the failure arrives in the stream
+    assert response.status_code == 200
+    assert parse_events(response.text) == [
+        ("message", {"token": "Partial"}),
+        ("error", {"detail": "AI service unavailable: host went away"}),
+    ]
+    # A broken reply is not stored
+    history = client.get("/api/llm/session/sse").json()
+    assert history["history"] == []
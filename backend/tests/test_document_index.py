@@ -0,0 +1,129 @@
+"""
+Tests for the on-disk document index.
+"""
+import json
+import pytest
+from app.utils.document_index import MAX_SEGMENTS, DocumentIndex
+
+
+class Crash(Exception):
+    """Stands in for the process dying mid-write."""
+
+
+def add(index: DocumentIndex, document_id: str, chunks: list[str], replaces=None) -> None:
+    index.add(document_id, {"title": document_id, "created": 0}, chunks, replaces)
+
+
+def search_ids(index: DocumentIndex, query: str) -> set[str]:
+    return {hit.document_id for hit in index.search(query, limit=10)}
+
+
+def test_changes_survive_reopen(tmp_path):
+    index = DocumentIndex(tmp_path)
+    add(index, "vpn", ["Install WireGuard to reach the office VPN."])
+    add(index, "mail", ["Mail is served over IMAP on port 993."])
+    assert index.remove("vpn")
+    index.close()
+    
+    reopened = DocumentIndex(tmp_path)
+    assert set(reopened.documents) == {"mail"}
+    assert search_ids(reopened, "imap port") == {"mail"}
+    assert search_ids(reopened, "wireguard vpn") == set()
+    reopened.close()
+
+
+@pytest.mark.parametrize("failing_step", ["_write_json", "_publish"])
+def test_crash_mid_write_keeps_previous_generation(tmp_path, monkeypatch, failing_step):
+    index = DocumentIndex(tmp_path)
+    add(index, "vpn", ["Install WireGuard to reach the office VPN."])
+    add(index, "mail", ["Mail is served over IMAP on port 993."])
+    
+    def crash(*args, **kwargs):
+        raise Crash()
+    
+    monkeypatch.setattr(DocumentIndex, failing_step, crash)
+    with pytest.raises(Crash):
+        add(index, "printer", ["The printer on floor two takes A3 paper."], replaces="vpn")
+    with pytest.raises(Crash):
+        index.remove("mail")
+    monkeypatch.undo()
+    index.close()
+    
+    reopened = DocumentIndex(tmp_path)
+    assert set(reopened.documents) == {"vpn", "mail"}
+    assert search_ids(reopened, "wireguard vpn") == {"vpn"}
+    assert search_ids(reopened, "imap port") == {"mail"}
+    assert search_ids(reopened, "printer paper") == set()
+    # The half-written generations are cleaned up, and writing resumes normally
+    assert len([path for path in tmp_path.iterdir() if path.name.startswith("gen-")]) == 1
+    add(reopened, "printer", ["The printer on floor two takes A3 paper."])
+    assert search_ids(reopened, "printer paper") == {"printer"}
+    reopened.close()
+
+
+def segment_dirs(directory) -> list[str]:
+    return sorted(path.name for path in directory.iterdir() if path.name.startswith("seg-"))
+
+
+def test_ingestion_writes_only_the_new_postings(tmp_path):
+    index = DocumentIndex(tmp_path)
+    add(index, "vpn", ["Install WireGuard to reach the office VPN."])
+    first = segment_dirs(tmp_path)
+    postings = (tmp_path / first[0] / "postings.i32").read_bytes()
+    
+    add(index, "mail", ["Mail is served over IMAP on port 993."])
+    # The earlier segment is shared as is; the new one only holds the new document's terms
+    assert segment_dirs(tmp_path)[:1] == first
+    assert (tmp_path / first[0] / "postings.i32").read_bytes() == postings
+    newest = json.loads((tmp_path / segment_dirs(tmp_path)[-1] / "vocab.json").read_text())
+    assert "imap" in newest and "wireguard" not in newest
+    assert search_ids(index, "wireguard imap") == {"vpn", "mail"}
+    index.close()
+
+
+def test_segments_are_merged_on_removal_and_when_too_many(tmp_path):
+    index = DocumentIndex(tmp_path)
+    for number in range(MAX_SEGMENTS):
+        add(index, f"doc{number}", [f"Shared words and a unique token{number}."])
+    assert len(segment_dirs(tmp_path)) == MAX_SEGMENTS
+    
+    add(index, "extra", ["Shared words once more."])
+    assert len(segment_dirs(tmp_path)) == 1
+    assert len(search_ids(index, "shared words")) == MAX_SEGMENTS + 1
+    
+    add(index, "late", ["A late token arrives."])
+    assert len(segment_dirs(tmp_path)) == 2
+    assert index.remove("doc3")
+    assert len(segment_dirs(tmp_path)) == 1
+    assert search_ids(index, "token3") == set()
+    assert "doc4" in search_ids(index, "shared words")
+    index.close()
+    
+    reopened = DocumentIndex(tmp_path)
+    assert search_ids(reopened, "late token") == {"late"}
+    reopened.close()
+
+
+def test_opens_version_2_index(tmp_path):
+    # Version 2 kept one set of postings inside each generation directory
+    index = DocumentIndex(tmp_path)
+    add(index, "vpn", ["Install WireGuard to reach the office VPN."])
+    index.close()
+    generation_dir = tmp_path / (tmp_path / "CURRENT").read_text()
+    segment_dir = tmp_path / segment_dirs(tmp_path)[0]
+    for name in ["postings.i32", "vocab.json"]:
+        (segment_dir / name).rename(generation_dir / name)
+    segment_dir.rmdir()
+    meta = json.loads((generation_dir / "meta.json").read_text())
+    del meta["segments"]
+    (generation_dir / "meta.json").write_text(json.dumps({**meta, "version": 2}))
+    
+    reopened = DocumentIndex(tmp_path)
+    assert search_ids(reopened, "wireguard") == {"vpn"}
+    add(reopened, "mail", ["Mail is served over IMAP on port 993."])
+    assert search_ids(reopened, "wireguard imap") == {"vpn", "mail"}
+    reopened.close()
+    
+    upgraded = DocumentIndex(tmp_path)
+    assert search_ids(upgraded, "wireguard imap") == {"vpn", "mail"}
+    upgraded.close()
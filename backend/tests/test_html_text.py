@@ -0,0 +1,58 @@
+"""
+Tests for streaming visible-text extraction.
+"""
+from pathlib import Path
+import pytest
+from app.services.scrape_service import ScrapeService
+from app.utils.html_text import IncrementalTextExtractor, extract_visible_text, sniff_encoding
+
+CORPUS_DIR = Path(__file__).resolve().parents[2] / "scripts" / "bench_corpus"
+
+
+@pytest.fixture(scope="module")
+def scraper():
+    service = ScrapeService()
+    service.max_chars = 10 ** 9
+    return service
+
+
+def feed_in_chunks(content: bytes, size: int, encoding=None) -> str:
+    extractor = IncrementalTextExtractor(encoding=encoding)
+    for start in range(0, len(content), size):
+        extractor.feed(content[start:start + size])
+    return extractor.close()
+
+
+@pytest.mark.parametrize("page", sorted(CORPUS_DIR.glob("*.html")), ids=lambda path: path.name)
+def test_matches_beautifulsoup_on_corpus(scraper, page):
+    content = page.read_bytes()
+    assert extract_visible_text(content).split() == scraper._parse(content).split()
+
+
+def test_entities_do_not_split_words():
+    html = (
+        "<p>I don&#39;t think it&rsquo;s the caf&eacute; &ndash; AT&amp;T&nbsp;Inc. "
+        "<b>bold</b>&amp;co<!-- note -->after</p>"
+    ).encode()
+    text = feed_in_chunks(html, 5, encoding="utf-8")
+    assert text == "I don't think it’s the café – AT&T Inc. bold &co after"
+
+
+def test_meta_charset_is_used_without_an_encoding():
+    html = (
+        '<html><head><meta charset="windows-1252"></head>'
+        "<body><p>Grüße aus Köln – it’s 8 €</p></body></html>"
+    ).encode("windows-1252")
+    assert feed_in_chunks(html, 7) == "Grüße aus Köln – it’s 8 €"
+
+
+def test_undeclared_encoding_defaults_to_utf8():
+    html = "<html><body><p>café ’ naïve</p></body></html>".encode()
+    assert feed_in_chunks(html, 3) == "café ’ naïve"
+
+
+def test_sniff_encoding():
+    assert sniff_encoding(b'<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">') == "iso8859-1"
+    assert sniff_encoding(b'<meta charset="bogus-charset">') == "utf-8"
+    assert sniff_encoding(b"\xef\xbb\xbf<html>") == "utf-8"
+    assert sniff_encoding(b"<html><body>no declaration</body></html>") == "utf-8"
@@ -0,0 +1,52 @@
+"""
+Tests for the knowledge base index and retrieval.
+"""
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.knowledge_service import KnowledgeBase
+from app.utils.prompt_builder import KNOWLEDGE_HEADING
+
+POLICY = (
+    "Refunds are issued within 14 days of purchase when the product is returned unused. "
+    "Refund requests must include the order number and go to billing@example.com. "
+    "Shipping is free for orders over 50 euros. International shipping takes 5 to 10 business days, "
+    "and customs fees are paid by the customer."
+)
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_CHUNK_CHARS", 200)
+    knowledge = KnowledgeBase()
+    knowledge.open()
+    yield knowledge
+    knowledge.close()
+
+
+def test_small_corpus_retrieves_matching_passages(knowledge_base):
+    document = asyncio.run(knowledge_base.add_document("Store policy", POLICY, "policy.md"))
+    assert document["chunks"] == 2
+    
+    refund = knowledge_base.retrieve("How long do I have to get a refund?")
+    assert refund is not None and refund.startswith(KNOWLEDGE_HEADING)
+    assert "14 days" in refund
+    
+    customs = knowledge_base.retrieve("Who pays customs fees on international shipping?")
+    assert customs is not None and "customs fees" in customs
+    assert "14 days" not in customs
+
+
+def test_unrelated_message_retrieves_nothing(knowledge_base):
+    asyncio.run(knowledge_base.add_document("Store policy", POLICY, "policy.md"))
+    
+    assert knowledge_base.retrieve("What's the weather in Paris?") is None
+
+
+def test_scores_are_relative_to_the_query(knowledge_base):
+    asyncio.run(knowledge_base.add_document("Store policy", POLICY, "policy.md"))
+    
+    passages = knowledge_base.search("is shipping free")
+    assert passages
+    assert all(0 < score <= 1 for _, _, score in passages)
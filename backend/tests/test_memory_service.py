@@ -0,0 +1,104 @@
+"""
+Tests for session history storage and long-term recall.
+"""
+import asyncio
+import json
+import pytest
+from app.core.config import settings
+from app.services.memory_service import POSTINGS_BLOCK, MemoryService
+
+
+@pytest.fixture
+def memory(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "LONG_TERM_MEMORY_ENABLED", True)
+    monkeypatch.setattr(settings, "LONG_TERM_MEMORY_MIN_SCORE", 0.0)
+    return MemoryService(redis_client)
+
+
+def test_archiving_rewrites_only_the_last_posting_block(memory, redis_client):
+    async def scenario():
+        for turn in range(1, 81):
+            await memory.append_turn("s", f"tell me about topic{turn}", f"Here is topic{turn}.")
+        return await redis_client.hgetall("postings:s")
+    
+    postings = asyncio.run(scenario())
+    assert postings["tell#n"] == "80"
+    blocks = [postings[f"tell#{block}"].split() for block in range(3)]
+    assert [len(block) for block in blocks] == [POSTINGS_BLOCK, POSTINGS_BLOCK, 80 - 2 * POSTINGS_BLOCK]
+    assert [entry.split(":")[0] for entry in blocks[0] + blocks[1] + blocks[2]] == [str(turn) for turn in range(1, 81)]
+
+
+def test_recall_reads_postings_across_blocks(memory):
+    async def scenario():
+        stored = []
+        for turn in range(1, 71):
+            stored.append(await memory.append_turn("s", f"tell me about topic{turn}", "ok"))
+        return stored, await memory.recall_turns("s", "what about topic5 and topic40", exclude_recent=10, limit=2)
+    
+    stored, recalled = asyncio.run(scenario())
+    assert all(isinstance(length, int) for length in stored)
+    assert {turn["user"] for turn in recalled} == {"tell me about topic5", "tell me about topic40"}
+
+
+def test_recall_reads_postings_written_before_blocks(memory, redis_client):
+    async def scenario():
+        # A turn archived by the old format: its postings in the bare term field
+        await redis_client.hset("archive:s", mapping={
+            "turns": 1,
+            "terms": 2,
+            "turn:1": '{"user": "my locker code is 4471", "assistant": "noted"}'
+        })
+        await redis_client.hset("postings:s", mapping={"locker": "1:1:2 ", "code": "1:1:2 "})
+        for turn in range(2, 6):
+            await memory.append_turn("s", f"another locker question {turn}", "ok")
+        return await memory.recall_turns("s", "what was my locker code", exclude_recent=0, limit=5)
+    
+    recalled = asyncio.run(scenario())
+    assert recalled[-1]["user"] == "my locker code is 4471"
+    assert len(recalled) == 5
+
+
+def legacy_messages(count: int) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+        for i in range(count)
+    ]
+
+
+def test_startup_migrates_legacy_blobs_keeping_order_and_ttl(memory, redis_client):
+    async def scenario():
+        await redis_client.set("session:old", json.dumps(legacy_messages(4)), ex=600)
+        await redis_client.set("session:long", json.dumps(legacy_messages(memory.max_messages + 6)))
+        await redis_client.set("session:broken", "{not json")
+        await redis_client.rpush("session:new", json.dumps({"role": "user", "content": "hi"}))
+        migrated = await memory.migrate_legacy_sessions()
+        return (
+            migrated,
+            await memory.get_history("old"),
+            await redis_client.ttl("session:old"),
+            await memory.get_history("long"),
+            await redis_client.exists("session:broken"),
+            await memory.get_history("new")
+        )
+    
+    migrated, old, ttl, long, broken, new = asyncio.run(scenario())
+    assert migrated == 2
+    assert old == legacy_messages(4)
+    assert 0 < ttl <= 600
+    # Only the newest messages survive, as with list storage
+    assert long == legacy_messages(memory.max_messages + 6)[-memory.max_messages:]
+    assert broken == 0
+    assert new == [{"role": "user", "content": "hi"}]
+
+
+def test_legacy_blob_is_migrated_on_first_access(memory, redis_client):
+    async def scenario():
+        await redis_client.set("session:lazy", json.dumps(legacy_messages(2)))
+        history = await memory.get_history("lazy")
+        await memory.append_turn("lazy", "and now?", "Now it is a list.")
+        return history, await redis_client.type("session:lazy"), await memory.get_history("lazy")
+    
+    history, key_type, after = asyncio.run(scenario())
+    assert history == legacy_messages(2)
+    assert key_type == "list"
+    assert [message["content"] for message in after] == ["message 0", "message 1", "and now?", "Now it is a list."]
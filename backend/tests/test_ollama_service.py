@@ -0,0 +1,197 @@
+"""
+Tests for spreading generations over several Ollama hosts, against stub servers.
+"""
+import asyncio
+import socket
+import sys
+from pathlib import Path
+import pytest
+from app.core.config import settings
+from app.services.admission_service import AdmissionRejected
+from app.services.ollama_service import OllamaService
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+from stub_ollama import StubServer, create_app  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def stubs():
+    servers = [StubServer(create_app(delay=0.0, tokens=3), port=free_port()).start() for _ in range(2)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def hosts(stubs, monkeypatch):
+    """The two stub hosts, healthy and with fresh counters."""
+    for server in stubs:
+        server.server.config.app.state.generations = 0
+        server.server.config.app.state.fail_status = None
+        server.server.config.app.state.reply = None
+    monkeypatch.setattr(settings, "OLLAMA_BASE_URLS", [server.url for server in stubs])
+    monkeypatch.setattr(settings, "OLLAMA_MAX_CONCURRENT", 2)
+    monkeypatch.setattr(settings, "OLLAMA_EJECT_AFTER_FAILURES", 2)
+    monkeypatch.setattr(settings, "OLLAMA_SESSION_AFFINITY", True)
+    return {server.url: server.server.config.app.state for server in stubs}
+
+
+def session_for(service: OllamaService, url: str) -> str:
+    """A session id whose rendezvous-hashed host is `url`."""
+    return next(
+        f"session-{i}" for i in range(1000)
+        if service.select_backend(f"session-{i}").url == url
+    )
+
+
+def test_session_sticks_to_one_host(hosts):
+    async def scenario():
+        service = OllamaService()
+        try:
+            for _ in range(5):
+                await service.generate("hello there", session_id="sticky")
+            sticky = service.select_backend("sticky").url
+            assert {url: state.generations for url, state in hosts.items()} == {
+                url: 5 if url == sticky else 0 for url in hosts
+            }
+            
+            for i in range(20):
+                await service.generate("hello there", session_id=f"other-{i}")
+            # Other sessions hash to both hosts
+            assert all(state.generations > 5 * (url == sticky) for url, state in hosts.items())
+        finally:
+            await service.close()
+    
+    asyncio.run(scenario())
+
+
+def test_failing_host_is_ejected_and_shrinks_capacity(hosts, monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_QUEUE_SIZE", 0)
+    bad, good = list(hosts)
+    hosts[bad].fail_status = 500
+    
+    async def scenario():
+        service = OllamaService()
+        try:
+            assert service.admission.max_concurrent == 4
+            session = session_for(service, bad)
+            with pytest.raises(Exception, match="status 500"):
+                await service.generate("hi", session_id=session)
+            with pytest.raises(Exception, match="status 500"):
+                async for _ in service.stream_ollama("hi", session_id=session):
+                    pass
+            
+            ejected = next(backend for backend in service.backends if backend.url == bad)
+            assert not ejected.healthy
+            assert service.admission.max_concurrent == 2
+            
+            # The session now falls over to the healthy host
+            result = await service.generate("hi", session_id=session)
+            assert result.text.startswith("Stub reply")
+            assert hosts[good].generations == 1
+            
+            # With one host's worth of slots held, the next request is turned away
+            for _ in range(2):
+                await service.admission.acquire()
+            with pytest.raises(AdmissionRejected):
+                await service.admission.acquire()
+        finally:
+            await service.close()
+    
+    asyncio.run(scenario())
+
+
+def test_recovered_host_is_readmitted_and_frees_waiters(hosts):
+    bad, _ = list(hosts)
+    hosts[bad].fail_status = 500
+    
+    async def scenario():
+        service = OllamaService()
+        try:
+            backend = next(backend for backend in service.backends if backend.url == bad)
+            session = session_for(service, bad)
+            for _ in range(2):
+                with pytest.raises(Exception, match="status 500"):
+                    await service.generate("hi", session_id=session)
+            assert not backend.healthy
+            assert service.admission.max_concurrent == 2
+            
+            # Still down: the probe keeps it out
+            await service._check_backend(backend)
+            assert not backend.healthy
+            
+            for _ in range(2):
+                await service.admission.acquire()
+            waiter = asyncio.create_task(service.admission.acquire())
+            await asyncio.sleep(0)
+            assert service.admission.queued == 1
+            
+            hosts[bad].fail_status = None
+            await service._check_backend(backend)
+            assert backend.healthy
+            assert service.admission.max_concurrent == 4
+            # The slot the recovered host brought back goes to the waiting request
+            await asyncio.wait_for(waiter, timeout=1)
+            assert service.admission.in_flight == 3
+            
+            calls_while_down = hosts[bad].generations
+            await service.generate("hi", session_id=session)
+            assert hosts[bad].generations == calls_while_down + 1
+        finally:
+            await service.close()
+    
+    asyncio.run(scenario())
+
+
+def test_client_errors_do_not_eject_the_host(hosts):
+    bad, _ = list(hosts)
+    hosts[bad].fail_status = 404
+    
+    async def scenario():
+        service = OllamaService()
+        try:
+            backend = next(backend for backend in service.backends if backend.url == bad)
+            session = session_for(service, bad)
+            for _ in range(3):
+                with pytest.raises(Exception, match="status 404"):
+                    await service.generate("hi", session_id=session)
+                with pytest.raises(Exception, match="status 404"):
+                    async for _ in service.stream_ollama("hi", session_id=session):
+                        pass
+            assert backend.healthy
+            assert backend.failures == 0
+            assert service.admission.max_concurrent == 4
+        finally:
+            await service.close()
+    
+    asyncio.run(scenario())
+
+
+def test_empty_reply_counts_as_success(hosts):
+    bad, _ = list(hosts)
+    
+    async def scenario():
+        service = OllamaService()
+        try:
+            backend = next(backend for backend in service.backends if backend.url == bad)
+            session = session_for(service, bad)
+            hosts[bad].fail_status = 500
+            with pytest.raises(Exception, match="status 500"):
+                await service.generate("hi", session_id=session)
+            assert backend.failures == 1
+            
+            hosts[bad].fail_status = None
+            hosts[bad].reply = ""
+            result = await service.generate("hi", session_id=session)
+            assert result.text.startswith("I apologize")
+            assert backend.failures == 0
+        finally:
+            await service.close()
+    
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+"""
+Tests for trimming prompts to the model's token budget.
+"""
+import pytest
+from app.core.config import settings
+from app.utils.prompt_builder import build_budgeted_prompt, prompt_token_budget
+from app.utils.tokens import estimate_tokens
+
+
+def conversation(turns: int) -> list[dict]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i} " + "about the weather " * 20})
+        history.append({"role": "assistant", "content": f"answer {i} " + "it will rain tomorrow " * 20})
+    return history
+
+
+RESULTS = [f"{rank}. Result {rank}\n" + "Forecast details and sources. " * 30 for rank in range(1, 9)]
+
+
+def test_budget_is_the_window_minus_the_reply(monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_MODEL", "llama3.1")
+    monkeypatch.setattr(settings, "OLLAMA_NUM_CTX", 4096)
+    monkeypatch.setattr(settings, "OLLAMA_NUM_CTX_BY_MODEL", {"big": 32768})
+    monkeypatch.setattr(settings, "OLLAMA_RESPONSE_TOKENS", 512)
+    assert prompt_token_budget() == 3584
+    assert prompt_token_budget("big") == 32256
+
+
+def test_untrimmed_prompt_keeps_everything():
+    build = build_budgeted_prompt(conversation(10), "Will it rain?", RESULTS)
+    assert build.history_dropped == 0
+    assert build.context_dropped == 0
+    assert "question 0" in build.prompt and "8. Result 8" in build.prompt
+
+
+@pytest.mark.parametrize("budget", [400, 800, 1500, 3000])
+def test_trimmed_prompt_fits_the_budget(budget):
+    build = build_budgeted_prompt(conversation(20), "Will it rain?", RESULTS, token_budget=budget)
+    assert build.total_tokens <= budget
+    assert estimate_tokens(build.prompt) <= budget
+    # The current message and the last exchange always survive
+    assert build.prompt.endswith("User: Will it rain?\n\nAssistant:")
+    assert "question 19" in build.prompt and "answer 19" in build.prompt
+
+
+def test_oldest_history_and_lowest_ranked_context_go_first():
+    build = build_budgeted_prompt(conversation(20), "Will it rain?", RESULTS, token_budget=1500)
+    assert build.history_dropped > 0
+    assert build.context_dropped > 0
+    assert "question 0 " not in build.prompt
+    assert "8. Result 8" not in build.prompt
+    assert "1. Result 1" in build.prompt
+    
+    kept = 40 - build.history_dropped
+    # Kept history is the newest messages, in order
+    assert f"question {20 - kept // 2} " in build.prompt
+
+
+def test_recalled_turns_are_dropped_before_the_summary_and_history():
+    recalled = [{"user": "What is the launch code?", "assistant": "1234 " * 40}]
+    history = conversation(3)
+    full = build_budgeted_prompt(history, "Will it rain?", summary="Talked about rain.", recalled=recalled)
+    
+    build = build_budgeted_prompt(
+        history, "Will it rain?", summary="Talked about rain.", recalled=recalled,
+        token_budget=full.total_tokens - 1
+    )
+    assert "launch code" not in build.prompt
+    assert "Talked about rain." in build.prompt
+    assert "question 0 " in build.prompt
+    assert build.history_dropped == 0
@@ -0,0 +1,120 @@
+"""
+Tests for the exact-match response cache.
+"""
+import asyncio
+import pytest
+from app.services.ollama_service import GenerationResult
+from app.services.response_cache_service import ResponseCache
+
+
+class SlowOllama:
+    """Stands in for OllamaService: counts generations and answers after a delay."""
+    
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.cancel_next = False
+    
+    def request_key(self, prompt: str) -> str:
+        return prompt
+    
+    async def generate(self, prompt: str, priority: int = 0, session_id=None) -> GenerationResult:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return GenerationResult(text=f"reply to {prompt}", eval_count=3)
+    
+    async def stream_ollama(self, prompt: str, priority: int = 0, session_id=None):
+        self.calls += 1
+        if self.cancel_next:
+            # The shared generation is cancelled from inside, not by any caller
+            self.cancel_next = False
+            await asyncio.sleep(self.delay)
+            raise asyncio.CancelledError()
+        for word in ["reply", "to", prompt]:
+            await asyncio.sleep(self.delay / 3)
+            yield {"response": f"{word} ", "done": False}
+        yield {"response": "", "done": True, "context": [1, 2], "eval_count": 3}
+
+
+async def collect(stream) -> list[dict]:
+    return [chunk async for chunk in stream]
+
+
+def reply(chunks: list[dict]) -> str:
+    return "".join(chunk["response"] for chunk in chunks).strip()
+
+
+def test_cancelled_leader_does_not_fail_waiting_prompts(redis_client):
+    async def scenario():
+        ollama = SlowOllama()
+        cache = ResponseCache(ollama)
+        leader = asyncio.create_task(cache.generate("prompt"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.generate("prompt"))
+        joined = asyncio.create_task(collect(cache.stream("prompt")))
+        await asyncio.sleep(0.01)
+        
+        # The leader's client disconnects mid-generation
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return ollama.calls, await follower, await joined
+    
+    calls, follower, joined = asyncio.run(scenario())
+    assert calls == 1
+    assert follower.text == "reply to prompt"
+    assert reply(joined) == "reply to prompt"
+
+
+def test_identical_streams_share_one_generation(redis_client):
+    async def scenario():
+        ollama = SlowOllama()
+        cache = ResponseCache(ollama)
+        leader = asyncio.create_task(collect(cache.stream("prompt")))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(collect(cache.stream("prompt"))) for _ in range(3)]
+        generated = asyncio.create_task(cache.generate("prompt"))
+        leader_chunks = await leader
+        follower_chunks = await asyncio.gather(*followers)
+        
+        # Once finished, the reply comes from the cache
+        again = await collect(cache.stream("prompt"))
+        return ollama.calls, leader_chunks, follower_chunks, await generated, again
+    
+    calls, leader_chunks, follower_chunks, generated, again = asyncio.run(scenario())
+    assert calls == 1
+    # The first stream gets the tokens one by one, the rest the whole reply
+    assert len(leader_chunks) == 4 and leader_chunks[-1]["context"] == [1, 2]
+    assert all(reply(chunks) == "reply to prompt" and len(chunks) == 2 for chunks in follower_chunks)
+    assert generated.text == "reply to prompt"
+    assert reply(again) == "reply to prompt" and again[-1]["context"] == [1, 2]
+
+
+def test_closed_leader_stream_stops_the_generation(redis_client):
+    async def scenario():
+        ollama = SlowOllama(delay=0.3)
+        cache = ResponseCache(ollama)
+        stream = cache.stream("prompt")
+        await anext(stream)
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return cache._flights.in_flight("prompt")
+    
+    assert asyncio.run(scenario()) is False
+
+
+def test_follower_generates_when_shared_stream_is_cancelled(redis_client):
+    async def scenario():
+        ollama = SlowOllama()
+        ollama.cancel_next = True
+        cache = ResponseCache(ollama)
+        leader = asyncio.create_task(collect(cache.stream("prompt")))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(collect(cache.stream("prompt")))
+        # Neither caller was cancelled, so both retry rather than fail
+        leader_chunks, follower_chunks = await leader, await follower
+        return ollama.calls, leader_chunks, follower_chunks
+    
+    calls, leader, follower = asyncio.run(scenario())
+    assert calls == 2
+    assert reply(leader) == reply(follower) == "reply to prompt"
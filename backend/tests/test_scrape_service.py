@@ -0,0 +1,154 @@
+"""
+Tests for fetching, parsing and caching scraped pages.
+"""
+import asyncio
+import threading
+import httpx
+import pytest
+from app.core.config import settings
+from app.services import scrape_service
+from app.services.scrape_service import ScrapeService
+
+PAGE = (
+    b"<html><head><script>var hidden = 1;</script></head>"
+    b"<body><p>" + b"Visible words here. " * 5000 + b"</p></body></html>"
+)
+
+
+def serve(handler) -> ScrapeService:
+    """A scraper whose HTTP client is answered by `handler`."""
+    service = ScrapeService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+def html(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, content=PAGE, headers={"Content-Type": "text/html; charset=utf-8"})
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(settings, "SCRAPE_CACHE_ENABLED", False)
+
+
+def test_bs4_mode_does_not_run_the_incremental_parser(monkeypatch):
+    monkeypatch.setattr(settings, "SCRAPE_EXTRACTOR", "bs4")
+    
+    class Unused:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("incremental parser used in bs4 mode")
+    
+    monkeypatch.setattr(scrape_service, "IncrementalTextExtractor", Unused)
+    text = asyncio.run(serve(html).scrape_website("https://example.com/page"))
+    assert text.startswith("Visible words here.")
+    assert "hidden" not in text
+
+
+def test_lxml_mode_parses_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(settings, "SCRAPE_EXTRACTOR", "lxml")
+    threads = set()
+    
+    class Recording(scrape_service.IncrementalTextExtractor):
+        def feed(self, chunk):
+            threads.add(threading.get_ident())
+            super().feed(chunk)
+    
+    monkeypatch.setattr(scrape_service, "IncrementalTextExtractor", Recording)
+    
+    async def scenario():
+        loop_thread = threading.get_ident()
+        text = await serve(html).scrape_website("https://example.com/page")
+        return loop_thread, text
+    
+    loop_thread, text = asyncio.run(scenario())
+    assert text.startswith("Visible words here.")
+    assert threads and loop_thread not in threads
+
+
+class Origin:
+    """A page with an ETag that answers conditional requests, or fails with `status`."""
+    
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+        self.status = 200
+    
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.status != 200:
+            return httpx.Response(self.status)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=PAGE, headers={"Content-Type": "text/html", "ETag": '"v1"'})
+
+
+@pytest.fixture
+def cached(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "SCRAPE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "SCRAPE_EXTRACTOR", "bs4")
+    origin = Origin()
+    service = serve(origin)
+    parses = []
+    parse = service._parse
+    monkeypatch.setattr(service, "_parse", lambda content: parses.append(content) or parse(content))
+    return service, origin, parses
+
+
+def test_not_modified_reuses_the_cached_text_without_parsing(cached, monkeypatch):
+    service, origin, parses = cached
+    # Every entry is stale at once, so each call revalidates
+    monkeypatch.setattr(settings, "SCRAPE_CACHE_TTL", 0)
+    
+    async def scenario():
+        first = await service.scrape_website("https://example.com/page")
+        second = await service.scrape_website("https://example.com/page")
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    assert second == first
+    assert len(origin.requests) == 2
+    assert origin.requests[1].headers["If-None-Match"] == '"v1"'
+    assert len(parses) == 1
+
+
+def test_fresh_entry_is_served_without_a_request(cached):
+    service, origin, parses = cached
+    
+    async def scenario():
+        await service.scrape_website("https://example.com/page")
+        return await service.scrape_website("https://example.com/page?")
+    
+    assert asyncio.run(scenario()).startswith("Visible words here.")
+    assert len(origin.requests) == 1
+
+
+def test_failures_are_cached_for_the_negative_ttl(cached, monkeypatch):
+    service, origin, _ = cached
+    origin.status = 503
+    
+    async def scenario():
+        first = await service.scrape_website("https://example.com/down")
+        second = await service.scrape_website("https://example.com/down")
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    assert first == second == "[Scraping Error: HTTP 503 error for https://example.com/down]"
+    assert len(origin.requests) == 1
+    
+    # Without a negative TTL every failure goes back to the origin
+    monkeypatch.setattr(settings, "SCRAPE_NEGATIVE_CACHE_TTL", 0)
+    asyncio.run(service.scrape_website("https://example.com/other"))
+    asyncio.run(service.scrape_website("https://example.com/other"))
+    assert len(origin.requests) == 3
+
+
+def test_failed_revalidation_keeps_the_stale_text(cached, monkeypatch):
+    service, origin, _ = cached
+    monkeypatch.setattr(settings, "SCRAPE_CACHE_TTL", 0)
+    
+    async def scenario():
+        good = await service.scrape_website("https://example.com/page")
+        origin.status = 500
+        return good, await service.scrape_website("https://example.com/page")
+    
+    good, stale = asyncio.run(scenario())
+    assert stale == good
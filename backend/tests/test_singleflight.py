@@ -0,0 +1,103 @@
+"""
+Tests for SingleFlight call coalescing.
+"""
+import asyncio
+import pytest
+from app.utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+        
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+        
+        results = await asyncio.gather(*(flights.do("key", fn) for _ in range(5)))
+        return calls, results, flights.in_flight("key")
+    
+    calls, results, in_flight = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert not in_flight
+
+
+def test_cancelled_leader_does_not_fail_follower():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        
+        async def fn():
+            await release.wait()
+            return "result"
+        
+        leader = asyncio.create_task(flights.do("key", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("key", fn))
+        await asyncio.sleep(0)
+        
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+    
+    assert asyncio.run(scenario()) == "result"
+
+
+def test_leader_timeout_does_not_fail_follower():
+    async def scenario():
+        flights = SingleFlight()
+        
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "result"
+        
+        leader = asyncio.create_task(asyncio.wait_for(flights.do("key", fn), timeout=0.01))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("key", fn))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+    
+    leader, follower = asyncio.run(scenario())
+    assert isinstance(leader, asyncio.TimeoutError)
+    assert follower == "result"
+
+
+def test_call_is_cancelled_when_last_caller_leaves():
+    async def scenario():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+        
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        caller = asyncio.create_task(flights.do("key", fn))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return flights.in_flight("key")
+    
+    assert asyncio.run(scenario()) is False
+
+
+def test_exception_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+        
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        return await asyncio.gather(flights.do("key", fn), flights.do("key", fn), return_exceptions=True)
+    
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,104 @@
+"""
+Tests for when background summaries are allowed to start.
+"""
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.admission_service import AdmissionController
+from app.services.summary_service import SummaryService
+
+
+class IdleOllama:
+    """Stands in for OllamaService: only its admission controller is used."""
+    
+    def __init__(self, max_concurrent: int):
+        self.admission = AdmissionController(max_concurrent=max_concurrent, max_queue=8, max_wait=5)
+
+
+@pytest.fixture(autouse=True)
+def summaries_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "SUMMARY_TRIGGER_MESSAGES", 10)
+    monkeypatch.setattr(settings, "SUMMARY_MAX_CONCURRENT", 2)
+    monkeypatch.setattr(settings, "SUMMARY_RESERVED_SLOTS", 2)
+
+
+def started_summaries(max_concurrent: int, in_flight: int, sessions: int) -> int:
+    async def scenario():
+        ollama = IdleOllama(max_concurrent)
+        service = SummaryService(ollama)
+        
+        async def hold_slot(memory, session_id):
+            # Like a real summary, occupy a generation slot until cancelled
+            ollama.admission.in_flight += 1
+            try:
+                await asyncio.sleep(10)
+            finally:
+                ollama.admission.in_flight -= 1
+        
+        service._summarize = hold_slot
+        ollama.admission.in_flight = in_flight
+        for index in range(sessions):
+            service.schedule(None, f"session-{index}", stored_messages=20)
+            await asyncio.sleep(0)
+        started = len(service._tasks)
+        await service.close()
+        return started
+    
+    return asyncio.run(scenario())
+
+
+def test_summaries_leave_headroom_for_user_requests():
+    # 4 slots, up to 2 summaries: each may only start while 2 slots stay free on top of it
+    assert started_summaries(max_concurrent=4, in_flight=0, sessions=3) == 2
+    assert started_summaries(max_concurrent=4, in_flight=1, sessions=3) == 1
+    assert started_summaries(max_concurrent=4, in_flight=2, sessions=3) == 0
+
+
+def test_summary_concurrency_does_not_shrink_reserved_slots(monkeypatch):
+    # Allowing more summaries at once must not make each one harder to start
+    monkeypatch.setattr(settings, "SUMMARY_MAX_CONCURRENT", 4)
+    assert started_summaries(max_concurrent=8, in_flight=0, sessions=5) == 4
+    assert started_summaries(max_concurrent=8, in_flight=4, sessions=5) == 2
+    
+    monkeypatch.setattr(settings, "SUMMARY_RESERVED_SLOTS", 6)
+    assert started_summaries(max_concurrent=8, in_flight=0, sessions=5) == 2
+
+
+def test_deferred_summary_starts_after_a_later_turn():
+    async def scenario():
+        ollama = IdleOllama(max_concurrent=4)
+        service = SummaryService(ollama)
+        summarized = []
+        
+        async def record(memory, session_id):
+            summarized.append(session_id)
+        
+        service._summarize = record
+        # Busy: one more generation would leave fewer than 2 slots free
+        ollama.admission.in_flight = 2
+        service.schedule(None, "session", stored_messages=20)
+        await asyncio.sleep(0)
+        assert summarized == []
+        
+        # The session's next turn, once load has dropped
+        ollama.admission.in_flight = 1
+        service.schedule(None, "session", stored_messages=22)
+        await asyncio.sleep(0)
+        return summarized
+    
+    assert asyncio.run(scenario()) == ["session"]
+
+
+def test_single_slot_summarizes_only_when_idle():
+    assert started_summaries(max_concurrent=1, in_flight=0, sessions=2) == 1
+    assert started_summaries(max_concurrent=1, in_flight=1, sessions=2) == 0
+
+
+def test_short_sessions_are_not_summarized():
+    async def scenario():
+        service = SummaryService(IdleOllama(4))
+        service.schedule(None, "session", stored_messages=5)
+        return len(service._tasks)
+    
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,65 @@
+"""
+Tests for the memory-mapped vector index.
+"""
+import numpy as np
+from app.utils.vector_index import VectorIndex
+
+
+def unit(dim: int, axis: int) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector
+
+
+def test_search_skips_removed_slots(tmp_path):
+    index = VectorIndex(tmp_path, dim=4, capacity=4)
+    assert index.search(unit(4, 0)) is None
+    index.add(unit(4, 0), {"name": "x", "created": 1})
+    index.add(unit(4, 1), {"name": "y", "created": 1})
+    index.remove_where(lambda entry: entry["name"] == "x")
+    
+    slot, score = index.search(unit(4, 0) + 0.1 * unit(4, 1))
+    assert index.entries[slot]["name"] == "y"
+    assert 0 < score < 1
+    index.flush()
+
+
+def test_lru_order_survives_reopen(tmp_path):
+    index = VectorIndex(tmp_path, dim=4, capacity=2)
+    index.add(unit(4, 0), {"name": "old", "created": 1})
+    index.add(unit(4, 1), {"name": "new", "created": 2})
+    # Using the older entry makes the newer one the least recently used
+    slot, _ = index.search(unit(4, 0))
+    assert index.get(slot)["name"] == "old"
+    index.flush()
+    
+    reopened = VectorIndex(tmp_path, dim=4, capacity=2)
+    evicted = reopened.add(unit(4, 2), {"name": "third", "created": 3})
+    assert evicted["name"] == "new"
+    assert sorted(entry["name"] for entry in reopened.entries if entry) == ["old", "third"]
+    reopened.flush()
+
+
+def test_get_buffers_access_times_until_flush(tmp_path):
+    index = VectorIndex(tmp_path, dim=4, capacity=2)
+    index.add(unit(4, 0), {"name": "old", "created": 1})
+    index.add(unit(4, 1), {"name": "new", "created": 2})
+    log = tmp_path / "entries.jsonl"
+    size = log.stat().st_size
+    
+    for _ in range(10):
+        index.get(0)
+    # Hits write nothing until the buffer is written out
+    assert log.stat().st_size == size
+    assert index.pending_access == 1
+    
+    index.write_access()
+    assert index.pending_access == 0
+    assert len(log.read_text().splitlines()) == 3
+    
+    index.get(0)
+    index.flush()
+    reopened = VectorIndex(tmp_path, dim=4, capacity=2)
+    evicted = reopened.add(unit(4, 2), {"name": "third", "created": 3})
+    assert evicted["name"] == "new"
+    reopened.flush()
@@ -0,0 +1,108 @@
+"""
+Tests for write-behind persistence of chat turns.
+"""
+import asyncio
+from app.services.write_behind_service import WriteBehindQueue
+
+
+def recorder(log: list, name: str, delay: float = 0.0, fail_times: int = 0):
+    """A write that appends `name` to `log` after `delay`, failing the first `fail_times` attempts."""
+    attempts = {"n": 0}
+    
+    async def write():
+        attempts["n"] += 1
+        await asyncio.sleep(delay)
+        if attempts["n"] <= fail_times:
+            raise ConnectionError("redis down")
+        log.append(name)
+    
+    return write
+
+
+def test_writes_for_one_session_run_in_order():
+    async def scenario():
+        queue = WriteBehindQueue(enabled=True, max_pending=100, retries=0)
+        log = []
+        await queue.persist("a", recorder(log, "a1", delay=0.05))
+        await queue.persist("a", recorder(log, "a2", delay=0.0))
+        await queue.persist("b", recorder(log, "b1", delay=0.0))
+        assert log == []
+        await queue.flush(timeout=1)
+        return log
+    
+    # The other session's write does not wait behind session a's
+    assert asyncio.run(scenario()) == ["b1", "a1", "a2"]
+
+
+def test_wait_for_sees_previous_writes():
+    async def scenario():
+        queue = WriteBehindQueue(enabled=True, max_pending=100, retries=0)
+        log = []
+        await queue.persist("a", recorder(log, "a1", delay=0.05))
+        await queue.persist("a", recorder(log, "a2", delay=0.05))
+        assert await queue.wait_for("a")
+        assert log == ["a1", "a2"]
+        assert queue.pending == 0
+        assert await queue.wait_for("unknown")
+    
+    asyncio.run(scenario())
+
+
+def test_wait_for_gives_up_after_timeout():
+    async def scenario():
+        queue = WriteBehindQueue(enabled=True, max_pending=100, retries=0)
+        log = []
+        await queue.persist("a", recorder(log, "a1", delay=0.3))
+        assert not await queue.wait_for("a", timeout=0.05)
+        assert log == []
+        # The write itself carries on
+        assert await queue.wait_for("a", timeout=1)
+        assert log == ["a1"]
+    
+    asyncio.run(scenario())
+
+
+def test_failed_write_is_retried():
+    async def scenario():
+        queue = WriteBehindQueue(enabled=True, max_pending=100, retries=2)
+        log = []
+        await queue.persist("a", recorder(log, "a1", fail_times=2))
+        await queue.wait_for("a")
+        return log
+    
+    assert asyncio.run(scenario()) == ["a1"]
+
+
+def test_inline_when_disabled_or_full():
+    async def scenario():
+        log = []
+        disabled = WriteBehindQueue(enabled=False, max_pending=100, retries=0)
+        await disabled.persist("a", recorder(log, "inline"))
+        assert log == ["inline"]
+        
+        full = WriteBehindQueue(enabled=True, max_pending=1, retries=0)
+        await full.persist("a", recorder(log, "queued", delay=0.05))
+        # The queue is full, so this write runs inline, after the queued one
+        await full.persist("a", recorder(log, "overflow"))
+        assert log == ["inline", "queued", "overflow"]
+    
+    asyncio.run(scenario())
+
+
+def test_flush_waits_for_outstanding_writes():
+    async def scenario():
+        queue = WriteBehindQueue(enabled=True, max_pending=100, retries=0)
+        log = []
+        for i in range(5):
+            await queue.persist(f"s{i}", recorder(log, f"s{i}", delay=0.02))
+        await queue.flush(timeout=1)
+        assert sorted(log) == [f"s{i}" for i in range(5)]
+        assert queue.pending == 0
+        
+        await queue.persist("slow", recorder(log, "slow", delay=1.0))
+        started = asyncio.get_running_loop().time()
+        await queue.flush(timeout=0.05)
+        assert asyncio.get_running_loop().time() - started < 0.5
+        assert "slow" not in log
+    
+    asyncio.run(scenario())
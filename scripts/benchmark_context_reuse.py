@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare prefill cost (prompt_eval_count) per turn with and without
+Ollama KV context reuse over a multi-turn conversation.
+
+Runs against a local stub server by default; pass --ollama-url to measure
+a real Ollama instance.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_ollama import StubServer, create_app  # noqa: E402
+
+QUESTIONS = [
+    "What is machine learning?",
+    "How is it different from deep learning?",
+    "Give me an example of supervised learning.",
+    "And an unsupervised one?",
+    "Which of those would you use for spam filtering?",
+    "What data would I need to collect?",
+    "How much of it, roughly?",
+    "Summarize our conversation in two sentences."
+]
+
+
+async def run_conversation(reuse: bool, turns: int) -> list[int]:
+    """Play the scripted conversation and return prompt_eval_count per turn."""
+    from app.services.ollama_service import OllamaService
+    from app.utils.prompt_builder import build_prompt, build_followup_prompt
+    
+    service = OllamaService()
+    history: list[dict] = []
+    context = None
+    counts = []
+    try:
+        for i in range(turns):
+            message = QUESTIONS[i % len(QUESTIONS)]
+            if reuse and context:
+                prompt = build_followup_prompt(message)
+            else:
+                prompt = build_prompt(history, message)
+            result = await service.generate(prompt, context=context if reuse else None)
+            counts.append(result.prompt_eval_count)
+            history.extend([
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": result.text}
+            ])
+            context = result.context
+    finally:
+        await service.close()
+    return counts
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark Ollama KV context reuse")
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--ollama-url", default=None, help="Real Ollama URL (default: start a stub)")
+    parser.add_argument("--port", type=int, default=11435)
+    args = parser.parse_args()
+    
+    logging.getLogger("ai-assistant").setLevel(logging.WARNING)
+    stub = None
+    if args.ollama_url:
+        os.environ["OLLAMA_BASE_URL"] = args.ollama_url
+    else:
+        stub = StubServer(create_app(delay=0.05), port=args.port).start()
+        os.environ["OLLAMA_BASE_URL"] = stub.url
+    
+    try:
+        before = asyncio.run(run_conversation(reuse=False, turns=args.turns))
+        after = asyncio.run(run_conversation(reuse=True, turns=args.turns))
+    finally:
+        if stub:
+            stub.stop()
+    
+    print(f"{'turn':>4}  {'history prompt':>14}  {'context reuse':>13}")
+    for i, (b, a) in enumerate(zip(before, after), 1):
+        print(f"{i:>4}  {b:>14}  {a:>13}")
+    print(f"{'sum':>4}  {sum(before):>14}  {sum(after):>13}")
+
+
+if __name__ == "__main__":
+    main()
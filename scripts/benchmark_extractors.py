@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Compare the BeautifulSoup and lxml scrape text extractors on saved HTML pages.
+
+Reports throughput (MB/s of HTML) for each engine and output parity as the
+similarity of the two extracted word sequences, both on the full page text
+and on the truncated text the scraper actually keeps.
+"""
+
+import difflib
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.services.scrape_service import ScrapeService  # noqa: E402
+from app.utils.html_text import extract_visible_text  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / "bench_corpus"
+
+
+def bs4_extract(service: ScrapeService, content: bytes) -> str:
+    return service._parse(content)
+
+
+def lxml_extract(service: ScrapeService, content: bytes) -> str:
+    return service._truncate(extract_visible_text(content, limit=service.max_chars + 1))
+
+
+def throughput(fn, service: ScrapeService, content: bytes, iterations: int) -> float:
+    """MB of HTML processed per second."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(service, content)
+    elapsed = time.perf_counter() - started
+    return len(content) * iterations / elapsed / 1e6
+
+
+def parity(a: str, b: str) -> float:
+    """Similarity ratio of the two outputs' word sequences."""
+    return difflib.SequenceMatcher(None, a.split(), b.split(), autojunk=False).ratio()
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark scrape text extractors")
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="Directory of .html files")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    
+    logging.getLogger("ai-assistant").setLevel(logging.WARNING)
+    truncated = ScrapeService()
+    full = ScrapeService()
+    full.max_chars = 10 ** 9
+    
+    files = sorted(args.corpus.glob("*.html"))
+    if not files:
+        print(f"No .html files found in {args.corpus}")
+        sys.exit(1)
+    
+    print(f"{'page':<24} {'KB':>6} {'bs4 MB/s':>9} {'lxml MB/s':>10} {'speedup':>8} {'parity':>7} {'parity@max':>10}")
+    totals = {"bytes": 0, "bs4": 0.0, "lxml": 0.0}
+    for path in files:
+        content = path.read_bytes()
+        bs4_rate = throughput(bs4_extract, full, content, args.iterations)
+        lxml_rate = throughput(lxml_extract, full, content, args.iterations)
+        full_parity = parity(bs4_extract(full, content), lxml_extract(full, content))
+        cut_parity = parity(bs4_extract(truncated, content), lxml_extract(truncated, content))
+        totals["bytes"] += len(content)
+        totals["bs4"] += len(content) / bs4_rate
+        totals["lxml"] += len(content) / lxml_rate
+        print(
+            f"{path.name:<24} {len(content) / 1024:>6.1f} {bs4_rate:>9.2f} {lxml_rate:>10.2f} "
+            f"{lxml_rate / bs4_rate:>7.1f}x {full_parity:>7.3f} {cut_parity:>10.3f}"
+        )
+    
+    bs4_total = totals["bytes"] / totals["bs4"]
+    lxml_total = totals["bytes"] / totals["lxml"]
+    print(f"{'overall':<24} {totals['bytes'] / 1024:>6.1f} {bs4_total:>9.2f} {lxml_total:>10.2f} {lxml_total / bs4_total:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent Ollama generations against a stub server.
+Compares the old blocking client with the pooled async OllamaService.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_ollama import StubServer, create_app  # noqa: E402
+
+
+async def probe_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Return the worst event loop stall observed while `stop` is unset."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run_blocking(base_url: str, concurrency: int) -> float:
+    """Old behaviour: a blocking requests.post inside an async handler."""
+    async def one():
+        requests.post(f"{base_url}/api/generate", json={"model": "stub", "prompt": "hi", "stream": False})
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def run_async(concurrency: int) -> float:
+    """New behaviour: the pooled async OllamaService."""
+    from app.services.ollama_service import OllamaService
+    
+    service = OllamaService()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(service.call_ollama("hi") for _ in range(concurrency)))
+        return time.perf_counter() - started
+    finally:
+        await service.close()
+
+
+async def measure(label: str, coro) -> None:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(stop))
+    elapsed = await coro
+    stop.set()
+    lag = await probe
+    print(f"{label:<10} wall={elapsed:7.2f}s  worst loop stall={lag * 1000:8.1f}ms")
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark concurrent Ollama calls")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.5, help="Stub seconds per generation")
+    parser.add_argument("--port", type=int, default=11435)
+    args = parser.parse_args()
+    
+    logging.getLogger("ai-assistant").setLevel(logging.WARNING)
+    stub = StubServer(create_app(delay=args.delay), port=args.port).start()
+    os.environ["OLLAMA_BASE_URL"] = stub.url
+    try:
+        print(f"{args.concurrency} concurrent generations, {args.delay}s each")
+        print(f"Serial lower bound: {args.concurrency * args.delay:.2f}s, parallel ideal: {args.delay:.2f}s\n")
+        asyncio.run(measure("blocking", run_blocking(stub.url, args.concurrency)))
+        asyncio.run(measure("async", run_async(args.concurrency)))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
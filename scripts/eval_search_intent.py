@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Compare search intent classifiers on labelled chat messages.
+
+Reports, for the old substring matcher and each registered classifier, the
+spurious-search rate (messages that did not need a search but got one),
+the missed-search rate, precision and classification time. Messages come
+from JSONL files of {"message": ..., "search": true|false} objects.
+
+The scored classifier's cues and weights were tuned on
+search_intent_samples.jsonl, so its numbers there are optimistic. The
+headline numbers come from search_intent_holdout.jsonl, which was written
+separately and must never be used to adjust the weights; add new tuning
+messages to the samples file only.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.utils.search_intent import (  # noqa: E402
+    CLASSIFIERS, SEARCH_KEYWORDS, IntentDecision, create_classifier
+)
+
+SAMPLES = Path(__file__).resolve().parent / "search_intent_samples.jsonl"
+HOLDOUT = Path(__file__).resolve().parent / "search_intent_holdout.jsonl"
+
+
+class SubstringClassifier:
+    """The original check: any keyword as a substring of the lowercased message."""
+    name = "substring"
+    
+    def classify(self, message: str) -> IntentDecision:
+        matches = [keyword for keyword in SEARCH_KEYWORDS if keyword in message.lower()]
+        return IntentDecision(search=bool(matches), score=1.0 if matches else 0.0, matches=matches)
+
+
+def load_samples(path: Path) -> list[tuple[str, bool]]:
+    samples = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            samples.append((entry["message"], bool(entry["search"])))
+    return samples
+
+
+def evaluate(classifier, samples: list[tuple[str, bool]], verbose: bool) -> dict:
+    """Classify every sample and count hits and misses."""
+    counts = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+    started = time.perf_counter()
+    decisions = [classifier.classify(message) for message, _ in samples]
+    elapsed = time.perf_counter() - started
+    
+    for (message, expected), decision in zip(samples, decisions):
+        key = ("t" if decision.search == expected else "f") + ("p" if decision.search else "n")
+        counts[key] += 1
+        if verbose and decision.search != expected:
+            kind = "spurious" if decision.search else "missed"
+            print(f"  [{classifier.name}] {kind}: {message!r} score={decision.score:.2f} {decision.matches}")
+    
+    negatives = counts["fp"] + counts["tn"]
+    positives = counts["tp"] + counts["fn"]
+    searched = counts["tp"] + counts["fp"]
+    return {
+        **counts,
+        "spurious_rate": counts["fp"] / negatives if negatives else 0.0,
+        "missed_rate": counts["fn"] / positives if positives else 0.0,
+        "precision": counts["tp"] / searched if searched else 0.0,
+        "accuracy": (counts["tp"] + counts["tn"]) / len(samples),
+        "us_per_message": elapsed / len(samples) * 1e6
+    }
+
+
+def print_report(title: str, samples: list[tuple[str, bool]], rows: dict, threshold: float) -> None:
+    positives = sum(1 for _, expected in samples if expected)
+    print(f"\n{title}: {len(samples)} messages ({positives} need a search), threshold {threshold}\n")
+    print(f"{'classifier':<11} {'spurious':>9} {'missed':>7} {'precision':>10} {'accuracy':>9} {'us/msg':>7}")
+    for name, row in rows.items():
+        print(
+            f"{name:<11} {row['spurious_rate'] * 100:>8.1f}% {row['missed_rate'] * 100:>6.1f}% "
+            f"{row['precision'] * 100:>9.1f}% {row['accuracy'] * 100:>8.1f}% {row['us_per_message']:>7.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline comparison of search intent classifiers")
+    parser.add_argument("--samples", type=Path, default=SAMPLES, help="JSONL file the weights were tuned on")
+    parser.add_argument("--holdout", type=Path, default=HOLDOUT, help="JSONL file never used for tuning")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Scored classifier threshold")
+    parser.add_argument("--verbose", action="store_true", help="List every misclassified message")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    
+    classifiers = [SubstringClassifier()] + [create_classifier(name, args.threshold) for name in CLASSIFIERS]
+    splits = {"holdout": load_samples(args.holdout), "tuning": load_samples(args.samples)}
+    reports = {}
+    for split, samples in splits.items():
+        if args.verbose:
+            print(f"\n{split}:")
+        reports[split] = {classifier.name: evaluate(classifier, samples, args.verbose) for classifier in classifiers}
+    
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    
+    print_report("Held out", splits["holdout"], reports["holdout"], args.threshold)
+    print_report("Tuning set (optimistic for scored)", splits["tuning"], reports["tuning"], args.threshold)
+
+
+if __name__ == "__main__":
+    main()
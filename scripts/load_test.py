@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the chat API.
+
+Starts the backend in-process against stub Ollama, search and web page
+servers, then drives it with concurrent simulated sessions that mix plain,
+search-triggering, scraping and streaming turns. Reports latency
+percentiles, throughput and error rates per request kind.
+
+Needs a reachable Redis (REDIS_HOST/REDIS_PORT, e.g. `docker compose up -d redis`);
+everything else runs locally, so results are reproducible on a CPU-only machine.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_ollama import StubServer, create_app  # noqa: E402
+from stub_web import create_pages_app, create_search_app  # noqa: E402
+
+PLAIN_MESSAGES = [
+    "Explain how a hash map handles collisions.",
+    "Give me three tips for writing clear commit messages.",
+    "What does the word idempotent mean for an HTTP API?",
+    "Summarize the difference between threads and processes."
+]
+SEARCH_MESSAGES = [
+    "What is the latest news about cache throughput?",
+    "Search for current load balancing techniques",
+    "What are today's trending deploy tools?",
+    "Find recent articles about vector databases"
+]
+
+
+@dataclass
+class Sample:
+    kind: str
+    status: int
+    latency: float
+    ttft: float | None = None
+
+
+@dataclass
+class Results:
+    samples: list[Sample] = field(default_factory=list)
+    started: float = 0.0
+    finished: float = 0.0
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def pick_turn(rng: random.Random, args, pages_url: str, page_names: list[str]) -> tuple[str, dict]:
+    """Choose the kind of the next turn and build its request body."""
+    roll = rng.random()
+    if roll < args.scrape_ratio:
+        url = f"{pages_url}/{rng.choice(page_names)}"
+        return "scrape", {"message": "What does this page say about throughput?", "use_scrape": True, "scrape_url": url}
+    if roll < args.scrape_ratio + args.search_ratio:
+        return "search", {"message": rng.choice(SEARCH_MESSAGES)}
+    return "plain", {"message": rng.choice(PLAIN_MESSAGES)}
+
+
+async def send_turn(client: httpx.AsyncClient, body: dict, stream: bool) -> tuple[int, float | None]:
+    """Send one turn; returns the status and, for streams, the time to first token."""
+    if not stream:
+        response = await client.post("/api/llm/chat", json=body)
+        return response.status_code, None
+    
+    started = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", "/api/llm/chat/stream", json=body) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, None
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if ttft is None and event is None and "token" in json.loads(line[len("data: "):]):
+                    ttft = time.perf_counter() - started
+                if event == "error":
+                    return 599, ttft
+                event = None
+    return 200, ttft
+
+
+async def run_session(client, args, rng, pages_url, page_names, results: Results) -> None:
+    """One simulated user sending `args.turns` turns in a single session."""
+    session_id = f"load-{uuid.uuid4()}"
+    for _ in range(args.turns):
+        kind, body = pick_turn(rng, args, pages_url, page_names)
+        stream = rng.random() < args.stream_ratio
+        label = f"{kind}/{'stream' if stream else 'chat'}"
+        started = time.perf_counter()
+        try:
+            status, ttft = await send_turn(client, {"session_id": session_id, **body}, stream)
+        except httpx.HTTPError:
+            status, ttft = 0, None
+        results.samples.append(Sample(label, status, time.perf_counter() - started, ttft))
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+async def drive(app_url: str, args, pages_url: str, page_names: list[str]) -> Results:
+    """Run all sessions concurrently against the app."""
+    results = Results()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        results.started = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(client, args, random.Random(rng.random()), pages_url, page_names, results)
+            for _ in range(args.sessions)
+        ))
+        results.finished = time.perf_counter()
+    return results
+
+
+def report(results: Results, as_json: bool) -> None:
+    """Print latency percentiles, throughput and errors per request kind."""
+    elapsed = results.finished - results.started
+    groups = defaultdict(list)
+    for sample in results.samples:
+        groups[sample.kind].append(sample)
+        groups["all"].append(sample)
+    
+    rows = {}
+    for kind in sorted(groups, key=lambda k: (k == "all", k)):
+        samples = groups[kind]
+        ok = [s.latency for s in samples if s.status == 200]
+        ttfts = [s.ttft for s in samples if s.ttft is not None]
+        errors = defaultdict(int)
+        for s in samples:
+            if s.status != 200:
+                errors[str(s.status)] += 1
+        rows[kind] = {
+            "requests": len(samples),
+            "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+            "error_rate": 1 - len(ok) / len(samples),
+            "errors": dict(errors),
+            "p50": percentile(ok, 50),
+            "p95": percentile(ok, 95),
+            "p99": percentile(ok, 99),
+            "mean": statistics.fmean(ok) if ok else float("nan"),
+            "ttft_p50": percentile(ttfts, 50) if ttfts else None,
+            "ttft_p95": percentile(ttfts, 95) if ttfts else None
+        }
+    
+    if as_json:
+        print(json.dumps({"elapsed": elapsed, "kinds": rows}, indent=2))
+        return
+    
+    print(f"\n{len(results.samples)} requests in {elapsed:.2f}s\n")
+    print(f"{'kind':<16} {'n':>5} {'rps':>7} {'err%':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'ttft p50':>9}  errors")
+    for kind, row in rows.items():
+        ttft = f"{row['ttft_p50']:.3f}" if row["ttft_p50"] is not None else "-"
+        errors = ", ".join(f"{code}x{count}" for code, count in row["errors"].items()) or "-"
+        print(
+            f"{kind:<16} {row['requests']:>5} {row['throughput_rps']:>7.2f} {row['error_rate'] * 100:>5.1f}% "
+            f"{row['p50']:>7.3f} {row['p95']:>7.3f} {row['p99']:>7.3f} {ttft:>9}  {errors}"
+        )
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Offline load test with stub Ollama, search and page servers")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a session's turns")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="Share of turns using /chat/stream")
+    parser.add_argument("--search-ratio", type=float, default=0.3, help="Share of turns that trigger a web search")
+    parser.add_argument("--scrape-ratio", type=float, default=0.1, help="Share of turns that scrape a page")
+    parser.add_argument("--ollama-delay", type=float, default=1.0, help="Stub decode seconds per generation")
+    parser.add_argument("--ollama-tokens", type=int, default=40, help="Stub tokens per generation (sets token rate)")
+    parser.add_argument("--ollama-ttft", type=float, default=0.2, help="Stub seconds before the first token")
+    parser.add_argument("--ollama-backends", type=int, default=1, help="Number of stub Ollama servers")
+    parser.add_argument("--search-delay", type=float, default=0.3, help="Stub search latency (seconds)")
+    parser.add_argument("--page-delay", type=float, default=0.1, help="Stub page latency (seconds)")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Client timeout per request (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=5101, help="First of the local ports used")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    
+    servers = []
+    ollama_urls = []
+    for i in range(args.ollama_backends):
+        app = create_app(delay=args.ollama_delay, tokens=args.ollama_tokens, first_token_delay=args.ollama_ttft)
+        server = StubServer(app, port=args.port + 3 + i).start()
+        servers.append(server)
+        ollama_urls.append(server.url)
+    pages_app = create_pages_app(delay=args.page_delay)
+    pages = StubServer(pages_app, port=args.port + 1).start()
+    search = StubServer(
+        create_search_app(pages.url, pages_app.state.page_names, delay=args.search_delay),
+        port=args.port + 2
+    ).start()
+    servers += [pages, search]
+    
+    # Settings are read at import time, so configure the backend before importing it
+    os.environ["OLLAMA_BASE_URLS"] = json.dumps(ollama_urls)
+    os.environ["SEARCH_SEARXNG_URL"] = search.url
+    logging.getLogger("ai-assistant").setLevel(logging.WARNING)
+    from app.main import app as backend_app
+    backend = StubServer(backend_app, port=args.port).start()
+    servers.append(backend)
+    
+    try:
+        print(
+            f"{args.sessions} sessions x {args.turns} turns against {len(ollama_urls)} stub Ollama backend(s): "
+            f"{args.ollama_tokens} tokens in {args.ollama_delay}s after {args.ollama_ttft}s, "
+            f"search {args.search_delay}s, pages {args.page_delay}s"
+        )
+        results = asyncio.run(drive(backend.url, args, pages.url, pages_app.state.page_names))
+        report(results, args.json)
+    finally:
+        for server in reversed(servers):
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Stub Ollama server for offline benchmarks.
+Mimics the /api/generate, /api/embed and /api/tags endpoints with a configurable delay.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(delay: float = 1.0, tokens: int = 20, first_token_delay: float = 0.0) -> FastAPI:
+    """
+    Create a stub Ollama app that answers every generation after `delay` seconds.
+    
+    Each generation waits `first_token_delay` seconds (standing in for
+    prompt prefill), then streaming requests emit `tokens` NDJSON chunks
+    spread evenly over `delay`. Prompt tokens are approximated by
+    whitespace-separated words, and the returned `context` grows like
+    Ollama's so KV reuse can be measured. Embeddings are hashed bags of
+    words, so texts sharing most of their words embed close together.
+    
+    `app.state.generations` counts generation requests, and setting
+    `app.state.fail_status` to an HTTP status makes /api/tags and
+    /api/generate fail with it, so tests can take a host down and back up.
+    Setting `app.state.reply` overrides the non-streaming reply text.
+    """
+    app = FastAPI(title="Stub Ollama")
+    app.state.generations = 0
+    app.state.fail_status = None
+    app.state.reply = None
+    
+    def failure() -> JSONResponse:
+        return JSONResponse({"error": "stub failure"}, status_code=app.state.fail_status)
+    
+    def final_fields(payload: dict, started: float) -> dict:
+        prompt_tokens = len(payload.get("prompt", "").split())
+        context = list(payload.get("context") or [])
+        context.extend(range(prompt_tokens + tokens))
+        elapsed = int((time.perf_counter() - started) * 1e9)
+        return {
+            "done": True,
+            "context": context,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(first_token_delay * 1e9),
+            "eval_count": tokens,
+            "eval_duration": max(elapsed - int(first_token_delay * 1e9), 0),
+            "total_duration": elapsed
+        }
+    
+    async def stream_chunks(payload: dict, started: float):
+        model = payload.get("model", "stub")
+        await asyncio.sleep(first_token_delay)
+        for i in range(tokens):
+            await asyncio.sleep(delay / tokens)
+            yield json.dumps({"model": model, "response": f"tok{i} ", "done": False}) + "\n"
+        yield json.dumps({"model": model, "response": "", **final_fields(payload, started)}) + "\n"
+    
+    def embed_text(text: str, dim: int = 64) -> list[float]:
+        vector = [0.0] * dim
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode()).digest()
+            vector[digest[0] % dim] += 1.0 if digest[1] % 2 else -1.0
+        return vector
+    
+    @app.get("/api/tags")
+    async def tags():
+        if app.state.fail_status:
+            return failure()
+        return {"models": [{"name": "stub"}]}
+    
+    @app.post("/api/generate")
+    async def generate(payload: dict):
+        app.state.generations += 1
+        if app.state.fail_status:
+            return failure()
+        started = time.perf_counter()
+        if payload.get("stream", True):
+            return StreamingResponse(
+                stream_chunks(payload, started),
+                media_type="application/x-ndjson"
+            )
+        await asyncio.sleep(first_token_delay + delay)
+        prompt = payload.get("prompt", "")
+        return {
+            "model": payload.get("model", "stub"),
+            "response": app.state.reply if app.state.reply is not None else (
+                f"Stub reply to a {len(prompt)} character prompt."
+            ),
+            **final_fields(payload, started)
+        }
+    
+    @app.post("/api/embed")
+    async def embed(payload: dict):
+        texts = payload.get("input", "")
+        if isinstance(texts, str):
+            texts = [texts]
+        return {
+            "model": payload.get("model", "stub"),
+            "embeddings": [embed_text(text) for text in texts]
+        }
+    
+    return app
+
+
+class StubServer:
+    """Runs a stub app with uvicorn in a background thread."""
+    
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 11435):
+        self.host = host
+        self.port = port
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    def start(self) -> "StubServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+    
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run a stub Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds per generation")
+    parser.add_argument("--tokens", type=int, default=20, help="Chunks per streamed generation")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="Seconds before the first token")
+    args = parser.parse_args()
+    
+    app = create_app(delay=args.delay, tokens=args.tokens, first_token_delay=args.first_token_delay)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Stub search and web page servers for offline load tests.
+The search stub speaks the SearXNG JSON API the backend uses when
+SEARCH_SEARXNG_URL is set; the page stub serves saved HTML pages.
+"""
+
+import asyncio
+import hashlib
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import HTMLResponse
+
+CORPUS_DIR = Path(__file__).resolve().parent / "bench_corpus"
+
+
+def create_pages_app(delay: float = 0.1, corpus_dir: Path = CORPUS_DIR) -> FastAPI:
+    """
+    Create an app serving every .html file in `corpus_dir` at /{name} after `delay` seconds.
+    
+    Pages carry an ETag so the scraper's conditional revalidation is exercised.
+    """
+    app = FastAPI(title="Stub Pages")
+    pages = {path.name: path.read_bytes() for path in sorted(corpus_dir.glob("*.html"))}
+    
+    @app.get("/{name}")
+    async def page(name: str):
+        if name not in pages:
+            raise HTTPException(status_code=404)
+        await asyncio.sleep(delay)
+        body = pages[name]
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        return HTMLResponse(body, headers={"ETag": etag})
+    
+    app.state.page_names = list(pages)
+    return app
+
+
+def create_search_app(pages_url: str, page_names: list[str], delay: float = 0.3, results: int = 5) -> FastAPI:
+    """
+    Create a SearXNG-style /search endpoint that answers after `delay` seconds.
+    
+    Every query returns `results` hits pointing at the stub page server,
+    rotated by a hash of the query so different queries open different pages.
+    """
+    app = FastAPI(title="Stub Search")
+    
+    @app.get("/search")
+    async def search(q: str, format: str = "json"):
+        await asyncio.sleep(delay)
+        start = int(hashlib.sha1(q.encode("utf-8")).hexdigest(), 16) % max(len(page_names), 1)
+        hits = []
+        for i in range(results):
+            name = page_names[(start + i) % len(page_names)] if page_names else "missing.html"
+            hits.append({
+                "title": f"{name} result {i + 1} for {q}",
+                "url": f"{pages_url}/{name}",
+                "content": f"Snippet {i + 1} about {q} from {name}."
+            })
+        return {"query": q, "results": hits}
+    
+    return app